@@ -1,31 +1,347 @@
+import argparse
 import logging
 import sys
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from functools import partial
+from pathlib import Path
+from typing import NamedTuple
 
+from pie.encoder import (
+    EMBEDDING_CACHE,
+    TOKEN_HASH_CACHE,
+    configure_embedding_cache,
+    configure_token_hash_cache,
+)
 from pie.github import load_github_project_issues
-from pie.project_processor import ProjectProcessor
+from pie.github_cache import (
+    ResponseCache,
+    install_response_cache,
+    uninstall_response_cache,
+)
+from pie.github_graphql import load_github_graphql_project_issues
+from pie.github_rate_limit import configure_request_scheduler
+from pie.metrics import METRICS
+from pie.project_processor import ProjectProcessor, create_encoding_executor
+from pie.storage import StorageBackend, open_parquet_storage
 
-from .config import load_configuration
+from .config import Configuration, ConfigurationGithubRepo, load_configuration
 
 
-def main() -> None:
-    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+class Arguments(NamedTuple):
+    config_path: str
+    full: bool
+    clear_cache: bool
+    # Log the time spent in each stage at exit.
+    profile: bool
+
+
+def parse_arguments() -> Arguments:
+    parser = argparse.ArgumentParser(
+        "pie",
+        description="Load project data from configured repositories",
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        type=str,
+        help="Path to TOML config file",
+        default="config.toml",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Fetch every issue, instead of only those updated since the "
+        "last run",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Clear the GitHub response cache and exit",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Log the time spent in each stage of loading at exit",
+    )
+
+    args = parser.parse_args()
+
+    return Arguments(
+        config_path=args.config,
+        full=args.full,
+        clear_cache=args.clear_cache,
+        profile=args.profile,
+    )
+
+
+def load_github_repo(
+    config: Configuration,
+    github_repo: ConfigurationGithubRepo,
+    encoding_executor: Executor | None,
+    *,
+    full: bool,
+) -> None:
+    """
+    Load issues for one repository, with its own ClickHouse connection.
+    """
+    start_time = time.monotonic()
+    logging.info("Loading %s/%s", github_repo.owner, github_repo.name)
+
+    match config.github_source:
+        case "rest":
+            load_project_issues = load_github_project_issues
+        case "rest_repository":
+            load_project_issues = partial(
+                load_github_project_issues,
+                repository_wide=True,
+            )
+        case "graphql":
+            load_project_issues = load_github_graphql_project_issues
+        case _:
+            raise ValueError(
+                f"Unknown github_source: {config.github_source!r}",
+            )
+
+    storage: StorageBackend | None = None
+
+    match config.storage.backend:
+        case "clickhouse":
+            pass
+        case "parquet":
+            storage = open_parquet_storage(
+                config.storage.path,
+                config.clickhouse.batch_size,
+            )
+        case _:
+            raise ValueError(
+                f"Unknown storage backend: {config.storage.backend!r}",
+            )
 
-    config = load_configuration("config.toml")
-    processor = ProjectProcessor(
+    with ProjectProcessor(
         clickhouse_host=config.clickhouse.host,
         clickhouse_port=config.clickhouse.port,
         clickhouse_username=config.clickhouse.username,
         clickhouse_password=config.clickhouse.password,
         clickhouse_database=config.clickhouse.database,
-    )
-
-    for github_repo in config.github_repos:
-        load_github_project_issues(
+        batch_size=config.clickhouse.batch_size,
+        flush_interval=config.clickhouse.flush_interval,
+        compression=config.clickhouse.compression,
+        encode_batch_size=config.encoding.batch_size,
+        encoding_workers=config.encoding.workers,
+        encoding_executor=encoding_executor,
+        compact_vectors=config.clickhouse.compact_vectors,
+        sparse_vectors=config.clickhouse.sparse_vectors,
+        minhash=config.clickhouse.minhash,
+        storage=storage,
+    ) as processor:
+        load_project_issues(
             processor,
             config.github_token,
             github_repo.owner,
             github_repo.name,
+            full=full,
+        )
+
+    logging.info(
+        "Loaded %s/%s in %.1fs: %d issues, %d comments, %d events added",
+        github_repo.owner,
+        github_repo.name,
+        time.monotonic() - start_time,
+        processor.added_issue_count,
+        processor.added_issue_comment_count,
+        processor.added_issue_event_count,
+    )
+
+
+def load_github_repos(
+    config: Configuration,
+    encoding_executor: Executor | None,
+    *,
+    full: bool = False,
+) -> list[ConfigurationGithubRepo]:
+    """
+    Load all configured repositories, up to ``config.concurrency`` at once.
+
+    Return the repositories which failed to load.
+    """
+    failed_repos: list[ConfigurationGithubRepo] = []
+
+    with ThreadPoolExecutor(
+        max_workers=max(config.concurrency, 1),
+        thread_name_prefix="pie-loader",
+    ) as executor:
+        futures = {
+            executor.submit(
+                load_github_repo,
+                config,
+                github_repo,
+                encoding_executor,
+                full=full,
+            ): github_repo
+            for github_repo in config.github_repos
+        }
+
+        for finished_count, future in enumerate(as_completed(futures), 1):
+            github_repo = futures[future]
+
+            try:
+                future.result()
+            except Exception:
+                logging.exception(
+                    "Failed to load %s/%s",
+                    github_repo.owner,
+                    github_repo.name,
+                )
+                failed_repos.append(github_repo)
+
+            logging.info(
+                "Finished %d/%d repositories",
+                finished_count,
+                len(futures),
+            )
+
+    return failed_repos
+
+
+def log_stage_summaries() -> None:
+    """
+    Log the time spent in each stage, and how many items it handled.
+    """
+    # Texts encoded in worker processes are only counted by the workers.
+    for summary in METRICS.stage_summaries():
+        logging.info(
+            "Stage %s: %d runs, %.3fs total, %.2fms mean, %.1f items/s",
+            summary.stage,
+            summary.run_count,
+            summary.seconds,
+            summary.mean_seconds * 1000,
+            summary.items_per_second,
+        )
+
+
+def main() -> None:
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO,
+        format="%(levelname)s:%(threadName)s:%(message)s",
+    )
+
+    args = parse_arguments()
+    config = load_configuration(args.config_path)
+    response_cache = (
+        ResponseCache(
+            config.github_cache.path,
+            max_size_bytes=config.github_cache.max_size_mb * 1024 * 1024,
+        )
+        if config.github_cache.path
+        else None
+    )
+
+    if args.clear_cache:
+        if response_cache is not None:
+            response_cache.clear()
+            logging.info("Cleared %s", config.github_cache.path)
+        else:
+            logging.warning("No GitHub response cache is configured")
+
+        return
+
+    # The connection class is installed without a cache to count and pace
+    # requests.
+    install_response_cache(response_cache)
+    configure_request_scheduler(
+        config.github_tokens,
+        config.github_request_burst,
+    )
+    metrics_server = (
+        METRICS.start_http_server(config.metrics.http_port)
+        if config.metrics.http_port
+        else None
+    )
+
+    vocabulary_path = config.encoding.vocabulary_path
+    configure_token_hash_cache(config.encoding.token_cache_size)
+    configure_embedding_cache(
+        config.encoding.embedding_cache_size,
+        config.encoding.embedding_cache_path,
+    )
+
+    if vocabulary_path and Path(vocabulary_path).exists():
+        token_count = TOKEN_HASH_CACHE.load_vocabulary(vocabulary_path)
+        logging.info("Preloaded %d token hashes", token_count)
+
+    # One pool of encoding processes is shared by every repository loader.
+    encoding_executor = (
+        create_encoding_executor(config.encoding.workers)
+        if config.encoding.workers > 0
+        else None
+    )
+
+    try:
+        failed_repos = load_github_repos(
+            config,
+            encoding_executor,
+            full=args.full,
+        )
+    finally:
+        if encoding_executor is not None:
+            encoding_executor.shutdown()
+
+        if response_cache is not None:
+            response_info = response_cache.info()
+            logging.info(
+                "GitHub response cache: %.1f%% hit ratio, %d hits, %d misses",
+                response_info.hit_ratio * 100,
+                response_info.hits,
+                response_info.misses,
+            )
+            response_cache.close()
+
+        uninstall_response_cache()
+
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+        if config.metrics.textfile_path:
+            METRICS.write_textfile(config.metrics.textfile_path)
+
+        # Stages are logged even when loading fails, when they matter most.
+        if args.profile:
+            log_stage_summaries()
+
+    cache_info = TOKEN_HASH_CACHE.info()
+    logging.info(
+        "Token hash cache: %d hits, %d misses, %d/%d tokens",
+        cache_info.hits,
+        cache_info.misses,
+        cache_info.size,
+        cache_info.max_size,
+    )
+
+    # Vectors encoded in worker processes are only counted by the workers.
+    embedding_info = EMBEDDING_CACHE.info()
+    logging.info(
+        "Embedding cache: %.1f%% hit ratio, %d hits, %d persistent hits, "
+        "%d misses, %d/%d vectors",
+        embedding_info.hit_ratio * 100,
+        embedding_info.hits,
+        embedding_info.persistent_hits,
+        embedding_info.misses,
+        embedding_info.size,
+        embedding_info.max_size,
+    )
+    EMBEDDING_CACHE.close()
+
+    if vocabulary_path:
+        TOKEN_HASH_CACHE.save_vocabulary(vocabulary_path)
+
+    if failed_repos:
+        logging.error(
+            "Failed to load: %s",
+            ", ".join(f"{repo.owner}/{repo.name}" for repo in failed_repos),
         )
+        sys.exit(1)
 
 
 if __name__ == "__main__":  # pragma: no cover
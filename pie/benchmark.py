@@ -0,0 +1,558 @@
+import argparse
+import datetime
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable, Generator, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, NamedTuple, TextIO, cast
+
+import numpy as np
+from clickhouse_connect.driver.client import Client
+
+from pie.clickhouse import ClickhouseStorage
+from pie.encoder import (
+    EMBEDDING_CACHE,
+    ENCODER_VERSION,
+    TOKEN_HASH_CACHE,
+    configure_embedding_cache,
+    encode_documents,
+    encode_texts,
+)
+from pie.issue import Issue, IssueComment, Project, SourceSystemType
+from pie.metrics import METRICS, StageSummary
+from pie.project_processor import ProjectProcessor
+from pie.similarity_matrix import IssueVectors, find_similar_vectors
+from pie.testing import FakeClickhouseClient
+
+PROJECT = Project(
+    source_system=SourceSystemType.GITHUB,
+    owner="dense-analysis",
+    name="benchmark",
+)
+CREATED_AT = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+# Corpora are built from this many made up words.
+VOCABULARY_SIZE = 20_000
+ISSUE_TEMPLATE = (
+    "**Describe the bug** A clear and concise description of what the bug "
+    "is. **To reproduce** Steps to reproduce the behaviour. **Expected "
+    "behaviour** A clear and concise description of what you expected to "
+    "happen."
+)
+# Short replies which make up a share of real comments.
+STOCK_COMMENTS = (
+    "+1",
+    "Same here.",
+    "Any update on this?",
+    "Thanks, this is fixed now.",
+    "I can reproduce this on the latest version.",
+)
+
+
+class Corpus(NamedTuple):
+    """
+    Synthetic issues and comments for one project.
+    """
+
+    issues: list[Issue]
+    issue_comments: list[IssueComment]
+
+
+class _TextGenerator:
+    """
+    Generate text from made up words with a Zipf distribution.
+    """
+
+    def __init__(self, rng: np.random.Generator) -> None:
+        self.rng = rng
+        letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+        lengths = rng.integers(2, 11, size=VOCABULARY_SIZE)
+        self.words = [
+            "".join(rng.choice(letters, size=length)) for length in lengths
+        ]
+
+    def words_of_length(self, word_count: int) -> list[str]:
+        indices = (self.rng.zipf(1.3, size=word_count) - 1) % VOCABULARY_SIZE
+
+        return [self.words[index] for index in indices]
+
+    def sentences(self, word_count: int) -> str:
+        words = self.words_of_length(word_count)
+        sentences: list[str] = []
+        start = 0
+
+        while start < len(words):
+            end = start + int(self.rng.integers(6, 21))
+            sentences.append(" ".join(words[start:end]).capitalize() + ".")
+            start = end
+
+        return " ".join(sentences)
+
+    def lognormal_lengths(
+        self,
+        count: int,
+        median: float,
+        sigma: float,
+        maximum: int,
+    ) -> list[int]:
+        lengths = self.rng.lognormal(np.log(median), sigma, size=count)
+
+        return np.clip(np.round(lengths), 1, maximum).astype(int).tolist()
+
+
+def generate_corpus(issue_count: int, seed: int = 0) -> Corpus:
+    """
+    Generate issues and comments with realistic length distributions.
+
+    Titles are usually 4 to 12 words, and descriptions and comments have
+    long-tailed lengths. Some descriptions start with an issue template,
+    and some comments are stock replies such as "+1". There are about 2
+    comments for each issue. The same seed gives the same corpus.
+    """
+    rng = np.random.default_rng(seed)
+    generator = _TextGenerator(rng)
+    title_lengths = generator.lognormal_lengths(issue_count, 7, 0.4, 30)
+    description_lengths = generator.lognormal_lengths(
+        issue_count,
+        60,
+        1.0,
+        2_000,
+    )
+    uses_template = rng.random(issue_count) < 0.3
+    comment_counts = rng.geometric(1 / 3, size=issue_count) - 1
+    issues: list[Issue] = []
+    issue_comments: list[IssueComment] = []
+
+    for issue_id in range(1, issue_count + 1):
+        index = issue_id - 1
+        description = generator.sentences(description_lengths[index])
+
+        if uses_template[index]:
+            description = f"{ISSUE_TEMPLATE} {description}"
+
+        issues.append(
+            Issue(
+                project=PROJECT,
+                id=issue_id,
+                parent_id=0,
+                assignee_username="",
+                title=" ".join(
+                    generator.words_of_length(title_lengths[index]),
+                ).capitalize(),
+                description=description,
+                labels=[],
+                created_at=CREATED_AT,
+            ),
+        )
+
+    comment_total = int(comment_counts.sum())
+    comment_lengths = generator.lognormal_lengths(
+        comment_total,
+        25,
+        1.0,
+        1_000,
+    )
+    is_stock_comment = rng.random(comment_total) < 0.15
+    comment_issue_ids = np.repeat(
+        np.arange(1, issue_count + 1),
+        comment_counts,
+    ).tolist()
+
+    for comment_id, issue_id in enumerate(comment_issue_ids, 1):
+        index = comment_id - 1
+        issue_comments.append(
+            IssueComment(
+                project=PROJECT,
+                issue_id=issue_id,
+                id=comment_id,
+                username="user",
+                body=(
+                    STOCK_COMMENTS[index % len(STOCK_COMMENTS)]
+                    if is_stock_comment[index]
+                    else generator.sentences(comment_lengths[index])
+                ),
+                created_at=CREATED_AT,
+            ),
+        )
+
+    return Corpus(issues, issue_comments)
+
+
+# Benchmarks with a result for each stage they run, named "store.<stage>".
+STAGED_BENCHMARKS = frozenset({"store"})
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    # The number of issues in the corpus.
+    corpus_size: int
+    # The number of items processed, such as texts encoded.
+    item_count: int
+    seconds: float
+    # The most memory allocated at once while running, in bytes, or None
+    # when memory was not measured.
+    peak_memory: int | None
+
+    @property
+    def items_per_second(self) -> float:
+        return self.item_count / self.seconds if self.seconds else 0.0
+
+
+@contextmanager
+def _reset_caches() -> Generator[None]:
+    # Vectors are not cached, so every run encodes every text.
+    embedding_cache_size = EMBEDDING_CACHE.max_size
+    embedding_cache_path = str(EMBEDDING_CACHE.path or "")
+    configure_embedding_cache(0)
+    TOKEN_HASH_CACHE.clear()
+
+    try:
+        yield
+    finally:
+        TOKEN_HASH_CACHE.clear()
+        configure_embedding_cache(embedding_cache_size, embedding_cache_path)
+
+
+def _measure(
+    function: Callable[[], int],
+    *,
+    repeat: int,
+    memory: bool,
+) -> tuple[int, float, int | None, list[StageSummary]]:
+    """
+    Run a function returning an item count ``repeat`` times, and return the
+    fastest time, with the stages timed in ``METRICS`` for that run.
+
+    With ``memory``, the function runs once more while allocations are
+    traced, as tracing slows it down.
+    """
+    item_count = 0
+    seconds = math.inf
+    stages: list[StageSummary] = []
+
+    for _ in range(repeat):
+        with _reset_caches():
+            METRICS.clear()
+            start_time = time.perf_counter()
+            item_count = function()
+            run_seconds = time.perf_counter() - start_time
+
+            if run_seconds < seconds:
+                seconds = run_seconds
+                stages = METRICS.stage_summaries()
+
+    peak_memory: int | None = None
+
+    if memory:
+        with _reset_caches():
+            tracemalloc.start()
+
+            try:
+                function()
+                peak_memory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    METRICS.clear()
+
+    return item_count, seconds, peak_memory, stages
+
+
+def _store_corpus(corpus: Corpus) -> int:
+    with ProjectProcessor(
+        "",
+        0,
+        "",
+        "",
+        "",
+        storage=ClickhouseStorage(
+            cast(Client, FakeClickhouseClient(record_rows=False)),
+        ),
+    ) as processor:
+        for issue in corpus.issues:
+            processor.store_issue(issue)
+
+        for issue_comment in corpus.issue_comments:
+            processor.store_issue_comment(issue_comment)
+
+    return len(corpus.issues) + len(corpus.issue_comments)
+
+
+def _issue_vectors(corpus: Corpus) -> IssueVectors:
+    return IssueVectors(
+        project_key=("GITHUB", PROJECT.owner, PROJECT.name),
+        ids=np.array([issue.id for issue in corpus.issues], dtype=np.uint64),
+        titles=[issue.title for issue in corpus.issues],
+        title_vectors=encode_texts([issue.title for issue in corpus.issues]),
+        description_vectors=encode_documents(
+            [issue.description for issue in corpus.issues],
+        ),
+    )
+
+
+def _find_similar(issue_vectors: IssueVectors) -> int:
+    for _ in find_similar_vectors(issue_vectors, 0.2, 0.2):
+        pass
+
+    return len(issue_vectors.ids)
+
+
+def run_benchmarks(
+    corpus_size: int,
+    *,
+    seed: int = 0,
+    similarity: bool = True,
+    repeat: int = 1,
+    memory: bool = True,
+) -> list[BenchmarkResult]:
+    """
+    Time encoding, storing and similarity search for one corpus size.
+
+    Storing goes through `ProjectProcessor` with a client which discards
+    rows, and is also broken down into the stages it spends time in, such
+    as encoding and inserts into each table. Similarity search compares
+    every pair of issues in memory with vectors encoded beforehand.
+    """
+    corpus = generate_corpus(corpus_size, seed)
+    titles = [issue.title for issue in corpus.issues]
+    descriptions = [issue.description for issue in corpus.issues]
+    bodies = [issue_comment.body for issue_comment in corpus.issue_comments]
+    benchmarks: list[tuple[str, Callable[[], int]]] = [
+        ("encode_titles", lambda: len(encode_texts(titles))),
+        ("encode_descriptions", lambda: len(encode_documents(descriptions))),
+        ("encode_comments", lambda: len(encode_documents(bodies))),
+        ("store", lambda: _store_corpus(corpus)),
+    ]
+
+    if similarity:
+        issue_vectors = _issue_vectors(corpus)
+        benchmarks.append(
+            ("similarity_matrix", lambda: _find_similar(issue_vectors)),
+        )
+
+    results: list[BenchmarkResult] = []
+
+    for name, function in benchmarks:
+        item_count, seconds, peak_memory, stages = _measure(
+            function,
+            repeat=repeat,
+            memory=memory,
+        )
+        results.append(
+            BenchmarkResult(
+                name=name,
+                corpus_size=corpus_size,
+                item_count=item_count,
+                seconds=seconds,
+                peak_memory=peak_memory,
+            ),
+        )
+
+        if name in STAGED_BENCHMARKS:
+            results.extend(
+                BenchmarkResult(
+                    name=f"{name}.{stage.stage}",
+                    corpus_size=corpus_size,
+                    item_count=stage.item_count,
+                    seconds=stage.seconds,
+                    peak_memory=None,
+                )
+                for stage in stages
+            )
+
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        process = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=False,
+            text=True,
+            cwd=Path(__file__).parent,
+        )
+    except OSError:
+        return None
+
+    return process.stdout.strip() if process.returncode == 0 else None
+
+
+def results_to_json(results: Sequence[BenchmarkResult]) -> dict[str, Any]:
+    """
+    Return results with details of the environment they were measured in.
+    """
+    return {
+        "commit": _git_commit(),
+        "encoder_version": ENCODER_VERSION,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": [
+            {**result._asdict(), "items_per_second": result.items_per_second}
+            for result in results
+        ],
+    }
+
+
+def compare_results(
+    baseline: dict[str, Any],
+    current: dict[str, Any],
+) -> list[str]:
+    """
+    Describe the change in time and memory for benchmarks in both results.
+    """
+    baseline_results = {
+        (result["name"], result["corpus_size"]): result
+        for result in baseline["results"]
+    }
+    lines: list[str] = []
+
+    for result in current["results"]:
+        key = (result["name"], result["corpus_size"])
+        baseline_result = baseline_results.get(key)
+
+        if baseline_result is None or not baseline_result["seconds"]:
+            continue
+
+        line = (
+            f"{result['name']} ({result['corpus_size']}): "
+            f"{result['seconds'] / baseline_result['seconds'] - 1:+.1%} time"
+        )
+
+        if result["peak_memory"] and baseline_result["peak_memory"]:
+            memory_change = (
+                result["peak_memory"] / baseline_result["peak_memory"] - 1
+            )
+            line += f", {memory_change:+.1%} peak memory"
+
+        lines.append(line)
+
+    return lines
+
+
+class Arguments(NamedTuple):
+    corpus_sizes: tuple[int, ...]
+    seed: int
+    # Similarity search is only timed for corpora up to this size.
+    similarity_limit: int
+    # Each benchmark is run this many times, keeping the fastest time.
+    repeat: int
+    memory: bool
+    # A file to write JSON results to, or None for standard output.
+    output_path: str | None
+    # Earlier JSON results to compare with, if any.
+    baseline_path: str | None
+
+
+def parse_arguments() -> Arguments:
+    parser = argparse.ArgumentParser(
+        "pie.benchmark",
+        description="Time encoding, storing and similarity search offline",
+    )
+    parser.add_argument(
+        "-n",
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+        help="Numbers of issues to generate corpora with",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed for generating corpora",
+    )
+    parser.add_argument(
+        "--similarity-limit",
+        type=int,
+        default=20_000,
+        help="Only time similarity search for corpora up to this size, as "
+        "it compares every pair of issues",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Run each benchmark this many times and keep the fastest time",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip measuring peak memory, which runs everything twice",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Write JSON results to this file instead of standard output",
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        help="Compare results with JSON results from an earlier run",
+    )
+
+    args = parser.parse_args()
+
+    return Arguments(
+        corpus_sizes=tuple(args.sizes),
+        seed=args.seed,
+        similarity_limit=args.similarity_limit,
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        output_path=args.output,
+        baseline_path=args.compare,
+    )
+
+
+def _write_json(data: dict[str, Any], file: TextIO) -> None:
+    json.dump(data, file, indent=2)
+    file.write("\n")
+
+
+def main() -> None:
+    args = parse_arguments()
+    results: list[BenchmarkResult] = []
+
+    for corpus_size in args.corpus_sizes:
+        for result in run_benchmarks(
+            corpus_size,
+            seed=args.seed,
+            similarity=corpus_size <= args.similarity_limit,
+            repeat=args.repeat,
+            memory=args.memory,
+        ):
+            print(
+                f"{result.name} ({result.corpus_size}): "
+                f"{result.seconds:.3f}s, "
+                f"{result.items_per_second:,.0f} items/s",
+                file=sys.stderr,
+            )
+            results.append(result)
+
+    data = results_to_json(results)
+
+    if args.output_path:
+        with Path(args.output_path).open("w", encoding="utf-8") as file:
+            _write_json(data, file)
+    else:
+        _write_json(data, sys.stdout)
+
+    if args.baseline_path:
+        with Path(args.baseline_path).open(encoding="utf-8") as file:
+            baseline = json.load(file)
+
+        for line in compare_results(baseline, data):
+            print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()  # pragma: no cover
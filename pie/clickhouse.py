@@ -1,9 +1,22 @@
-from typing import NamedTuple
+import datetime
+import itertools
+import time
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any, NamedTuple, Self, cast
 
 import clickhouse_connect
 from clickhouse_connect.driver.client import Client
 
-from .issue import Issue, IssueComment, IssueEvent, Project
+from .encoder import (
+    ENCODER_VERSION,
+    SIGNATURE_SIZE,
+    VECTOR_SIZE,
+    CompactVector,
+    SparseVector,
+)
+from .issue import Issue, IssueComment, IssueEvent, Project, SyncCheckpoint
+from .key_set import KeySet, ProjectKeys
+from .metrics import METRICS
 
 
 def get_client(
@@ -12,6 +25,8 @@ def get_client(
     username: str,
     password: str,
     database: str,
+    *,
+    compression: bool | str = True,
 ) -> Client:
     client = clickhouse_connect.get_client(
         host=host,
@@ -19,6 +34,7 @@ def get_client(
         username=username,
         password=password,
         database=database,
+        compress=compression,
     )
 
     if not client.ping():
@@ -27,191 +43,512 @@ def get_client(
     return client
 
 
-def insert_issue(
-    client: Client,
+ISSUE_COLUMNS = (
+    "source_system",
+    "project_owner",
+    "project_name",
+    "id",
+    "parent_id",
+    "assignee_username",
+    "title",
+    "title_vector",
+    "description",
+    "description_vector",
+    "labels",
+    "created_at",
+    "encoder_version",
+)
+
+# Compact vector columns, written after ISSUE_COLUMNS when enabled.
+ISSUE_COMPACT_COLUMNS = (
+    "title_vector_int8",
+    "title_signature",
+    "description_vector_int8",
+    "description_signature",
+)
+
+# Sparse vector columns, written after any compact columns when enabled.
+ISSUE_SPARSE_COLUMNS = (
+    "title_indices",
+    "title_values",
+    "description_indices",
+    "description_values",
+)
+
+
+def issue_row(
     issue: Issue,
-    title_vector: list[float],
-    description_vector: list[float],
-) -> None:
-    client.insert(
-        "issues",
-        data=[
-            (
-                int(issue.project.source_system),
-                issue.project.owner,
-                issue.project.name,
-                issue.id,
-                issue.parent_id,
-                issue.assignee_username,
-                issue.title,
-                title_vector,
-                issue.description,
-                description_vector,
-                issue.labels,
-                issue.created_at,
-            ),
-        ],
-        column_names=[
-            "source_system",
-            "project_owner",
-            "project_name",
-            "id",
-            "parent_id",
-            "assignee_username",
-            "title",
-            "title_vector",
-            "description",
-            "description_vector",
-            "labels",
-            "created_at",
-        ],
+    title_vector: Sequence[float],
+    description_vector: Sequence[float],
+) -> tuple[Any, ...]:
+    return (
+        int(issue.project.source_system),
+        issue.project.owner,
+        issue.project.name,
+        issue.id,
+        issue.parent_id,
+        issue.assignee_username,
+        issue.title,
+        title_vector,
+        issue.description,
+        description_vector,
+        issue.labels,
+        issue.created_at,
+        ENCODER_VERSION,
     )
 
 
-def issue_exists(
+ISSUE_COMMENT_COLUMNS = (
+    "source_system",
+    "project_owner",
+    "project_name",
+    "issue_id",
+    "id",
+    "username",
+    "body",
+    "body_vector",
+    "created_at",
+    "encoder_version",
+)
+
+# Compact vector columns, written after ISSUE_COMMENT_COLUMNS when enabled.
+ISSUE_COMMENT_COMPACT_COLUMNS = (
+    "body_vector_int8",
+    "body_signature",
+)
+
+# Sparse vector columns, written after any compact columns when enabled.
+ISSUE_COMMENT_SPARSE_COLUMNS = (
+    "body_indices",
+    "body_values",
+)
+
+
+def issue_comment_row(
+    issue_comment: IssueComment,
+    body_vector: Sequence[float],
+) -> tuple[Any, ...]:
+    return (
+        int(issue_comment.project.source_system),
+        issue_comment.project.owner,
+        issue_comment.project.name,
+        issue_comment.issue_id,
+        issue_comment.id,
+        issue_comment.username,
+        issue_comment.body,
+        body_vector,
+        issue_comment.created_at,
+        ENCODER_VERSION,
+    )
+
+
+ISSUE_EVENT_COLUMNS = (
+    "source_system",
+    "project_owner",
+    "project_name",
+    "id",
+    "related_object_id",
+    "parent_id",
+    "type",
+    "assignee_username",
+    "timestamp",
+)
+
+
+def issue_event_row(issue_event: IssueEvent) -> tuple[Any, ...]:
+    return (
+        int(issue_event.project.source_system),
+        issue_event.project.owner,
+        issue_event.project.name,
+        issue_event.id,
+        issue_event.related_object_id,
+        issue_event.parent_id,
+        int(issue_event.type),
+        issue_event.assignee_username,
+        issue_event.timestamp,
+    )
+
+
+def _load_key_set(
     client: Client,
+    query: str,
     project: Project,
-    issue_id: int,
-) -> bool:
+    width: int,
+) -> KeySet:
+    key_set = KeySet(width)
+
+    with client.query_column_block_stream(
+        query,
+        (project.source_system, project.owner, project.name),
+    ) as stream:
+        for block in cast(Iterable[Sequence[Sequence[int]]], stream):
+            key_set.extend_sorted(block)
+
+    return key_set
+
+
+def load_project_keys(client: Client, project: Project) -> ProjectKeys:
+    """
+    Load the keys of every issue, comment, and event stored for a project,
+    and the IDs of its closed issues.
+
+    Keys are streamed in sorted blocks, so the full result set is never held
+    in memory as Python tuples.
+    """
+    with METRICS.measure_stage("load_project_keys"):
+        return _load_project_keys(client, project)
+
+
+def _load_project_keys(client: Client, project: Project) -> ProjectKeys:
+    return ProjectKeys(
+        project=project,
+        issues=_load_key_set(
+            client,
+            """
+            SELECT DISTINCT id
+            FROM issues
+            WHERE source_system = %s
+            AND project_owner = %s
+            AND project_name = %s
+            ORDER BY id
+            """,
+            project,
+            1,
+        ),
+        issue_comments=_load_key_set(
+            client,
+            """
+            SELECT DISTINCT issue_id, id
+            FROM issue_comments
+            WHERE source_system = %s
+            AND project_owner = %s
+            AND project_name = %s
+            ORDER BY issue_id, id
+            """,
+            project,
+            2,
+        ),
+        issue_events=_load_key_set(
+            client,
+            """
+            SELECT DISTINCT id, related_object_id, CAST(type, 'UInt8')
+            FROM issue_events
+            WHERE source_system = %s
+            AND project_owner = %s
+            AND project_name = %s
+            ORDER BY id, related_object_id, CAST(type, 'UInt8')
+            """,
+            project,
+            3,
+        ),
+        closed_issues=_load_key_set(
+            client,
+            """
+            SELECT id
+            FROM issue_states FINAL
+            WHERE source_system = %s
+            AND project_owner = %s
+            AND project_name = %s
+            AND state = 'CLOSED'
+            ORDER BY id
+            """,
+            project,
+            1,
+        ),
+    )
+
+
+def get_sync_watermark(
+    client: Client,
+    project: Project,
+) -> datetime.datetime | None:
+    """
+    Return the ``updated_at`` time a project was last synced up to.
+    """
     result = client.query(  # pyright: ignore[reportUnknownMemberType]
         """
-        SELECT 1
-        FROM issues
+        SELECT updated_at
+        FROM sync_state
         WHERE source_system = %s
         AND project_owner = %s
         AND project_name = %s
-        AND id = %s
+        ORDER BY updated_at DESC
         LIMIT 1
         """,
-        (project.source_system, project.owner, project.name, issue_id),
+        (project.source_system, project.owner, project.name),
     )
 
-    return len(result.result_rows) > 0
+    if not result.result_rows:
+        return None
+
+    return result.result_rows[0][0]
 
 
-def insert_issue_comment(
+def set_sync_watermark(
     client: Client,
-    issue_comment: IssueComment,
-    body_vector: list[float],
+    project: Project,
+    updated_at: datetime.datetime,
 ) -> None:
     client.insert(
-        "issue_comments",
+        "sync_state",
         data=[
             (
-                int(issue_comment.project.source_system),
-                issue_comment.project.owner,
-                issue_comment.project.name,
-                issue_comment.issue_id,
-                issue_comment.id,
-                issue_comment.username,
-                issue_comment.body,
-                body_vector,
-                issue_comment.created_at,
+                int(project.source_system),
+                project.owner,
+                project.name,
+                updated_at,
+                datetime.datetime.now(datetime.UTC),
             ),
         ],
         column_names=[
             "source_system",
             "project_owner",
             "project_name",
-            "issue_id",
-            "id",
-            "username",
-            "body",
-            "body_vector",
-            "created_at",
+            "updated_at",
+            "synced_at",
         ],
     )
 
 
-def issue_comment_exists(
+def get_sync_checkpoint(
     client: Client,
     project: Project,
-    issue_id: int,
-    comment_id: int,
-) -> bool:
+) -> SyncCheckpoint | None:
+    """
+    Return the checkpoint saved by an unfinished sync of a project, if any.
+    """
     result = client.query(  # pyright: ignore[reportUnknownMemberType]
         """
-        SELECT 1
-        FROM issue_comments
+        SELECT since, page, loaded_issue_ids, updated_at, cursor, finished
+        FROM sync_checkpoints
         WHERE source_system = %s
         AND project_owner = %s
         AND project_name = %s
-        AND issue_id = %s
-        AND id = %s
+        ORDER BY saved_at DESC
         LIMIT 1
         """,
-        (
-            project.source_system,
-            project.owner,
-            project.name,
-            issue_id,
-            comment_id,
-        ),
+        (project.source_system, project.owner, project.name),
     )
 
-    return len(result.result_rows) > 0
+    if not result.result_rows or result.result_rows[0][5]:
+        return None
 
+    since, page, loaded_issue_ids, updated_at, cursor, _ = result.result_rows[
+        0
+    ]
 
-def insert_issue_event(
+    return SyncCheckpoint(
+        since=since,
+        page=page,
+        loaded_issue_ids=tuple(loaded_issue_ids),
+        updated_at=updated_at,
+        cursor=cursor,
+    )
+
+
+def set_sync_checkpoint(
     client: Client,
-    issue_event: IssueEvent,
+    project: Project,
+    checkpoint: SyncCheckpoint | None,
 ) -> None:
+    """
+    Save a checkpoint for a project, or mark the sync finished with None.
+    """
     client.insert(
-        "issue_events",
+        "sync_checkpoints",
         data=[
             (
-                int(issue_event.project.source_system),
-                issue_event.project.owner,
-                issue_event.project.name,
-                issue_event.id,
-                issue_event.related_object_id,
-                issue_event.parent_id,
-                int(issue_event.type),
-                issue_event.assignee_username,
-                issue_event.timestamp,
+                int(project.source_system),
+                project.owner,
+                project.name,
+                *(checkpoint or SyncCheckpoint(None, 0, (), None)),
+                checkpoint is None,
+                datetime.datetime.now(datetime.UTC),
             ),
         ],
         column_names=[
             "source_system",
             "project_owner",
             "project_name",
-            "id",
-            "related_object_id",
-            "parent_id",
-            "type",
-            "assignee_username",
-            "timestamp",
+            "since",
+            "page",
+            "loaded_issue_ids",
+            "updated_at",
+            "cursor",
+            "finished",
+            "saved_at",
         ],
     )
 
 
-def issue_event_exists(
-    client: Client,
-    project: Project,
-    issue_id: int,
-    related_object_id: int,
-) -> bool:
-    result = client.query(  # pyright: ignore[reportUnknownMemberType]
+class _TableBuffer:
+    def __init__(self, column_names: Sequence[str]) -> None:
+        self.column_names = column_names
+        self.columns: list[list[Any]] = [[] for _ in column_names]
+        self.row_count = 0
+
+    def append(self, row: Sequence[Any]) -> None:
+        for column, value in zip(self.columns, row, strict=True):
+            column.append(value)
+
+        self.row_count += 1
+
+    def clear(self) -> None:
+        self.columns = [[] for _ in self.column_names]
+        self.row_count = 0
+
+
+class BatchWriter:
+    """
+    Buffer rows per table and write them to ClickHouse in bulk.
+
+    Rows are stored column by column and sent as a single columnar insert
+    when a table holds ``batch_size`` rows, when ``flush_interval`` seconds
+    have passed since the oldest buffered row was added, or when the writer
+    is flushed or closed.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        batch_size: int = 10_000,
+        flush_interval: float = 60.0,
+    ) -> None:
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffers: dict[str, _TableBuffer] = {}
+        self._oldest_row_time: float | None = None
+        # The number of rows written to each table.
+        self.written_row_counts: dict[str, int] = {}
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    @property
+    def pending_row_count(self) -> int:
+        return sum(buffer.row_count for buffer in self._buffers.values())
+
+    def add_row(
+        self,
+        table: str,
+        column_names: Sequence[str],
+        row: Sequence[Any],
+    ) -> None:
+        buffer = self._buffers.get(table)
+
+        if buffer is None or buffer.column_names != column_names:
+            # Rows with different columns can't share an insert.
+            if buffer is not None:
+                self._flush_table(table, buffer)
+
+            buffer = self._buffers[table] = _TableBuffer(column_names)
+
+        buffer.append(row)
+
+        if self._oldest_row_time is None:
+            self._oldest_row_time = time.monotonic()
+
+        if buffer.row_count >= self.batch_size:
+            self._flush_table(table, buffer)
+        elif time.monotonic() - self._oldest_row_time >= self.flush_interval:
+            self.flush()
+
+    def add_issue(
+        self,
+        issue: Issue,
+        title_vector: Sequence[float],
+        description_vector: Sequence[float],
+        compact_vectors: tuple[CompactVector, CompactVector] | None = None,
+        sparse_vectors: tuple[SparseVector, SparseVector] | None = None,
+        lsh_buckets: Sequence[int] | None = None,
+    ) -> None:
         """
-        SELECT 1
-        FROM issue_events
-        WHERE source_system = %s
-        AND project_owner = %s
-        AND project_name = %s
-        AND id = %s
-        AND related_object_id = %s
-        LIMIT 1
-        """,
-        (
-            project.source_system,
-            project.owner,
-            project.name,
-            issue_id,
-            related_object_id,
-        ),
-    )
+        Add an issue, with compact or sparse title and description vectors
+        and MinHash LSH buckets if given.
+        """
+        column_names = ISSUE_COLUMNS
+        row = issue_row(issue, title_vector, description_vector)
+
+        if compact_vectors is not None:
+            title_compact, description_compact = compact_vectors
+            column_names += ISSUE_COMPACT_COLUMNS
+            row += (*title_compact, *description_compact)
 
-    return len(result.result_rows) > 0
+        if sparse_vectors is not None:
+            title_sparse, description_sparse = sparse_vectors
+            column_names += ISSUE_SPARSE_COLUMNS
+            row += (*title_sparse, *description_sparse)
+
+        if lsh_buckets is not None:
+            column_names += ("lsh_buckets",)
+            row += (lsh_buckets,)
+
+        self.add_row("issues", column_names, row)
+
+    def add_issue_comment(
+        self,
+        issue_comment: IssueComment,
+        body_vector: Sequence[float],
+        body_compact: CompactVector | None = None,
+        body_sparse: SparseVector | None = None,
+    ) -> None:
+        column_names = ISSUE_COMMENT_COLUMNS
+        row = issue_comment_row(issue_comment, body_vector)
+
+        if body_compact is not None:
+            column_names += ISSUE_COMMENT_COMPACT_COLUMNS
+            row += tuple(body_compact)
+
+        if body_sparse is not None:
+            column_names += ISSUE_COMMENT_SPARSE_COLUMNS
+            row += tuple(body_sparse)
+
+        self.add_row("issue_comments", column_names, row)
+
+    def add_issue_event(self, issue_event: IssueEvent) -> None:
+        self.add_row(
+            "issue_events",
+            ISSUE_EVENT_COLUMNS,
+            issue_event_row(issue_event),
+        )
+
+    def _flush_table(self, table: str, buffer: _TableBuffer) -> None:
+        if buffer.row_count:
+            with METRICS.measure_stage(f"insert_{table}", buffer.row_count):
+                self.client.insert(
+                    table,
+                    data=buffer.columns,
+                    column_names=buffer.column_names,
+                    column_oriented=True,
+                )
+
+            self.written_row_counts[table] = (
+                self.written_row_counts.get(table, 0) + buffer.row_count
+            )
+
+            buffer.clear()
+
+        if not self.pending_row_count:
+            self._oldest_row_time = None
+
+    def flush(self) -> None:
+        """
+        Write all buffered rows to ClickHouse.
+        """
+        for table, buffer in self._buffers.items():
+            self._flush_table(table, buffer)
+
+        self._oldest_row_time = None
+
+    def close(self) -> None:
+        self.flush()
 
 
 class SimilarIssueMatch(NamedTuple):
@@ -221,15 +558,252 @@ class SimilarIssueMatch(NamedTuple):
     issue2_title: str
     title_distance: float
     description_distance: float
+    # The project both issues belong to.
+    project_owner: str
+    project_name: str
+
+
+def project_filter(
+    alias: str,
+    project: tuple[str, str] | None,
+) -> tuple[str, tuple[str, ...]]:
+    """
+    Return a condition limiting a query to an (owner, name) project, if
+    any, and its parameters.
+    """
+    if project is None:
+        return "", ()
+
+    return (
+        f"AND {alias}.project_owner = %s AND {alias}.project_name = %s",
+        project,
+    )
+
+
+def _stream_similar_issue_matches(
+    client: Client,
+    query: str,
+    parameters: Sequence[Any],
+) -> Iterator[SimilarIssueMatch]:
+    """
+    Yield matches for a query as blocks of rows arrive.
+    """
+    with client.query_row_block_stream(query, parameters) as stream:
+        for block in cast(Iterable[Sequence[Sequence[Any]]], stream):
+            for row in block:
+                yield SimilarIssueMatch(*row)
+
+
+def _sparse_cosine_distance(alias_1: str, alias_2: str, name: str) -> str:
+    """
+    Return SQL for the cosine distance between two sparse unit vectors.
+
+    Values are only multiplied where the first vector is set, so the cost
+    grows with the number of non-zero values. ``indexOf`` returns 0 for
+    missing indices, and element 0 of an array is a default 0.
+    """
+    return (
+        "1 - arraySum(arrayMap("
+        f"(index, value) -> value * arrayElement("
+        f"{alias_2}.{name}_values, indexOf({alias_2}.{name}_indices, index)"
+        f"), {alias_1}.{name}_indices, {alias_1}.{name}_values"
+        "))"
+    )
 
 
 def find_similar_issues(
     client: Client,
     max_title_distance: float,
     max_description_distance: float,
-) -> list[SimilarIssueMatch]:
-    result = client.query(  # pyright: ignore[reportUnknownMemberType]
+    *,
+    project: tuple[str, str] | None = None,
+    top_k: int | None = None,
+    sparse: bool = False,
+) -> Iterator[SimilarIssueMatch]:
+    """
+    Find similar open issues by comparing every pair of issues.
+
+    Matches are streamed, so they are never all held in memory. With
+    ``top_k``, only the nearest titles for each issue are yielded. With
+    ``sparse``, distances are computed from the sparse vector columns.
+    """
+    project_condition, project_parameters = project_filter(
+        "issue_1",
+        project,
+    )
+    limit_clause = (
+        """
+        ORDER BY
+            issue_1.source_system,
+            issue_1.project_owner,
+            issue_1.project_name,
+            issue_1.id,
+            title_distance
+        LIMIT %s BY
+            issue_1.source_system,
+            issue_1.project_owner,
+            issue_1.project_name,
+            issue_1.id
+        """
+        if top_k is not None
+        else ""
+    )
+
+    if sparse:
+        title_distance = _sparse_cosine_distance("issue_1", "issue_2", "title")
+        description_distance = _sparse_cosine_distance(
+            "issue_1",
+            "issue_2",
+            "description",
+        )
+    else:
+        title_distance = (
+            "cosineDistance(issue_1.title_vector, issue_2.title_vector)"
+        )
+        description_distance = (
+            "cosineDistance("
+            "issue_1.description_vector, issue_2.description_vector"
+            ")"
+        )
+
+    return _stream_similar_issue_matches(
+        client,
+        f"""
+        WITH open_issues AS (
+            SELECT source_system, project_owner, project_name, id
+            FROM issue_states FINAL
+            WHERE state = 'OPEN'
+        )
+        SELECT
+            issue_1.id,
+            issue_2.id,
+            issue_1.title,
+            issue_2.title,
+            {title_distance} AS title_distance,
+            {description_distance} AS description_distance,
+            issue_1.project_owner,
+            issue_1.project_name
+        FROM issues AS issue_1
+        LEFT JOIN issues AS issue_2
+        ON issue_1.source_system = issue_2.source_system
+        AND issue_1.project_owner = issue_2.project_owner
+        AND issue_1.project_name = issue_2.project_name
+        INNER JOIN open_issues AS open_1
+        ON open_1.source_system = issue_1.source_system
+        AND open_1.project_owner = issue_1.project_owner
+        AND open_1.project_name = issue_1.project_name
+        AND open_1.id = issue_1.id
+        INNER JOIN open_issues AS open_2
+        ON open_2.source_system = issue_2.source_system
+        AND open_2.project_owner = issue_2.project_owner
+        AND open_2.project_name = issue_2.project_name
+        AND open_2.id = issue_2.id
+        WHERE issue_1.id != issue_2.id
+        AND title_distance <= %s
+        AND description_distance <= %s
+        {project_condition}
+        {limit_clause}
+        """,
+        (
+            max_title_distance,
+            max_description_distance,
+            *project_parameters,
+            *(() if top_k is None else (top_k,)),
+        ),
+    )
+
+
+def _signature_distance(signature_1: str, signature_2: str) -> str:
+    """
+    Return SQL for the Hamming distance between two sign signatures.
+
+    Signatures are compared 8 bytes at a time as 64-bit integers.
+    """
+    return " + ".join(
+        "bitCount(bitXor("
+        f"reinterpretAsUInt64(substring({signature_1}, {start}, 8)), "
+        f"reinterpretAsUInt64(substring({signature_2}, {start}, 8))"
+        "))"
+        for start in range(1, SIGNATURE_SIZE + 1, 8)
+    )
+
+
+_OPEN_ISSUE_COLUMNS_QUERY = """
+SELECT
+    issue.source_system AS source_system,
+    issue.project_owner AS project_owner,
+    issue.project_name AS project_name,
+    issue.id AS id,
+    {columns}
+FROM issues AS issue
+INNER JOIN (
+    SELECT source_system, project_owner, project_name, id
+    FROM issue_states FINAL
+    WHERE state = 'OPEN'
+) AS open_issue
+ON open_issue.source_system = issue.source_system
+AND open_issue.project_owner = issue.project_owner
+AND open_issue.project_name = issue.project_name
+AND open_issue.id = issue.id
+WHERE 1 {project_condition}
+"""
+
+
+def _rescore_candidates(
+    client: Client,
+    candidates_query: str,
+    parameters: Sequence[Any],
+    max_title_distance: float,
+    max_description_distance: float,
+    top_k: int | None,
+) -> Iterator[SimilarIssueMatch]:
+    """
+    Compare candidate pairs of issues with full vectors.
+
+    ``candidates_query`` defines common table expressions ending with
+    ``candidates``, which has project columns, ``issue1_id`` and
+    ``issue2_id``, and holds each pair in both orders. Only the vectors of
+    candidate issues are read.
+    """
+    limit_clause = (
         """
+        ORDER BY
+            issue_1.source_system,
+            issue_1.project_owner,
+            issue_1.project_name,
+            issue_1.id,
+            title_distance
+        LIMIT %s BY
+            issue_1.source_system,
+            issue_1.project_owner,
+            issue_1.project_name,
+            issue_1.id
+        """
+        if top_k is not None
+        else ""
+    )
+
+    return _stream_similar_issue_matches(
+        client,
+        f"""
+        WITH {candidates_query},
+        candidate_issues AS (
+            SELECT
+                source_system,
+                project_owner,
+                project_name,
+                id,
+                title,
+                title_vector,
+                description_vector
+            FROM issues
+            -- Candidates are symmetric, so the first IDs cover every
+            -- issue, and the primary key finds their vectors.
+            WHERE (source_system, project_owner, project_name, id) IN (
+                SELECT source_system, project_owner, project_name, issue1_id
+                FROM candidates
+            )
+        )
         SELECT
             issue_1.id,
             issue_2.id,
@@ -242,40 +816,579 @@ def find_similar_issues(
             cosineDistance(
                 issue_1.description_vector,
                 issue_2.description_vector
-            ) AS description_distance
-        FROM issues AS issue_1
-        LEFT JOIN issues AS issue_2
-        ON issue_1.source_system = issue_2.source_system
-        AND issue_1.project_owner = issue_2.project_owner
-        AND issue_1.project_name = issue_2.project_name
-        LEFT JOIN issue_events AS ie_1
-        ON ie_1.source_system = issue_1.source_system
-        AND ie_1.project_owner = issue_1.project_owner
-        AND ie_1.project_name = issue_1.project_name
-        AND ie_1.id = issue_1.id
-        AND ie_1.type = 'CLOSED'
-        LEFT JOIN issue_events AS ie_2
-        ON ie_2.source_system = issue_2.source_system
-        AND ie_2.project_owner = issue_2.project_owner
-        AND ie_2.project_name = issue_2.project_name
-        AND ie_2.id = issue_2.id
-        AND ie_2.type = 'CLOSED'
-        WHERE issue_1.id != issue_2.id
-        AND cosineDistance(
-            issue_1.title_vector,
-            issue_2.title_vector
-        ) <= %s
-        AND cosineDistance(
-            issue_1.description_vector,
-            issue_2.description_vector
-        ) <= %s
-        AND ie_1.id = 0
-        AND ie_2.id = 0
+            ) AS description_distance,
+            issue_1.project_owner,
+            issue_1.project_name
+        FROM candidates AS candidate
+        INNER JOIN candidate_issues AS issue_1
+        ON issue_1.source_system = candidate.source_system
+        AND issue_1.project_owner = candidate.project_owner
+        AND issue_1.project_name = candidate.project_name
+        AND issue_1.id = candidate.issue1_id
+        INNER JOIN candidate_issues AS issue_2
+        ON issue_2.source_system = candidate.source_system
+        AND issue_2.project_owner = candidate.project_owner
+        AND issue_2.project_name = candidate.project_name
+        AND issue_2.id = candidate.issue2_id
+        WHERE title_distance <= %s
+        AND description_distance <= %s
+        {limit_clause}
+        """,
+        (
+            *parameters,
+            max_title_distance,
+            max_description_distance,
+            *(() if top_k is None else (top_k,)),
+        ),
+    )
+
+
+def find_similar_issues_prefiltered(
+    client: Client,
+    max_title_distance: float,
+    max_description_distance: float,
+    max_signature_distance: int,
+    *,
+    project: tuple[str, str] | None = None,
+    top_k: int | None = None,
+) -> Iterator[SimilarIssueMatch]:
+    """
+    Find similar open issues, ruling pairs out by title signature first.
+
+    Pairs are only compared with full vectors when the Hamming distance
+    between their title sign signatures is at most
+    ``max_signature_distance``, so the self-join reads 96 bytes per issue
+    instead of two full vectors. Issues written without compact vectors
+    have empty signatures, and are best backfilled before searching.
+    """
+    project_condition, project_parameters = project_filter("issue", project)
+    signature_distance = _signature_distance(
+        "signature_1.title_signature",
+        "signature_2.title_signature",
+    )
+    open_signatures_query = _OPEN_ISSUE_COLUMNS_QUERY.format(
+        columns="issue.title_signature AS title_signature",
+        project_condition=project_condition,
+    )
+
+    return _rescore_candidates(
+        client,
+        f"""
+        open_signatures AS ({open_signatures_query}),
+        candidates AS (
+            SELECT
+                signature_1.source_system AS source_system,
+                signature_1.project_owner AS project_owner,
+                signature_1.project_name AS project_name,
+                signature_1.id AS issue1_id,
+                signature_2.id AS issue2_id
+            FROM open_signatures AS signature_1
+            INNER JOIN open_signatures AS signature_2
+            ON signature_1.source_system = signature_2.source_system
+            AND signature_1.project_owner = signature_2.project_owner
+            AND signature_1.project_name = signature_2.project_name
+            WHERE signature_1.id != signature_2.id
+            AND {signature_distance} <= %s
+        )
+        """,
+        (*project_parameters, max_signature_distance),
+        max_title_distance,
+        max_description_distance,
+        top_k,
+    )
+
+
+def find_similar_issues_lsh(
+    client: Client,
+    max_title_distance: float,
+    max_description_distance: float,
+    *,
+    project: tuple[str, str] | None = None,
+    top_k: int | None = None,
+) -> Iterator[SimilarIssueMatch]:
+    """
+    Find similar open issues which share a MinHash LSH bucket.
+
+    Only issues with a bucket in common are compared with full vectors, so
+    the work grows with the number of candidate pairs instead of the square
+    of the number of issues. Issues written without buckets are never
+    compared.
+    """
+    project_condition, project_parameters = project_filter("issue", project)
+    open_buckets_query = _OPEN_ISSUE_COLUMNS_QUERY.format(
+        columns="issue.lsh_buckets AS lsh_buckets",
+        project_condition=project_condition,
+    )
+
+    return _rescore_candidates(
+        client,
+        f"""
+        open_buckets AS (
+            SELECT source_system, project_owner, project_name, id, bucket
+            FROM ({open_buckets_query})
+            ARRAY JOIN lsh_buckets AS bucket
+        ),
+        candidates AS (
+            SELECT DISTINCT
+                bucket_1.source_system AS source_system,
+                bucket_1.project_owner AS project_owner,
+                bucket_1.project_name AS project_name,
+                bucket_1.id AS issue1_id,
+                bucket_2.id AS issue2_id
+            FROM open_buckets AS bucket_1
+            INNER JOIN open_buckets AS bucket_2
+            ON bucket_1.source_system = bucket_2.source_system
+            AND bucket_1.project_owner = bucket_2.project_owner
+            AND bucket_1.project_name = bucket_2.project_name
+            AND bucket_1.bucket = bucket_2.bucket
+            WHERE bucket_1.id != bucket_2.id
+        )
+        """,
+        project_parameters,
+        max_title_distance,
+        max_description_distance,
+        top_k,
+    )
+
+
+def _load_open_issue_ids(
+    client: Client,
+    project: tuple[str, str] | None = None,
+) -> dict[tuple[str, str, str], list[int]]:
+    """
+    Load the IDs of open issues, grouped by project.
+    """
+    project_condition, project_parameters = project_filter("issue", project)
+    open_issue_ids: dict[tuple[str, str, str], list[int]] = {}
+    result = client.query(  # pyright: ignore[reportUnknownMemberType]
+        f"""
+        SELECT
+            issue.source_system,
+            issue.project_owner,
+            issue.project_name,
+            issue.id
+        FROM issues AS issue
+        INNER JOIN (
+            SELECT source_system, project_owner, project_name, id
+            FROM issue_states FINAL
+            WHERE state = 'OPEN'
+        ) AS open_issue
+        ON open_issue.source_system = issue.source_system
+        AND open_issue.project_owner = issue.project_owner
+        AND open_issue.project_name = issue.project_name
+        AND open_issue.id = issue.id
+        WHERE 1 {project_condition}
+        ORDER BY
+            issue.source_system,
+            issue.project_owner,
+            issue.project_name,
+            issue.id
+        """,
+        project_parameters,
+    )
+
+    for source_system, owner, name, issue_id in result.result_rows:
+        open_issue_ids.setdefault((source_system, owner, name), []).append(
+            issue_id,
+        )
+
+    return open_issue_ids
+
+
+# The nearest open issues to one issue, as one part of a batched query.
+_NEIGHBOURS_QUERY = """
+(
+    SELECT
+        %s AS issue_id,
+        id,
+        title,
+        cosineDistance(title_vector, %s) AS title_distance,
+        cosineDistance(description_vector, %s) AS description_distance
+    FROM issues
+    WHERE source_system = %s
+    AND project_owner = %s
+    AND project_name = %s
+    AND id != %s
+    AND id IN (
+        SELECT id
+        FROM issue_states FINAL
+        WHERE source_system = %s
+        AND project_owner = %s
+        AND project_name = %s
+        AND state = 'OPEN'
+    )
+    ORDER BY title_distance
+    LIMIT %s
+)
+"""
+# An upper bound on the bytes in one part of a neighbour query, with two
+# vectors written into it, as batches are longer than ClickHouse allows by
+# default.
+_NEIGHBOURS_QUERY_SIZE = 2 * VECTOR_SIZE * 32 + 2_048
+
+
+def find_similar_issues_indexed(
+    client: Client,
+    max_title_distance: float,
+    max_description_distance: float,
+    neighbour_count: int = 10,
+    batch_size: int = 100,
+    *,
+    project: tuple[str, str] | None = None,
+    top_k: int | None = None,
+) -> Iterator[SimilarIssueMatch]:
+    """
+    Find similar open issues with the vector index on ``title_vector``.
+
+    The ``neighbour_count`` nearest open titles to each open issue are
+    looked up with the index, and description distance is only checked for
+    those candidates. Issues are searched ``batch_size`` at a time, with
+    one query for each batch. The search is approximate, so some matches
+    found by `find_similar_issues` can be missed. With ``top_k``, only the
+    nearest of those matches are yielded for each issue.
+    """
+    for project_key, issue_ids in _load_open_issue_ids(
+        client,
+        project,
+    ).items():
+        for start in range(0, len(issue_ids), batch_size):
+            issues = client.query(  # pyright: ignore[reportUnknownMemberType]
+                """
+                SELECT id, title, title_vector, description_vector
+                FROM issues
+                WHERE source_system = %s
+                AND project_owner = %s
+                AND project_name = %s
+                AND id IN %s
+                """,
+                (*project_key, issue_ids[start : start + batch_size]),
+            )
+
+            if not issues.result_rows:
+                continue
+
+            # The reference vectors must be constants for the index to be
+            # used, so each issue is searched in its own part of a query.
+            neighbours = client.query(  # pyright: ignore[reportUnknownMemberType]
+                "UNION ALL".join(
+                    _NEIGHBOURS_QUERY for _ in issues.result_rows
+                ),
+                tuple(
+                    parameter
+                    for (
+                        issue_id,
+                        _,
+                        title_vector,
+                        description_vector,
+                    ) in issues.result_rows
+                    for parameter in (
+                        issue_id,
+                        title_vector,
+                        description_vector,
+                        *project_key,
+                        issue_id,
+                        *project_key,
+                        neighbour_count,
+                    )
+                ),
+                settings={
+                    "max_query_size": len(issues.result_rows)
+                    * _NEIGHBOURS_QUERY_SIZE,
+                },
+            )
+            neighbours_by_issue: dict[int, list[tuple[Any, ...]]] = {}
+
+            for issue_id, *neighbour in neighbours.result_rows:
+                neighbours_by_issue.setdefault(issue_id, []).append(
+                    tuple(neighbour),
+                )
+
+            for issue_id, title, _, _ in issues.result_rows:
+                matches = (
+                    SimilarIssueMatch(
+                        issue_id,
+                        neighbour_id,
+                        title,
+                        neighbour_title,
+                        title_distance,
+                        description_distance,
+                        project_key[1],
+                        project_key[2],
+                    )
+                    for (
+                        neighbour_id,
+                        neighbour_title,
+                        title_distance,
+                        description_distance,
+                    ) in sorted(
+                        neighbours_by_issue.get(issue_id, []),
+                        key=lambda neighbour: neighbour[2],
+                    )
+                    if title_distance <= max_title_distance
+                    and description_distance <= max_description_distance
+                )
+                yield from itertools.islice(matches, top_k)
+
+
+def get_similar_pairs_watermark(
+    client: Client,
+    max_title_distance: float,
+    max_description_distance: float,
+) -> int:
+    """
+    Return the insertion time in milliseconds up to which issues have been
+    compared into ``similar_pairs``, or 0 if they never have been.
+    """
+    result = client.query(  # pyright: ignore[reportUnknownMemberType]
+        """
+        SELECT toUnixTimestamp64Milli(inserted_at)
+        FROM similar_pairs_state
+        WHERE max_title_distance = %s
+        AND max_description_distance = %s
+        ORDER BY inserted_at DESC
+        LIMIT 1
+        """,
+        (max_title_distance, max_description_distance),
+    )
+
+    if not result.result_rows:
+        return 0
+
+    return result.result_rows[0][0]
+
+
+def update_similar_pairs(
+    client: Client,
+    max_title_distance: float,
+    max_description_distance: float,
+) -> None:
+    """
+    Compare issues inserted since the last update against every issue.
+
+    Similar pairs are appended to ``similar_pairs``, so the cost of an
+    update grows with the number of new issues, not with the square of the
+    number of issues. Times are compared as integer milliseconds, as
+    query parameters would lose the fractions of a second.
+    """
+    since = get_similar_pairs_watermark(
+        client,
+        max_title_distance,
+        max_description_distance,
+    )
+    result = client.query(  # pyright: ignore[reportUnknownMemberType]
+        "SELECT toUnixTimestamp64Milli(max(inserted_at)) FROM issues",
+    )
+    until = result.result_rows[0][0]
+
+    if until <= since:
+        return
+
+    # New issues are on the right of the join, so only they are held in
+    # memory while every issue is compared against them.
+    client.command(
+        """
+        INSERT INTO similar_pairs (
+            source_system,
+            project_owner,
+            project_name,
+            issue1_id,
+            issue2_id,
+            title_distance,
+            description_distance,
+            found_at
+        )
+        SELECT
+            issue.source_system,
+            issue.project_owner,
+            issue.project_name,
+            least(issue.id, new_issue.id),
+            greatest(issue.id, new_issue.id),
+            cosineDistance(
+                issue.title_vector,
+                new_issue.title_vector
+            ) AS title_distance,
+            cosineDistance(
+                issue.description_vector,
+                new_issue.description_vector
+            ) AS description_distance,
+            now64(3, 'UTC')
+        FROM issues AS issue
+        INNER JOIN (
+            SELECT
+                source_system,
+                project_owner,
+                project_name,
+                id,
+                title_vector,
+                description_vector
+            FROM issues
+            WHERE toUnixTimestamp64Milli(inserted_at) > %s
+            AND toUnixTimestamp64Milli(inserted_at) <= %s
+        ) AS new_issue
+        ON new_issue.source_system = issue.source_system
+        AND new_issue.project_owner = issue.project_owner
+        AND new_issue.project_name = issue.project_name
+        WHERE toUnixTimestamp64Milli(issue.inserted_at) <= %s
+        AND issue.id != new_issue.id
+        AND title_distance <= %s
+        AND description_distance <= %s
         """,
         (
+            since,
+            until,
+            until,
             max_title_distance,
             max_description_distance,
         ),
     )
+    client.command(
+        """
+        INSERT INTO similar_pairs_state
+        SELECT
+            %s,
+            %s,
+            fromUnixTimestamp64Milli(toInt64(%s), 'UTC'),
+            now64(3, 'UTC')
+        """,
+        (max_title_distance, max_description_distance, until),
+    )
+
+
+def find_stored_similar_issues(
+    client: Client,
+    max_title_distance: float,
+    max_description_distance: float,
+    *,
+    project: tuple[str, str] | None = None,
+    top_k: int | None = None,
+) -> Iterator[SimilarIssueMatch]:
+    """
+    Stream similar open issues from ``similar_pairs``.
+
+    Each pair is returned once, with the lower issue ID first. With
+    ``top_k``, only the nearest titles for each issue are yielded.
+    """
+    project_condition, project_parameters = project_filter("pair", project)
+    limit_clause = (
+        """
+        LIMIT %s BY
+            pair.source_system,
+            pair.project_owner,
+            pair.project_name,
+            pair.issue1_id
+        """
+        if top_k is not None
+        else ""
+    )
+
+    return _stream_similar_issue_matches(
+        client,
+        f"""
+        WITH open_issues AS (
+            SELECT source_system, project_owner, project_name, id
+            FROM issue_states FINAL
+            WHERE state = 'OPEN'
+        )
+        SELECT
+            pair.issue1_id,
+            pair.issue2_id,
+            issue_1.title,
+            issue_2.title,
+            pair.title_distance,
+            pair.description_distance,
+            pair.project_owner,
+            pair.project_name
+        FROM similar_pairs AS pair FINAL
+        INNER JOIN open_issues AS open_1
+        ON open_1.source_system = pair.source_system
+        AND open_1.project_owner = pair.project_owner
+        AND open_1.project_name = pair.project_name
+        AND open_1.id = pair.issue1_id
+        INNER JOIN open_issues AS open_2
+        ON open_2.source_system = pair.source_system
+        AND open_2.project_owner = pair.project_owner
+        AND open_2.project_name = pair.project_name
+        AND open_2.id = pair.issue2_id
+        INNER JOIN issues AS issue_1
+        ON issue_1.source_system = pair.source_system
+        AND issue_1.project_owner = pair.project_owner
+        AND issue_1.project_name = pair.project_name
+        AND issue_1.id = pair.issue1_id
+        INNER JOIN issues AS issue_2
+        ON issue_2.source_system = pair.source_system
+        AND issue_2.project_owner = pair.project_owner
+        AND issue_2.project_name = pair.project_name
+        AND issue_2.id = pair.issue2_id
+        WHERE pair.title_distance <= %s
+        AND pair.description_distance <= %s
+        {project_condition}
+        ORDER BY
+            pair.source_system,
+            pair.project_owner,
+            pair.project_name,
+            pair.issue1_id,
+            pair.title_distance
+        {limit_clause}
+        """,
+        (
+            max_title_distance,
+            max_description_distance,
+            *project_parameters,
+            *(() if top_k is None else (top_k,)),
+        ),
+    )
+
+
+class ClickhouseStorage(BatchWriter):
+    """
+    Store and search issues in ClickHouse.
+
+    Rows are written in batches as by `BatchWriter`, and the client is
+    closed with the storage.
+    """
+
+    def load_project_keys(self, project: Project) -> ProjectKeys:
+        return load_project_keys(self.client, project)
+
+    def get_sync_watermark(
+        self,
+        project: Project,
+    ) -> datetime.datetime | None:
+        return get_sync_watermark(self.client, project)
+
+    def set_sync_watermark(
+        self,
+        project: Project,
+        updated_at: datetime.datetime,
+    ) -> None:
+        set_sync_watermark(self.client, project, updated_at)
+
+    def get_sync_checkpoint(self, project: Project) -> SyncCheckpoint | None:
+        return get_sync_checkpoint(self.client, project)
+
+    def set_sync_checkpoint(
+        self,
+        project: Project,
+        checkpoint: SyncCheckpoint | None,
+    ) -> None:
+        set_sync_checkpoint(self.client, project, checkpoint)
+
+    def find_similar_issues(
+        self,
+        max_title_distance: float,
+        max_description_distance: float,
+        *,
+        project: tuple[str, str] | None = None,
+        top_k: int | None = None,
+    ) -> Iterator[SimilarIssueMatch]:
+        return find_similar_issues(
+            self.client,
+            max_title_distance,
+            max_description_distance,
+            project=project,
+            top_k=top_k,
+        )
 
-    return [SimilarIssueMatch(*row) for row in result.result_rows]
+    def close(self) -> None:
+        super().close()
+        self.client.close()
@@ -15,12 +15,68 @@ class ConfigurationClickhouseSettings(NamedTuple):
     username: str
     password: str
     database: str
+    batch_size: int
+    flush_interval: float
+    compression: bool | str
+    # Write int8 vectors and sign signatures next to full vectors.
+    compact_vectors: bool
+    # Write sparse index and value arrays next to full vectors.
+    sparse_vectors: bool
+    # Write MinHash LSH buckets for issues.
+    minhash: bool
+
+
+class ConfigurationEncodingSettings(NamedTuple):
+    token_cache_size: int
+    vocabulary_path: str
+    batch_size: int
+    workers: int
+    # The number of encoded vectors kept in memory. 0 turns it off.
+    embedding_cache_size: int
+    # An SQLite file to keep encoded vectors in across runs, if set.
+    embedding_cache_path: str
+
+
+class ConfigurationStorageSettings(NamedTuple):
+    # "clickhouse", or "parquet" to write files without a database server.
+    backend: str
+    # The directory to write Parquet files to.
+    path: str
+
+
+class ConfigurationGithubCacheSettings(NamedTuple):
+    # The SQLite file to cache responses in. Caching is off when empty.
+    path: str
+    max_size_mb: int
+
+
+class ConfigurationMetricsSettings(NamedTuple):
+    # A file to write Prometheus metrics to at exit, for the node exporter
+    # textfile collector, if set.
+    textfile_path: str
+    # A port to serve Prometheus metrics on while running. 0 turns it off.
+    http_port: int
 
 
 class Configuration(NamedTuple):
     github_token: str
+    # Every token GitHub requests are shared between, starting with
+    # ``github_token``.
+    github_tokens: tuple[str, ...]
+    # Requests each token can send ahead of an even pace over the time
+    # left until its rate limit resets.
+    github_request_burst: int
+    # The GitHub API to load issues with: "rest", "rest_repository" or
+    # "graphql".
+    github_source: str
     github_repos: tuple[ConfigurationGithubRepo, ...]
+    # The number of repositories to load at the same time.
+    concurrency: int
     clickhouse: ConfigurationClickhouseSettings
+    encoding: ConfigurationEncodingSettings
+    github_cache: ConfigurationGithubCacheSettings
+    storage: ConfigurationStorageSettings
+    metrics: ConfigurationMetricsSettings
 
 
 def load_configuration(filename: str) -> Configuration:
@@ -28,6 +84,20 @@ def load_configuration(filename: str) -> Configuration:
         toml_data = tomllib.load(file_handle)
 
     clickhouse_data = toml_data.get("clickhouse", {})
+    encoding_data = toml_data.get("encoding", {})
+    github_cache_data = toml_data.get("github_cache", {})
+    storage_data = toml_data.get("storage", {})
+    metrics_data = toml_data.get("metrics", {})
+    github_tokens = tuple(
+        dict.fromkeys(
+            token
+            for token in (
+                toml_data.get("github_token", ""),
+                *toml_data.get("github_tokens", []),
+            )
+            if token
+        ),
+    )
 
     return Configuration(
         clickhouse=ConfigurationClickhouseSettings(
@@ -36,8 +106,41 @@ def load_configuration(filename: str) -> Configuration:
             username=clickhouse_data.get("username", ""),
             password=clickhouse_data.get("password", ""),
             database=clickhouse_data.get("database", ""),
+            batch_size=clickhouse_data.get("batch_size", 10_000),
+            flush_interval=clickhouse_data.get("flush_interval", 60.0),
+            compression=clickhouse_data.get("compression", True),
+            compact_vectors=clickhouse_data.get("compact_vectors", False),
+            sparse_vectors=clickhouse_data.get("sparse_vectors", False),
+            minhash=clickhouse_data.get("minhash", False),
+        ),
+        encoding=ConfigurationEncodingSettings(
+            token_cache_size=encoding_data.get("token_cache_size", 100_000),
+            vocabulary_path=encoding_data.get("vocabulary_path", ""),
+            batch_size=encoding_data.get("batch_size", 1_000),
+            workers=encoding_data.get("workers", 0),
+            embedding_cache_size=encoding_data.get(
+                "embedding_cache_size",
+                10_000,
+            ),
+            embedding_cache_path=encoding_data.get("embedding_cache_path", ""),
+        ),
+        github_cache=ConfigurationGithubCacheSettings(
+            path=github_cache_data.get("path", ""),
+            max_size_mb=github_cache_data.get("max_size_mb", 512),
+        ),
+        storage=ConfigurationStorageSettings(
+            backend=storage_data.get("backend", "clickhouse"),
+            path=storage_data.get("path", "data"),
+        ),
+        metrics=ConfigurationMetricsSettings(
+            textfile_path=metrics_data.get("textfile_path", ""),
+            http_port=metrics_data.get("http_port", 0),
         ),
-        github_token=toml_data.get("github_token", ""),
+        github_token=github_tokens[0] if github_tokens else "",
+        github_tokens=github_tokens,
+        github_request_burst=toml_data.get("github_request_burst", 500),
+        github_source=toml_data.get("github_source", "rest"),
+        concurrency=toml_data.get("concurrency", 1),
         github_repos=tuple(
             ConfigurationGithubRepo(
                 owner=repo_data.get("owner", ""),
@@ -0,0 +1,739 @@
+import hashlib
+import itertools
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Sequence
+from pathlib import Path
+from typing import NamedTuple, Protocol
+
+import numpy as np
+import numpy.typing as npt
+
+from .metrics import METRICS
+
+VECTOR_SIZE = 768
+EMPTY_VECTOR = [0.0] * VECTOR_SIZE
+# Texts are encoded this many at a time to bound temporary memory.
+ENCODE_CHUNK_SIZE = 1024
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_']+")
+
+
+def _split_sentences(text: str) -> list[str]:
+    return [
+        sentence
+        for sentence in re.split(r"[.!?]+\s+", text.strip())
+        if sentence
+    ]
+
+
+def tokenise(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _hash_token(token: str) -> tuple[int, float]:
+    token_hash = hashlib.blake2b(
+        token.encode("utf-8"),
+        digest_size=8,
+    ).digest()
+    index = int.from_bytes(token_hash[:4], "big") % VECTOR_SIZE
+    direction = 1.0 if token_hash[4] % 2 == 0 else -1.0
+
+    return index, direction
+
+
+class TokenHashCacheInfo(NamedTuple):
+    """
+    Statistics for a TokenHashCache.
+    """
+
+    # The number of lookups answered from the cache.
+    hits: int
+    # The number of lookups which had to hash the token.
+    misses: int
+    # The number of tokens currently cached.
+    size: int
+    # The maximum number of tokens kept in the cache.
+    max_size: int
+
+
+class TokenHashCache:
+    """
+    A bounded cache mapping tokens to their (index, sign) pair.
+
+    The least recently used tokens are evicted once ``max_size`` tokens are
+    cached. The cache can be saved to and preloaded from a vocabulary file
+    with one tab-separated ``token, index, sign`` line per token.
+    """
+
+    def __init__(self, max_size: int = 100_000) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, token: str, entry: tuple[int, float]) -> None:
+        self._entries[token] = entry
+
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, token: str) -> tuple[int, float]:
+        with self._lock:
+            entry = self._entries.get(token)
+
+            if entry is not None:
+                self._entries.move_to_end(token)
+                self.hits += 1
+
+                return entry
+
+            self.misses += 1
+            entry = _hash_token(token)
+            self._store(token, entry)
+
+            return entry
+
+    def info(self) -> TokenHashCacheInfo:
+        return TokenHashCacheInfo(
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._entries),
+            max_size=self.max_size,
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def entries(self) -> list[tuple[str, tuple[int, float]]]:
+        """
+        Return cached entries from least to most recently used.
+        """
+        with self._lock:
+            return list(self._entries.items())
+
+    def preload(
+        self,
+        entries: Iterable[tuple[str, tuple[int, float]]],
+    ) -> None:
+        with self._lock:
+            for token, entry in entries:
+                self._store(token, entry)
+
+    def load_vocabulary(self, path: str | Path) -> int:
+        """
+        Preload token hashes from a vocabulary file.
+
+        Return the number of tokens loaded. Only the last ``max_size``
+        tokens in the file are kept.
+        """
+        count = 0
+
+        with Path(path).open(encoding="utf-8") as file_handle, self._lock:
+            for line in file_handle:
+                token, index, sign = line.rstrip("\n").split("\t")
+                self._store(token, (int(index), float(sign)))
+                count += 1
+
+        return count
+
+    def save_vocabulary(self, path: str | Path) -> int:
+        """
+        Save cached token hashes to a vocabulary file.
+
+        Tokens are written from least to most recently used, so loading the
+        file again keeps the most recently used tokens.
+        """
+        entries = self.entries()
+
+        with Path(path).open("w", encoding="utf-8") as file_handle:
+            for token, (index, sign) in entries:
+                file_handle.write(f"{token}\t{index}\t{sign:g}\n")
+
+        return len(entries)
+
+
+# The cache shared by every encoding function.
+TOKEN_HASH_CACHE = TokenHashCache()
+
+
+def configure_token_hash_cache(
+    max_size: int,
+    entries: Iterable[tuple[str, tuple[int, float]]] = (),
+) -> None:
+    """
+    Resize the shared token hash cache and preload entries into it.
+
+    This is also used to initialise encoding worker processes.
+    """
+    TOKEN_HASH_CACHE.max_size = max_size
+    TOKEN_HASH_CACHE.preload(entries)
+
+
+def _token_entries(
+    texts: Sequence[str],
+) -> tuple[
+    npt.NDArray[np.intp], npt.NDArray[np.intp], npt.NDArray[np.float64]
+]:
+    """
+    Return the row, column, and sign for every token in the texts.
+    """
+    rows: list[int] = []
+    columns: list[int] = []
+    signs: list[float] = []
+
+    for row, text in enumerate(texts):
+        for token in tokenise(text):
+            index, direction = TOKEN_HASH_CACHE.get(token)
+            rows.append(row)
+            columns.append(index)
+            signs.append(direction)
+
+    return (
+        np.array(rows, dtype=np.intp),
+        np.array(columns, dtype=np.intp),
+        np.array(signs, dtype=np.float64),
+    )
+
+
+def _normalise_rows(
+    matrix: npt.NDArray[np.float64],
+) -> npt.NDArray[np.float32]:
+    magnitudes = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+    empty_rows = magnitudes <= 1e-12
+    magnitudes[empty_rows] = 1.0
+    matrix /= magnitudes[:, np.newaxis]
+    matrix[empty_rows] = 0.0
+
+    return matrix.astype(np.float32)
+
+
+def _encode_text_chunk(texts: Sequence[str]) -> npt.NDArray[np.float32]:
+    matrix = np.zeros((len(texts), VECTOR_SIZE), dtype=np.float64)
+    rows, columns, signs = _token_entries(texts)
+    np.add.at(matrix, (rows, columns), signs)
+
+    return _normalise_rows(matrix)
+
+
+def _encode_document_chunk(texts: Sequence[str]) -> npt.NDArray[np.float32]:
+    sentences: list[str] = []
+    sentence_documents: list[int] = []
+
+    for document, text in enumerate(texts):
+        for sentence in _split_sentences(text):
+            sentences.append(sentence)
+            sentence_documents.append(document)
+
+    rows, columns, signs = _token_entries(sentences)
+
+    # Sum token signs per (sentence, column) pair without allocating a full
+    # vector for every sentence. The pairs come out sorted by sentence, so
+    # they are added to documents in the same order as before.
+    pairs, pair_positions = np.unique(
+        rows * VECTOR_SIZE + columns,
+        return_inverse=True,
+    )
+    counts = np.bincount(pair_positions, weights=signs)
+    non_zero = counts != 0
+    pairs = pairs[non_zero]
+    counts = counts[non_zero]
+    sentence_rows = pairs // VECTOR_SIZE
+    sentence_columns = pairs % VECTOR_SIZE
+    sentence_magnitudes = np.sqrt(
+        np.bincount(
+            sentence_rows,
+            weights=counts * counts,
+            minlength=len(sentences),
+        ),
+    )
+
+    matrix = np.zeros((len(texts), VECTOR_SIZE), dtype=np.float64)
+    np.add.at(
+        matrix,
+        (
+            np.array(sentence_documents, dtype=np.intp)[sentence_rows],
+            sentence_columns,
+        ),
+        counts / sentence_magnitudes[sentence_rows],
+    )
+
+    return _normalise_rows(matrix)
+
+
+def _encode_in_chunks(
+    texts: Sequence[str],
+    encode_chunk: Callable[[Sequence[str]], npt.NDArray[np.float32]],
+) -> npt.NDArray[np.float32]:
+    if len(texts) <= ENCODE_CHUNK_SIZE:
+        return encode_chunk(texts)
+
+    return np.concatenate(
+        [
+            encode_chunk(texts[start : start + ENCODE_CHUNK_SIZE])
+            for start in range(0, len(texts), ENCODE_CHUNK_SIZE)
+        ],
+    )
+
+
+class Encoder(Protocol):
+    """
+    A way of encoding text as unit vectors with ``VECTOR_SIZE`` values.
+    """
+
+    # The name of the model or method used.
+    name: str
+    # Changed whenever the vectors for the same text change.
+    version: str
+
+    def encode_texts(
+        self,
+        texts: Sequence[str],
+    ) -> npt.NDArray[np.float32]: ...
+
+    def encode_documents(
+        self,
+        texts: Sequence[str],
+    ) -> npt.NDArray[np.float32]: ...
+
+
+class HashedTokenEncoder:
+    """
+    Encode text as the signed counts of hashed tokens.
+    """
+
+    name = "hashed-tokens"
+    version = "1"
+
+    def encode_texts(
+        self,
+        texts: Sequence[str],
+    ) -> npt.NDArray[np.float32]:
+        # Python 3.15 alpha lacks wheels for the previous ML stack, so use a
+        # deterministic hashed token vector to keep similarity scoring
+        # working.
+        return _encode_in_chunks(texts, _encode_text_chunk)
+
+    def encode_documents(
+        self,
+        texts: Sequence[str],
+    ) -> npt.NDArray[np.float32]:
+        return _encode_in_chunks(texts, _encode_document_chunk)
+
+
+def encoder_version(encoder: Encoder) -> str:
+    """
+    Return the name and version of an encoder, as stored with vectors.
+    """
+    return f"{encoder.name}/{encoder.version}"
+
+
+# The encoder used for all new vectors.
+ENCODER: Encoder = HashedTokenEncoder()
+ENCODER_VERSION = encoder_version(ENCODER)
+
+
+class EmbeddingCacheInfo(NamedTuple):
+    """
+    Statistics for an EmbeddingCache.
+    """
+
+    # Texts answered from memory.
+    hits: int
+    # Texts answered from the persistent file.
+    persistent_hits: int
+    # Texts which had to be encoded.
+    misses: int
+    # The number of vectors kept in memory.
+    size: int
+    # The maximum number of vectors kept in memory.
+    max_size: int
+
+    @property
+    def hit_ratio(self) -> float:
+        lookup_count = self.hits + self.persistent_hits + self.misses
+
+        return (
+            (self.hits + self.persistent_hits) / lookup_count
+            if lookup_count
+            else 0.0
+        )
+
+
+class EmbeddingCache:
+    """
+    A cache of encoded vectors keyed by encoder version and content hash.
+
+    Up to ``max_size`` vectors are kept in memory, evicting the least
+    recently used. With a ``path``, vectors are also stored in an SQLite
+    file, so identical texts such as "+1" comments or issue templates are
+    encoded once across runs and processes. A ``max_size`` of 0 without a
+    path turns caching off.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        path: str | Path | None = None,
+        version: str = ENCODER_VERSION,
+    ) -> None:
+        if max_size < 0:
+            raise ValueError("max_size must not be negative")
+
+        self.max_size = max_size
+        self.version = version
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, npt.NDArray[np.float32]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self.path: Path | None = None
+
+        if path:
+            self.open(path)
+
+    def open(self, path: str | Path) -> None:
+        """
+        Store vectors in an SQLite file, instead of any previous file.
+        """
+        self.close()
+        connection_path = Path(path)
+        connection_path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(
+            connection_path,
+            check_same_thread=False,
+            # Encoding worker processes write to the same file.
+            timeout=60.0,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vectors (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL
+            )
+            """,
+        )
+        connection.commit()
+
+        with self._lock:
+            self._connection = connection
+            self.path = connection_path
+
+    def resize(self, max_size: int) -> None:
+        with self._lock:
+            self.max_size = max_size
+
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 or self._connection is not None
+
+    def key(self, kind: str, text: str) -> bytes:
+        """
+        Return the cache key for a text encoded one way.
+        """
+        return hashlib.blake2b(
+            f"{self.version}\0{kind}\0{text}".encode(),
+            digest_size=16,
+        ).digest()
+
+    def _store(self, key: bytes, vector: npt.NDArray[np.float32]) -> None:
+        if self.max_size == 0:
+            return
+
+        self._entries[key] = vector
+
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _load_persistent(
+        self,
+        keys: Sequence[bytes],
+    ) -> dict[bytes, npt.NDArray[np.float32]]:
+        if self._connection is None or not keys:
+            return {}
+
+        found: dict[bytes, npt.NDArray[np.float32]] = {}
+
+        # SQLite limits the number of parameters in a statement.
+        for batch in itertools.batched(keys, 500):
+            rows = self._connection.execute(
+                "SELECT key, vector FROM vectors WHERE key IN "
+                f"({', '.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            found.update(
+                (key, np.frombuffer(vector, dtype=np.float32))
+                for key, vector in rows
+            )
+
+        return found
+
+    def _save_persistent(
+        self,
+        entries: Sequence[tuple[bytes, npt.NDArray[np.float32]]],
+    ) -> None:
+        if self._connection is None or not entries:
+            return
+
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO vectors VALUES (?, ?)",
+            [(key, vector.tobytes()) for key, vector in entries],
+        )
+        self._connection.commit()
+
+    def encode(
+        self,
+        kind: str,
+        texts: Sequence[str],
+        encode: Callable[[Sequence[str]], npt.NDArray[np.float32]],
+    ) -> npt.NDArray[np.float32]:
+        """
+        Encode texts with ``encode``, using cached vectors where possible.
+
+        Only distinct texts which are not cached are passed to ``encode``.
+        """
+        if not self.enabled or not texts:
+            return encode(texts)
+
+        keys = [self.key(kind, text) for text in texts]
+        matrix = np.empty((len(texts), VECTOR_SIZE), dtype=np.float32)
+        # The rows for each distinct text missing from memory.
+        missing: dict[bytes, list[int]] = {}
+
+        with self._lock:
+            for row, key in enumerate(keys):
+                vector = self._entries.get(key)
+
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    matrix[row] = vector
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(row)
+
+            persistent = self._load_persistent(list(missing))
+
+            for key, vector in persistent.items():
+                rows = missing.pop(key)
+                matrix[rows] = vector
+                self.persistent_hits += len(rows)
+                self._store(key, vector)
+
+        if missing:
+            encoded = encode([texts[rows[0]] for rows in missing.values()])
+            new_entries: list[tuple[bytes, npt.NDArray[np.float32]]] = []
+
+            for (key, rows), vector in zip(
+                missing.items(),
+                encoded,
+                strict=True,
+            ):
+                matrix[rows] = vector
+                new_entries.append((key, vector.copy()))
+
+            with self._lock:
+                self.misses += sum(len(rows) for rows in missing.values())
+
+                for key, vector in new_entries:
+                    self._store(key, vector)
+
+                self._save_persistent(new_entries)
+
+        return matrix
+
+    def info(self) -> EmbeddingCacheInfo:
+        return EmbeddingCacheInfo(
+            hits=self.hits,
+            persistent_hits=self.persistent_hits,
+            misses=self.misses,
+            size=len(self._entries),
+            max_size=self.max_size,
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.persistent_hits = 0
+            self.misses = 0
+
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM vectors")
+                self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+                self.path = None
+
+
+# The cache shared by every encoding function.
+EMBEDDING_CACHE = EmbeddingCache()
+
+
+def configure_embedding_cache(max_size: int, path: str = "") -> None:
+    """
+    Resize the shared embedding cache and store vectors in ``path``.
+
+    This is also used to initialise encoding worker processes, which share
+    the persistent file.
+    """
+    EMBEDDING_CACHE.resize(max_size)
+
+    if path:
+        EMBEDDING_CACHE.open(path)
+    else:
+        EMBEDDING_CACHE.close()
+
+
+def encode_texts(texts: Sequence[str]) -> npt.NDArray[np.float32]:
+    """
+    Encode short texts, such as titles, into a matrix with a row per text.
+    """
+    with METRICS.measure_stage("encode_text", len(texts)):
+        return EMBEDDING_CACHE.encode("text", texts, ENCODER.encode_texts)
+
+
+def encode_documents(texts: Sequence[str]) -> npt.NDArray[np.float32]:
+    """
+    Encode documents into a matrix with a row per document.
+
+    Each sentence is encoded and normalised separately, and the sentence
+    vectors are summed and normalised again for the document.
+    """
+    with METRICS.measure_stage("encode_document", len(texts)):
+        return EMBEDDING_CACHE.encode(
+            "document",
+            texts,
+            ENCODER.encode_documents,
+        )
+
+
+def encode_text(text: str) -> list[float]:
+    return encode_texts([text])[0].tolist()
+
+
+def encode_document(text: str) -> list[float]:
+    return encode_documents([text])[0].tolist()
+
+
+# The number of bytes in a sign signature, with one bit per dimension.
+SIGNATURE_SIZE = VECTOR_SIZE // 8
+
+
+class CompactVector(NamedTuple):
+    """
+    Small forms of a unit vector, for cheap approximate comparisons.
+    """
+
+    # The vector scaled to the range [-127, 127] and rounded.
+    quantized: list[int]
+    # One bit per dimension, set where the value is positive.
+    signature: bytes
+
+
+def quantize_vectors(
+    vectors: npt.NDArray[np.float32],
+) -> npt.NDArray[np.int8]:
+    """
+    Quantize rows of unit vectors to 8 bits per value.
+
+    Dot products of quantized vectors divided by 127 squared approximate
+    cosine similarity.
+    """
+    return np.round(vectors * 127).astype(np.int8)
+
+
+def sign_signatures(
+    vectors: npt.NDArray[np.float32],
+) -> npt.NDArray[np.uint8]:
+    """
+    Pack the signs of each row of vectors into ``SIGNATURE_SIZE`` bytes.
+
+    Vectors pointing the same way have few differing bits, so the Hamming
+    distance between signatures can rule out dissimilar pairs cheaply.
+    """
+    return np.packbits(vectors > 0, axis=1)
+
+
+def compact_vectors(
+    vectors: npt.NDArray[np.float32],
+) -> list[CompactVector]:
+    return [
+        CompactVector(quantized, signature.tobytes())
+        for quantized, signature in zip(
+            quantize_vectors(vectors).tolist(),
+            sign_signatures(vectors),
+            strict=True,
+        )
+    ]
+
+
+class SparseVector(NamedTuple):
+    """
+    The non-zero values of a vector.
+    """
+
+    # The positions of non-zero values, in ascending order.
+    indices: list[int]
+    values: list[float]
+
+
+def sparse_vectors(
+    vectors: npt.NDArray[np.float32],
+) -> list[SparseVector]:
+    """
+    Convert rows of vectors to sparse vectors.
+
+    Hashed token vectors only set one position per distinct token, so a
+    title usually has 5 to 20 values instead of ``VECTOR_SIZE``.
+    """
+    rows, indices = np.nonzero(vectors)
+    values = vectors[rows, indices]
+    splits = np.searchsorted(rows, np.arange(1, len(vectors)))
+
+    return [
+        SparseVector(row_indices.tolist(), row_values.tolist())
+        for row_indices, row_values in zip(
+            np.split(indices, splits),
+            np.split(values, splits),
+            strict=True,
+        )
+    ]
+
+
+def dense_vectors(
+    indices: Sequence[Sequence[int]],
+    values: Sequence[Sequence[float]],
+) -> npt.NDArray[np.float32]:
+    """
+    Convert sparse vectors, given as parallel lists, to a matrix.
+    """
+    matrix = np.zeros((len(indices), VECTOR_SIZE), dtype=np.float32)
+    lengths = [len(row_indices) for row_indices in indices]
+    matrix[
+        np.repeat(np.arange(len(indices)), lengths),
+        np.fromiter(itertools.chain.from_iterable(indices), dtype=np.intp),
+    ] = np.fromiter(itertools.chain.from_iterable(values), dtype=np.float32)
+
+    return matrix
@@ -1,5 +1,11 @@
+import datetime
+import logging
+from collections.abc import Callable
+
 from github import Github
+from github.GithubObject import NotSet, Opt
 from github.Issue import Issue as GithubIssue
+from github.Repository import Repository
 
 from .issue import (
     Issue,
@@ -8,7 +14,9 @@ from .issue import (
     IssueEventType,
     Project,
     SourceSystemType,
+    SyncCheckpoint,
 )
+from .metrics import METRICS
 from .project_processor import ProjectProcessor
 
 
@@ -17,87 +25,456 @@ def get_assignee_username(github_issue: GithubIssue) -> str:
     return assignee.login if assignee is not None else ""
 
 
+def save_failed_sync_checkpoint(
+    processor: ProjectProcessor,
+    project: Project,
+    checkpoint: SyncCheckpoint,
+) -> None:
+    """
+    Save a checkpoint with the issues loaded on the page where loading
+    failed, so they are skipped.
+
+    The checkpoint is only saved once their rows are written. An error
+    while saving it is logged, so the error which stopped loading can be
+    raised. Call this when catching ``Exception``: interrupts keep the
+    checkpoints saved for earlier pages.
+    """
+    try:
+        processor.set_sync_checkpoint(project, checkpoint)
+    except Exception:
+        logging.exception(
+            "Failed to save a checkpoint for %s/%s",
+            project.owner,
+            project.name,
+        )
+
+
 def fetch_github_issues(
     processor: ProjectProcessor,
     client: Github,
     project: Project,
-) -> None:
+    since: datetime.datetime | None = None,
+) -> datetime.datetime | None:
+    """
+    Fetch issues, and their events and comments, for a project.
+
+    When ``since`` is set, only issues and comments updated at or after that
+    time are fetched. Return the latest ``updated_at`` time seen, if any.
+
+    Issues are listed in pages from the oldest, and a checkpoint is saved
+    for each page once its rows are written, or when loading fails, so a
+    sync which was stopped resumes from the page it stopped on. Issues which
+    were fully loaded on that page are not fetched again.
+    """
+    repo = client.get_repo(f"{project.owner}/{project.name}")
+    since_parameter: Opt[datetime.datetime] = (
+        since if since is not None else NotSet
+    )
+    # Oldest issues come first, so new issues never move others to other
+    # pages.
+    github_issues = repo.get_issues(
+        state="all",
+        since=since_parameter,
+        sort="created",
+        direction="asc",
+    )
+    checkpoint = processor.get_sync_checkpoint(project)
+
+    if (
+        checkpoint is None
+        or checkpoint.since != since
+        # Checkpoints with cursors are saved by GraphQL syncs.
+        or checkpoint.cursor is not None
+    ):
+        checkpoint = SyncCheckpoint(
+            since=since,
+            page=0,
+            loaded_issue_ids=(),
+            updated_at=None,
+        )
+    else:
+        logging.info(
+            "Resuming %s/%s from page %d",
+            project.owner,
+            project.name,
+            checkpoint.page + 1,
+        )
+
+    high_water_mark = checkpoint.updated_at
+    loaded_issue_ids = set(checkpoint.loaded_issue_ids)
+
+    try:
+        while page_issues := github_issues.get_page(checkpoint.page):
+            for github_issue in page_issues:
+                if (
+                    high_water_mark is None
+                    or github_issue.updated_at > high_water_mark
+                ):
+                    high_water_mark = github_issue.updated_at
+
+                if (
+                    # Skip pull requests. We only want issues.
+                    github_issue.pull_request is not None
+                    or github_issue.number in loaded_issue_ids
+                ):
+                    continue
+
+                processor.store_issue(
+                    Issue(
+                        project=project,
+                        id=github_issue.number,
+                        parent_id=0,
+                        assignee_username=get_assignee_username(github_issue),
+                        title=github_issue.title,
+                        description=github_issue.body or "",
+                        labels=[label.name for label in github_issue.labels],
+                        created_at=github_issue.created_at,
+                    )
+                )
+
+                fetch_github_issue_events(
+                    processor,
+                    project,
+                    github_issue,
+                )
+                fetch_github_issue_comments(
+                    processor,
+                    project,
+                    github_issue,
+                    since,
+                )
+                loaded_issue_ids.add(github_issue.number)
+
+            loaded_issue_ids.clear()
+            checkpoint = SyncCheckpoint(
+                since=since,
+                page=checkpoint.page + 1,
+                loaded_issue_ids=(),
+                updated_at=high_water_mark,
+            )
+            processor.set_sync_checkpoint(project, checkpoint)
+    except Exception:
+        save_failed_sync_checkpoint(
+            processor,
+            project,
+            checkpoint._replace(
+                loaded_issue_ids=tuple(sorted(loaded_issue_ids)),
+            ),
+        )
+
+        raise
+
+    processor.set_sync_checkpoint(project, None)
+
+    return high_water_mark
+
+
+def fetch_github_repository_issues(
+    processor: ProjectProcessor,
+    client: Github,
+    project: Project,
+    since: datetime.datetime | None = None,
+) -> datetime.datetime | None:
+    """
+    Fetch issues, and their events and comments, with repository listings.
+
+    Comments and events are read from the repository-wide listings instead
+    of one listing per issue, so requests scale with the number of
+    comments and events rather than the number of issues. Return the latest
+    ``updated_at`` time seen, if any.
+
+    Comments and events are read after every issue, so no checkpoints are
+    saved, and a sync which was stopped starts again from the first issue.
+    """
     repo = client.get_repo(f"{project.owner}/{project.name}")
+    since_parameter: Opt[datetime.datetime] = (
+        since if since is not None else NotSet
+    )
+    high_water_mark: datetime.datetime | None = None
+    # Assignees for the issues which were listed, by issue number.
+    assignee_usernames: dict[int, str] = {}
+
+    for github_issue in repo.get_issues(state="all", since=since_parameter):
+        if (
+            high_water_mark is None
+            or github_issue.updated_at > high_water_mark
+        ):
+            high_water_mark = github_issue.updated_at
 
-    for github_issue in repo.get_issues(state="all"):
         if github_issue.pull_request is not None:
             # Skip pull requests. We only want issues.
             continue
 
+        assignee_username = get_assignee_username(github_issue)
+        assignee_usernames[github_issue.number] = assignee_username
         processor.store_issue(
             Issue(
                 project=project,
                 id=github_issue.number,
                 parent_id=0,
-                assignee_username=get_assignee_username(github_issue),
+                assignee_username=assignee_username,
                 title=github_issue.title,
                 description=github_issue.body or "",
                 labels=[label.name for label in github_issue.labels],
                 created_at=github_issue.created_at,
             )
         )
-
         fetch_github_issue_events(
             processor,
             project,
             github_issue,
+            reopens_listed=True,
         )
-        fetch_github_issue_comments(
+
+    fetch_github_repository_comments(
+        processor,
+        repo,
+        project,
+        assignee_usernames,
+        since,
+    )
+    fetch_github_repository_events(
+        processor,
+        repo,
+        project,
+        assignee_usernames,
+        since,
+    )
+
+    return high_water_mark
+
+
+def get_issue_number_from_url(issue_url: str) -> int:
+    """
+    Read an issue number from an API URL ending in ``/issues/<number>``.
+    """
+    return int(issue_url.rsplit("/", 1)[-1])
+
+
+def fetch_github_repository_comments(
+    processor: ProjectProcessor,
+    repo: Repository,
+    project: Project,
+    assignee_usernames: dict[int, str],
+    since: datetime.datetime | None = None,
+) -> None:
+    """
+    Store comments from the repository listing for the given issues.
+
+    Comments on pull requests share the listing, and are skipped.
+    """
+    for comment in repo.get_issues_comments(
+        since=since if since is not None else NotSet,
+    ):
+        issue_number = get_issue_number_from_url(comment.issue_url)
+        assignee_username = assignee_usernames.get(issue_number)
+
+        if assignee_username is None:
+            continue
+
+        store_issue_comment(
             processor,
+            IssueComment(
+                project=project,
+                issue_id=issue_number,
+                id=comment.id,
+                username=comment.user.login,
+                body=comment.body,
+                created_at=comment.created_at,
+            ),
+            assignee_username,
+        )
+
+
+def fetch_github_repository_events(
+    processor: ProjectProcessor,
+    repo: Repository,
+    project: Project,
+    assignee_usernames: dict[int, str],
+    since: datetime.datetime | None = None,
+) -> None:
+    """
+    Store reopened events from the repository listing for the given issues.
+
+    The listing cannot be filtered by time, but it is ordered from newest
+    to oldest, so reading stops at the first event before ``since``.
+    """
+    for github_event in repo.get_issues_events():
+        if since is not None and github_event.created_at < since:
+            break
+
+        if github_event.event != "reopened":
+            continue
+
+        issue_number = github_event.issue.number
+        assignee_username = assignee_usernames.get(issue_number)
+
+        if assignee_username is None:
+            continue
+
+        processor.store_issue_event(
+            IssueEvent(
+                project=project,
+                id=issue_number,
+                related_object_id=github_event.id,
+                parent_id=0,
+                type=IssueEventType.REOPENED,
+                assignee_username=assignee_username,
+                timestamp=github_event.created_at,
+            )
+        )
+
+
+def store_issue_state_event(
+    processor: ProjectProcessor,
+    project: Project,
+    issue_id: int,
+    assignee_username: str,
+    event_type: IssueEventType,
+    timestamp: datetime.datetime,
+) -> None:
+    """
+    Store an event closing or reopening an issue.
+
+    Events are keyed by the second they happened in, so an issue which is
+    closed again after being reopened gets another event. The first close
+    of an issue keeps the key 0 which every close was stored with before,
+    so databases from before then don't get a second event for it. Issues
+    which are stored as closed are not closed again.
+    """
+    related_object_id = int(timestamp.timestamp())
+
+    if event_type == IssueEventType.CLOSED:
+        if processor.is_issue_closed(project, issue_id):
+            return
+
+        if not processor.has_issue_event(
             project,
-            github_issue,
+            issue_id,
+            0,
+            IssueEventType.CLOSED,
+        ):
+            related_object_id = 0
+
+    processor.store_issue_event(
+        IssueEvent(
+            project=project,
+            id=issue_id,
+            related_object_id=related_object_id,
+            parent_id=0,
+            type=event_type,
+            assignee_username=assignee_username,
+            timestamp=timestamp,
         )
+    )
 
 
-def fetch_github_issue_events(
+def store_issue_events(
     processor: ProjectProcessor,
     project: Project,
-    github_issue: GithubIssue,
+    issue_id: int,
+    assignee_username: str,
+    created_at: datetime.datetime,
+    closed_at: datetime.datetime | None,
+    updated_at: datetime.datetime,
+    *,
+    reopens_listed: bool = False,
 ) -> None:
-    assignee_username = get_assignee_username(github_issue)
+    """
+    Store the events which can be read from the fields of an issue.
 
+    The state of the issue is read from ``closed_at`` on every sync. An
+    issue which is open, but was stored as closed, has been reopened at
+    some time up to ``updated_at``. With ``reopens_listed``, reopened events
+    are read from the repository listing instead, with their real times.
+    """
     # Store created event
     processor.store_issue_event(
         IssueEvent(
             project=project,
-            id=github_issue.number,
+            id=issue_id,
             related_object_id=0,
             parent_id=0,
             type=IssueEventType.CREATED,
             assignee_username=assignee_username,
-            timestamp=github_issue.created_at,
+            timestamp=created_at,
         )
     )
 
-    if github_issue.closed_at:
-        # Store closed event
-        processor.store_issue_event(
-            IssueEvent(
-                project=project,
-                id=github_issue.number,
-                related_object_id=0,
-                parent_id=0,
-                type=IssueEventType.CLOSED,
-                assignee_username=assignee_username,
-                timestamp=github_issue.closed_at,
-            )
+    if closed_at is not None:
+        store_issue_state_event(
+            processor,
+            project,
+            issue_id,
+            assignee_username,
+            IssueEventType.CLOSED,
+            closed_at,
+        )
+    elif not reopens_listed and processor.is_issue_closed(project, issue_id):
+        store_issue_state_event(
+            processor,
+            project,
+            issue_id,
+            assignee_username,
+            IssueEventType.REOPENED,
+            updated_at,
         )
 
 
+def store_issue_comment(
+    processor: ProjectProcessor,
+    issue_comment: IssueComment,
+    assignee_username: str,
+) -> None:
+    """
+    Store an issue comment, and an event for the comment being added.
+    """
+    processor.store_issue_comment(issue_comment)
+    processor.store_issue_event(
+        IssueEvent(
+            project=issue_comment.project,
+            id=issue_comment.issue_id,
+            related_object_id=issue_comment.id,
+            parent_id=0,
+            type=IssueEventType.COMMENT_ADDED,
+            assignee_username=assignee_username,
+            timestamp=issue_comment.created_at,
+        )
+    )
+
+
+def fetch_github_issue_events(
+    processor: ProjectProcessor,
+    project: Project,
+    github_issue: GithubIssue,
+    *,
+    reopens_listed: bool = False,
+) -> None:
+    store_issue_events(
+        processor,
+        project,
+        github_issue.number,
+        get_assignee_username(github_issue),
+        github_issue.created_at,
+        github_issue.closed_at,
+        github_issue.updated_at,
+        reopens_listed=reopens_listed,
+    )
+
+
 def fetch_github_issue_comments(
     processor: ProjectProcessor,
     project: Project,
     github_issue: GithubIssue,
+    since: datetime.datetime | None = None,
 ) -> None:
     assignee_username = get_assignee_username(github_issue)
 
-    for comment in github_issue.get_comments():
-        processor.store_issue_comment(
+    for comment in github_issue.get_comments(
+        since=since if since is not None else NotSet,
+    ):
+        store_issue_comment(
+            processor,
             IssueComment(
                 project=project,
                 issue_id=github_issue.number,
@@ -105,20 +482,40 @@ def fetch_github_issue_comments(
                 username=comment.user.login,
                 body=comment.body,
                 created_at=comment.created_at,
-            )
+            ),
+            assignee_username,
         )
 
-        # Store a comment event
-        processor.store_issue_event(
-            IssueEvent(
-                project=project,
-                id=github_issue.number,
-                related_object_id=comment.id,
-                parent_id=0,
-                type=IssueEventType.COMMENT_ADDED,
-                assignee_username=assignee_username,
-                timestamp=comment.created_at,
-            )
+
+def sync_project(
+    processor: ProjectProcessor,
+    project: Project,
+    fetch_issues: Callable[
+        [datetime.datetime | None],
+        datetime.datetime | None,
+    ],
+    *,
+    full: bool = False,
+) -> None:
+    """
+    Fetch issues for a project, and record the time it is synced up to.
+
+    ``fetch_issues`` is called with the time of the last successful sync,
+    or ``None`` when ``full`` is set, and returns the latest ``updated_at``
+    time it saw.
+    """
+    since = None if full else processor.get_sync_watermark(project)
+    started_at = datetime.datetime.now(datetime.UTC)
+
+    with METRICS.measure_stage("sync_project"):
+        high_water_mark = fetch_issues(since)
+
+    if high_water_mark is not None:
+        # Issues updated while the run was going could have been listed
+        # before they changed, so never record a time after the start.
+        processor.set_sync_watermark(
+            project,
+            min(high_water_mark, started_at),
         )
 
 
@@ -127,12 +524,33 @@ def load_github_project_issues(
     access_token: str,
     owner: str,
     repo: str,
+    *,
+    full: bool = False,
+    repository_wide: bool = False,
 ) -> None:
-    client = Github(access_token)
+    """
+    Load issues for a GitHub repository with the REST API.
+
+    Only issues updated since the last successful sync are fetched, unless
+    ``full`` is set. With ``repository_wide``, comments and events are read
+    from repository listings instead of from each issue.
+    """
+    # Request the largest pages GitHub allows, to make fewer requests.
+    client = Github(access_token, per_page=100)
+    fetch_issues = (
+        fetch_github_repository_issues
+        if repository_wide
+        else fetch_github_issues
+    )
     project = Project(
         source_system=SourceSystemType.GITHUB,
         owner=owner,
         name=repo,
     )
 
-    fetch_github_issues(processor, client, project)
+    sync_project(
+        processor,
+        project,
+        lambda since: fetch_issues(processor, client, project, since),
+        full=full,
+    )
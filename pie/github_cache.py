@@ -0,0 +1,406 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import ItemsView
+from pathlib import Path
+from typing import Any, ClassVar, NamedTuple, Protocol
+
+import requests
+from github.Requester import (
+    HTTPRequestsConnectionClass,
+    HTTPSRequestsConnectionClass,
+    Requester,
+)
+
+from .github_rate_limit import MAX_RATE_LIMIT_RETRIES, REQUEST_SCHEDULER
+from .metrics import METRICS, record_rate_limit
+
+
+class CachedResponseEntry(NamedTuple):
+    """
+    A response stored in the cache.
+    """
+
+    # The ETag header sent with the response.
+    etag: str
+    # The Last-Modified header sent with the response.
+    last_modified: str
+    # Response headers, with lowercase names.
+    headers: dict[str, str]
+    # The response body.
+    body: str
+
+
+class ResponseCacheInfo(NamedTuple):
+    """
+    Statistics for a ResponseCache.
+    """
+
+    # Requests answered with 304 Not Modified and served from the cache.
+    hits: int
+    # Requests which downloaded a response.
+    misses: int
+    # The number of responses stored.
+    size: int
+    # The number of bytes of responses stored.
+    size_bytes: int
+
+    @property
+    def hit_ratio(self) -> float:
+        request_count = self.hits + self.misses
+
+        return self.hits / request_count if request_count else 0.0
+
+
+class ResponseCache:
+    """
+    A persistent cache of GitHub responses for conditional requests.
+
+    Responses are stored in an SQLite file with their ETag and Last-Modified
+    headers. Once the stored bodies take more than ``max_size_bytes``, the
+    least recently used responses are evicted.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_size_bytes: int = 512 * 1024 * 1024,
+    ) -> None:
+        self.path = Path(path)
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+        )
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                etag TEXT NOT NULL,
+                last_modified TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """,
+        )
+        self._connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS responses_accessed_at
+            ON responses (accessed_at)
+            """,
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def key(url: str, accept: str) -> str:
+        """
+        Return the cache key for a URL requested for a media type.
+
+        Credentials are not part of the key, as requests may be sent with
+        any configured token. A cached body is only used once GitHub answers
+        a conditional request from the token actually sent with 304, so no
+        token is given a response it could not fetch itself.
+        """
+        return hashlib.sha256(f"{accept}\n{url}".encode()).hexdigest()
+
+    def get(self, key: str) -> CachedResponseEntry | None:
+        with self._lock:
+            row = self._connection.execute(
+                """
+                SELECT etag, last_modified, headers, body
+                FROM responses
+                WHERE key = ?
+                """,
+                (key,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return CachedResponseEntry(
+            etag=row[0],
+            last_modified=row[1],
+            headers=json.loads(row[2]),
+            body=row[3],
+        )
+
+    def put(self, key: str, entry: CachedResponseEntry) -> None:
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT OR REPLACE INTO responses
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key,
+                    entry.etag,
+                    entry.last_modified,
+                    json.dumps(entry.headers),
+                    entry.body,
+                    len(entry.body.encode()),
+                    time.time(),
+                ),
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self) -> None:
+        total_size = self._connection.execute(
+            "SELECT coalesce(sum(size), 0) FROM responses",
+        ).fetchone()[0]
+
+        if total_size <= self.max_size_bytes:
+            return
+
+        rows = self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at",
+        ).fetchall()
+        evicted_keys: list[tuple[str]] = []
+
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+
+            evicted_keys.append((key,))
+            total_size -= size
+
+        self._connection.executemany(
+            "DELETE FROM responses WHERE key = ?",
+            evicted_keys,
+        )
+
+    def record_hit(self, key: str) -> None:
+        with self._lock:
+            self.hits += 1
+            self._connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._connection.commit()
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def info(self) -> ResponseCacheInfo:
+        with self._lock:
+            size, size_bytes = self._connection.execute(
+                "SELECT count(), coalesce(sum(size), 0) FROM responses",
+            ).fetchone()
+
+        return ResponseCacheInfo(
+            hits=self.hits,
+            misses=self.misses,
+            size=size,
+            size_bytes=size_bytes,
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+            self._connection.execute("VACUUM")
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class _Response(Protocol):
+    status: int
+
+    def getheaders(self) -> ItemsView[str, str]: ...
+
+    def read(self) -> str: ...
+
+
+def _lowercase_headers(response: _Response) -> dict[str, str]:
+    return {name.lower(): value for name, value in response.getheaders()}
+
+
+class CachedResponse:
+    """
+    A response built from the cache, which mimics an httplib response.
+    """
+
+    def __init__(
+        self,
+        status: int,
+        headers: dict[str, str],
+        body: str,
+    ) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getheaders(self) -> ItemsView[str, str]:
+        return self.headers.items()
+
+    def read(self) -> str:
+        return self.body
+
+
+class CachingHTTPSConnection(HTTPSRequestsConnectionClass):
+    """
+    A PyGithub connection which sends conditional GET requests.
+
+    Stored ETag and Last-Modified values are sent with every GET request
+    for a cached URL. A 304 Not Modified reply, which GitHub does not count
+    against the rate limit, is answered with the cached body. Every request
+    is counted in ``METRICS``, with the rate limit values GitHub sends back.
+
+    Requests sent with a token in ``REQUEST_SCHEDULER`` are paced by it, may
+    be sent with another configured token, and are sent again after a rate
+    limit reply.
+    """
+
+    cache: ClassVar[ResponseCache | None] = None
+    # Sessions are shared between connections, as PyGithub creates a new
+    # connection for every request when connection classes are injected.
+    _sessions: ClassVar[dict[tuple[str, int], requests.Session]] = {}
+    _sessions_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, host: str, *args: Any, **kwargs: Any) -> None:
+        super().__init__(host, *args, **kwargs)
+
+        with self._sessions_lock:
+            shared_session = self._sessions.setdefault(
+                (self.host, self.port),
+                self.session,
+            )
+
+        if shared_session is not self.session:
+            self.session.close()
+            self.session = shared_session
+
+    def _send(self) -> _Response:
+        with METRICS.measure_stage("github_rest_request"):
+            response = super().getresponse()
+
+        METRICS.increment(
+            "pie_github_requests_total",
+            api="rest",
+            status=str(response.status),
+        )
+
+        return response
+
+    def _fetch(self) -> _Response:
+        scheme, _, token = self.headers.get("Authorization", "").partition(
+            " ",
+        )
+
+        if not REQUEST_SCHEDULER.schedules(token):
+            response = self._send()
+            record_rate_limit("rest", _lowercase_headers(response))
+
+            return response
+
+        resource = "search" if "/search/" in self.url else "core"
+        attempt = 0
+
+        while True:
+            # Requests go out with whichever configured token is ready.
+            token = REQUEST_SCHEDULER.acquire(resource)
+            self.headers = {
+                **self.headers,
+                "Authorization": f"{scheme} {token}",
+            }
+            response = self._send()
+            headers = _lowercase_headers(response)
+            record_rate_limit("rest", headers)
+            rate_limited = REQUEST_SCHEDULER.update(
+                token,
+                resource,
+                headers,
+                status=response.status,
+            )
+
+            if not rate_limited or attempt == MAX_RATE_LIMIT_RETRIES:
+                return response
+
+            attempt += 1
+
+    def getresponse(self) -> Any:
+        cache = self.cache
+
+        if cache is None or self.verb != "GET" or self.stream:
+            return self._fetch()
+
+        key = cache.key(
+            f"{self.host}:{self.port}{self.url}",
+            self.headers.get("Accept", ""),
+        )
+        entry = cache.get(key)
+
+        if entry is not None:
+            self.headers = dict(self.headers)
+
+            if entry.etag:
+                self.headers["If-None-Match"] = entry.etag
+
+            if entry.last_modified:
+                self.headers["If-Modified-Since"] = entry.last_modified
+
+        response = self._fetch()
+        headers = _lowercase_headers(response)
+
+        if response.status == 304 and entry is not None:
+            cache.record_hit(key)
+
+            # Fresh headers, such as rate limit values, replace cached ones.
+            return CachedResponse(
+                200,
+                {**entry.headers, **headers},
+                entry.body,
+            )
+
+        cache.record_miss()
+
+        if response.status != 200:
+            return response
+
+        body = response.read()
+
+        if "etag" in headers or "last-modified" in headers:
+            cache.put(
+                key,
+                CachedResponseEntry(
+                    etag=headers.get("etag", ""),
+                    last_modified=headers.get("last-modified", ""),
+                    headers=headers,
+                    body=body,
+                ),
+            )
+
+        return CachedResponse(response.status, headers, body)
+
+    def close(self) -> None:
+        # The session is shared, so it is left open.
+        pass
+
+
+def install_response_cache(cache: ResponseCache | None) -> None:
+    """
+    Use a response cache for every PyGithub client in this process.
+
+    Requests are counted in ``METRICS`` even when ``cache`` is ``None``.
+    """
+    CachingHTTPSConnection.cache = cache
+    Requester.injectConnectionClasses(
+        HTTPRequestsConnectionClass,
+        CachingHTTPSConnection,
+    )
+
+
+def uninstall_response_cache() -> None:
+    CachingHTTPSConnection.cache = None
+    Requester.resetConnectionClasses()
@@ -0,0 +1,489 @@
+import datetime
+import json
+import logging
+import urllib.error
+import urllib.request
+from collections.abc import Iterator
+from email.message import Message
+from typing import Any
+
+from .github import (
+    save_failed_sync_checkpoint,
+    store_issue_comment,
+    store_issue_events,
+    store_issue_state_event,
+    sync_project,
+)
+from .github_rate_limit import MAX_RATE_LIMIT_RETRIES, REQUEST_SCHEDULER
+from .issue import (
+    Issue,
+    IssueComment,
+    IssueEventType,
+    Project,
+    SourceSystemType,
+    SyncCheckpoint,
+)
+from .metrics import METRICS, record_rate_limit
+from .project_processor import ProjectProcessor
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+# GitHub limits each connection to 100 nodes per page.
+MAX_PAGE_SIZE = 100
+# Event types for closing and reopening issues, by GraphQL type name.
+STATE_EVENT_TYPES = {
+    "ClosedEvent": IssueEventType.CLOSED,
+    "ReopenedEvent": IssueEventType.REOPENED,
+}
+
+_COMMENT_FIELDS = """
+pageInfo {
+    hasNextPage
+    endCursor
+}
+nodes {
+    fullDatabaseId
+    body
+    createdAt
+    author {
+        login
+    }
+}
+"""
+
+ISSUES_QUERY = f"""
+query(
+    $owner: String!,
+    $name: String!,
+    $pageSize: Int!,
+    $cursor: String,
+    $since: DateTime
+) {{
+    repository(owner: $owner, name: $name) {{
+        issues(
+            first: $pageSize,
+            after: $cursor,
+            orderBy: {{field: CREATED_AT, direction: ASC}},
+            filterBy: {{since: $since}}
+        ) {{
+            pageInfo {{
+                hasNextPage
+                endCursor
+            }}
+            nodes {{
+                number
+                title
+                body
+                createdAt
+                updatedAt
+                closedAt
+                assignees(first: 1) {{
+                    nodes {{
+                        login
+                    }}
+                }}
+                labels(first: 100) {{
+                    nodes {{
+                        name
+                    }}
+                }}
+                comments(first: 100) {{
+                    {_COMMENT_FIELDS}
+                }}
+                timelineItems(
+                    last: 100,
+                    itemTypes: [CLOSED_EVENT, REOPENED_EVENT]
+                ) {{
+                    nodes {{
+                        __typename
+                        ... on ClosedEvent {{
+                            createdAt
+                        }}
+                        ... on ReopenedEvent {{
+                            createdAt
+                        }}
+                    }}
+                }}
+            }}
+        }}
+    }}
+}}
+"""
+
+ISSUE_COMMENTS_QUERY = f"""
+query($owner: String!, $name: String!, $number: Int!, $cursor: String) {{
+    repository(owner: $owner, name: $name) {{
+        issue(number: $number) {{
+            comments(first: 100, after: $cursor) {{
+                {_COMMENT_FIELDS}
+            }}
+        }}
+    }}
+}}
+"""
+
+
+class GithubGraphQLError(RuntimeError):
+    """
+    Raised when the GitHub GraphQL API returns errors.
+    """
+
+
+def _record_response(status: int, headers: Message) -> dict[str, str]:
+    METRICS.increment(
+        "pie_github_requests_total",
+        api="graphql",
+        status=str(status),
+    )
+    lowercase_headers = {
+        name.lower(): value for name, value in headers.items()
+    }
+    record_rate_limit("graphql", lowercase_headers)
+
+    return lowercase_headers
+
+
+class GithubGraphQLClient:
+    """
+    A minimal client for the GitHub GraphQL API.
+    """
+
+    def __init__(
+        self,
+        access_token: str,
+        url: str = GITHUB_GRAPHQL_URL,
+        timeout: float = 60.0,
+    ) -> None:
+        self.access_token = access_token
+        self.url = url
+        self.timeout = timeout
+
+    def query(self, query: str, variables: dict[str, Any]) -> dict[str, Any]:
+        """
+        Run a query and return its ``data``.
+
+        Queries are paced by ``REQUEST_SCHEDULER`` when it has the access
+        token, and are sent again after a rate limit reply.
+        """
+        scheduled = REQUEST_SCHEDULER.schedules(self.access_token)
+        attempt = 0
+
+        while True:
+            token = (
+                REQUEST_SCHEDULER.acquire("graphql")
+                if scheduled
+                else self.access_token
+            )
+            status, headers, payload = self._send(token, query, variables)
+
+            rate_limited = scheduled and REQUEST_SCHEDULER.update(
+                token,
+                "graphql",
+                headers,
+                status=status,
+            )
+            # The primary limit is reported as an error in a 200 response.
+            rate_limited = rate_limited or (
+                scheduled
+                and any(
+                    error.get("type") == "RATE_LIMITED"
+                    for error in (payload or {}).get("errors", [])
+                )
+            )
+
+            if rate_limited and attempt < MAX_RATE_LIMIT_RETRIES:
+                attempt += 1
+
+                continue
+
+            if payload is None:
+                raise GithubGraphQLError(f"GitHub replied with HTTP {status}")
+
+            if payload.get("errors"):
+                raise GithubGraphQLError(
+                    "; ".join(error["message"] for error in payload["errors"]),
+                )
+
+            return payload["data"]
+
+    def _send(
+        self,
+        token: str,
+        query: str,
+        variables: dict[str, Any],
+    ) -> tuple[int, dict[str, str], dict[str, Any] | None]:
+        """
+        Send a query, and return the status, lowercase headers, and JSON
+        payload of the response.
+
+        Rate limit replies have no payload. Other HTTP errors are raised.
+        """
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"query": query, "variables": variables}).encode(
+                "utf-8",
+            ),
+            headers={
+                "Authorization": f"bearer {token}",
+                "Content-Type": "application/json",
+            },
+            method="POST",
+        )
+
+        try:
+            with (
+                METRICS.measure_stage("github_graphql_request"),
+                urllib.request.urlopen(
+                    request,
+                    timeout=self.timeout,
+                ) as response,
+            ):
+                headers = _record_response(
+                    response.status,
+                    response.headers,
+                )
+
+                return response.status, headers, json.load(response)
+        except urllib.error.HTTPError as error:
+            headers = _record_response(error.code, error.headers)
+
+            if error.code not in {403, 429}:
+                raise
+
+            return error.code, headers, None
+
+
+def _parse_datetime(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value)
+
+
+def _iter_issue_comments(
+    client: GithubGraphQLClient,
+    project: Project,
+    issue_node: dict[str, Any],
+) -> Iterator[dict[str, Any]]:
+    """
+    Yield every comment for an issue, fetching pages past the first.
+    """
+    comments = issue_node["comments"]
+    yield from comments["nodes"]
+
+    while comments["pageInfo"]["hasNextPage"]:
+        data = client.query(
+            ISSUE_COMMENTS_QUERY,
+            {
+                "owner": project.owner,
+                "name": project.name,
+                "number": issue_node["number"],
+                "cursor": comments["pageInfo"]["endCursor"],
+            },
+        )
+        comments = data["repository"]["issue"]["comments"]
+        yield from comments["nodes"]
+
+
+def _store_issue_node(
+    processor: ProjectProcessor,
+    client: GithubGraphQLClient,
+    project: Project,
+    issue_node: dict[str, Any],
+) -> None:
+    """
+    Store an issue with its events and every comment.
+    """
+    updated_at = _parse_datetime(issue_node["updatedAt"])
+    assignees = issue_node["assignees"]["nodes"]
+    assignee_username = assignees[0]["login"] if assignees else ""
+    created_at = _parse_datetime(issue_node["createdAt"])
+
+    processor.store_issue(
+        Issue(
+            project=project,
+            id=issue_node["number"],
+            parent_id=0,
+            assignee_username=assignee_username,
+            title=issue_node["title"],
+            description=issue_node["body"] or "",
+            labels=[label["name"] for label in issue_node["labels"]["nodes"]],
+            created_at=created_at,
+        )
+    )
+
+    # The last closed and reopened events are stored in order, so the
+    # latest state is stored, with the time it changed.
+    for event_node in issue_node["timelineItems"]["nodes"]:
+        store_issue_state_event(
+            processor,
+            project,
+            issue_node["number"],
+            assignee_username,
+            STATE_EVENT_TYPES[event_node["__typename"]],
+            _parse_datetime(event_node["createdAt"]),
+        )
+
+    store_issue_events(
+        processor,
+        project,
+        issue_node["number"],
+        assignee_username,
+        created_at,
+        (
+            _parse_datetime(issue_node["closedAt"])
+            if issue_node["closedAt"]
+            else None
+        ),
+        updated_at,
+    )
+
+    for comment_node in _iter_issue_comments(
+        client,
+        project,
+        issue_node,
+    ):
+        author = comment_node["author"]
+        store_issue_comment(
+            processor,
+            IssueComment(
+                project=project,
+                issue_id=issue_node["number"],
+                id=int(comment_node["fullDatabaseId"]),
+                # Comments from deleted accounts have no author.
+                username=author["login"] if author else "ghost",
+                body=comment_node["body"],
+                created_at=_parse_datetime(comment_node["createdAt"]),
+            ),
+            assignee_username,
+        )
+
+
+def fetch_github_graphql_issues(
+    processor: ProjectProcessor,
+    client: GithubGraphQLClient,
+    project: Project,
+    since: datetime.datetime | None = None,
+    page_size: int = 50,
+) -> datetime.datetime | None:
+    """
+    Fetch issues with their comments, labels and assignees in bulk.
+
+    Each page of issues comes with the first 100 comments for every issue,
+    so extra requests are only made for issues with more comments than
+    that, and with the last 100 times each issue was closed or reopened.
+    Return the latest ``updatedAt`` time seen, if any.
+
+    A checkpoint with the cursor for the next page is saved for each page
+    once its rows are written, or when loading fails, so a sync which was
+    stopped resumes from the page it stopped on.
+    """
+    checkpoint = processor.get_sync_checkpoint(project)
+
+    if (
+        checkpoint is None
+        or checkpoint.since != since
+        # Checkpoints without cursors are saved by REST syncs.
+        or checkpoint.cursor is None
+    ):
+        # The cursor for the first page is empty.
+        checkpoint = SyncCheckpoint(
+            since=since,
+            page=0,
+            loaded_issue_ids=(),
+            updated_at=None,
+            cursor="",
+        )
+    else:
+        logging.info(
+            "Resuming %s/%s from page %d",
+            project.owner,
+            project.name,
+            checkpoint.page + 1,
+        )
+
+    high_water_mark = checkpoint.updated_at
+    loaded_issue_ids = set(checkpoint.loaded_issue_ids)
+    has_next_page = True
+
+    try:
+        while has_next_page:
+            data = client.query(
+                ISSUES_QUERY,
+                {
+                    "owner": project.owner,
+                    "name": project.name,
+                    "pageSize": min(page_size, MAX_PAGE_SIZE),
+                    "cursor": checkpoint.cursor or None,
+                    "since": since.isoformat() if since is not None else None,
+                },
+            )
+            issues = data["repository"]["issues"]
+
+            for issue_node in issues["nodes"]:
+                updated_at = _parse_datetime(issue_node["updatedAt"])
+
+                if high_water_mark is None or updated_at > high_water_mark:
+                    high_water_mark = updated_at
+
+                if issue_node["number"] in loaded_issue_ids:
+                    continue
+
+                _store_issue_node(processor, client, project, issue_node)
+                loaded_issue_ids.add(issue_node["number"])
+
+            loaded_issue_ids.clear()
+            has_next_page = issues["pageInfo"]["hasNextPage"]
+            checkpoint = SyncCheckpoint(
+                since=since,
+                page=checkpoint.page + 1,
+                loaded_issue_ids=(),
+                updated_at=high_water_mark,
+                cursor=issues["pageInfo"]["endCursor"] or "",
+            )
+            processor.set_sync_checkpoint(project, checkpoint)
+    except Exception:
+        save_failed_sync_checkpoint(
+            processor,
+            project,
+            checkpoint._replace(
+                loaded_issue_ids=tuple(sorted(loaded_issue_ids)),
+            ),
+        )
+
+        raise
+
+    processor.set_sync_checkpoint(project, None)
+
+    return high_water_mark
+
+
+def load_github_graphql_project_issues(
+    processor: ProjectProcessor,
+    access_token: str,
+    owner: str,
+    repo: str,
+    *,
+    full: bool = False,
+    url: str = GITHUB_GRAPHQL_URL,
+) -> None:
+    """
+    Load issues for a GitHub repository with the GraphQL API.
+
+    Only issues updated since the last successful sync are fetched, unless
+    ``full`` is set.
+    """
+    client = GithubGraphQLClient(access_token, url)
+    project = Project(
+        source_system=SourceSystemType.GITHUB,
+        owner=owner,
+        name=repo,
+    )
+
+    sync_project(
+        processor,
+        project,
+        lambda since: fetch_github_graphql_issues(
+            processor,
+            client,
+            project,
+            since,
+        ),
+        full=full,
+    )
@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterable, Mapping
+
+# The number of times a request is sent again after a rate limit reply.
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class _Budget:
+    """
+    The known rate limit for one token and resource.
+    """
+
+    def __init__(self) -> None:
+        # Requests left before the reset, once a response has said.
+        self.remaining: int | None = None
+        # The Unix time the limit resets at.
+        self.reset_at = 0.0
+        # No request is sent before this time, after a Retry-After reply.
+        self.blocked_until = 0.0
+        # The time the next request is due, if requests are evenly paced.
+        self.paced_until = 0.0
+
+
+class RequestScheduler:
+    """
+    Pace GitHub requests to fit the rate limits of a set of tokens.
+
+    Rate limits are read from the headers of every response, per token and
+    resource, such as "core", "search" or "graphql". The requests left for
+    a token are spread evenly over the time until the limit resets, though
+    up to ``burst`` requests may run ahead of that pace. Each request takes
+    the token which can send it soonest, so several tokens add up their
+    limits. One scheduler is shared by every thread.
+    """
+
+    def __init__(
+        self,
+        tokens: Iterable[str] = (),
+        *,
+        burst: int = 500,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.tokens: tuple[str, ...] = ()
+        self.burst = burst
+        self._budgets: dict[tuple[str, str], _Budget] = {}
+        self.configure(tokens, burst=burst)
+
+    def configure(self, tokens: Iterable[str], *, burst: int = 500) -> None:
+        """
+        Set the tokens to schedule requests for, and forget known limits.
+        """
+        with self._lock:
+            self.tokens = tuple(
+                dict.fromkeys(token for token in tokens if token)
+            )
+            self.burst = burst
+            self._budgets.clear()
+
+    def _budget(self, token: str, resource: str) -> _Budget:
+        return self._budgets.setdefault((token, resource), _Budget())
+
+    @staticmethod
+    def _interval(budget: _Budget, now: float) -> float:
+        if budget.remaining is None or budget.reset_at <= now:
+            return 0.0
+
+        return (budget.reset_at - now) / max(budget.remaining, 1)
+
+    def _ready_at(self, budget: _Budget, now: float) -> float:
+        ready_at = max(now, budget.blocked_until)
+
+        if budget.remaining == 0 and budget.reset_at > now:
+            ready_at = max(ready_at, budget.reset_at)
+
+        burst_time = self.burst * self._interval(budget, now)
+
+        return max(ready_at, budget.paced_until - burst_time)
+
+    def acquire(self, resource: str = "core") -> str:
+        """
+        Wait until a request can be sent, and return the token to send it
+        with.
+        """
+        with self._lock:
+            if not self.tokens:
+                raise ValueError("No GitHub tokens are configured")
+
+            now = self.clock()
+            ready_at, token = min(
+                (
+                    (self._ready_at(self._budget(token, resource), now), token)
+                    for token in self.tokens
+                ),
+                key=lambda pair: pair[0],
+            )
+            budget = self._budget(token, resource)
+            budget.paced_until = max(
+                budget.paced_until,
+                ready_at,
+            ) + self._interval(budget, ready_at)
+
+            # Count the request now, so other threads see it before GitHub
+            # replies.
+            if budget.remaining:
+                budget.remaining -= 1
+
+        if ready_at > now:
+            if ready_at - now >= 1:
+                logging.info(
+                    "Waiting %.0fs for the GitHub %s rate limit",
+                    ready_at - now,
+                    resource,
+                )
+
+            self.sleep(ready_at - now)
+
+        return token
+
+    def update(
+        self,
+        token: str,
+        resource: str,
+        headers: Mapping[str, str],
+        *,
+        status: int,
+    ) -> bool:
+        """
+        Record the rate limit sent with a response to a request.
+
+        Header names must be lowercase. Return ``True`` if the request was
+        refused by a rate limit, and should be sent again.
+        """
+        with self._lock:
+            budget = self._budget(
+                token,
+                headers.get("x-ratelimit-resource", resource),
+            )
+
+            if "x-ratelimit-remaining" in headers:
+                budget.remaining = int(headers["x-ratelimit-remaining"])
+
+            if "x-ratelimit-reset" in headers:
+                budget.reset_at = float(headers["x-ratelimit-reset"])
+
+            if status not in {403, 429}:
+                return False
+
+            retry_after = headers.get("retry-after", "")
+
+            if retry_after.isdigit():
+                # Secondary rate limits say how long to wait.
+                budget.blocked_until = self.clock() + int(retry_after)
+
+                return True
+
+            return budget.remaining == 0
+
+    def schedules(self, token: str) -> bool:
+        """
+        Check if requests sent with a token are paced by this scheduler.
+        """
+        return token in self.tokens
+
+
+def configure_request_scheduler(tokens: Iterable[str], burst: int) -> None:
+    """
+    Set the tokens that GitHub requests in this process are shared between.
+    """
+    REQUEST_SCHEDULER.configure(tokens, burst=burst)
+
+
+# Paces GitHub REST and GraphQL requests for the process.
+REQUEST_SCHEDULER = RequestScheduler()
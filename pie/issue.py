@@ -100,3 +100,22 @@ class IssueEvent(NamedTuple):
     assignee_username: str
     # The timestamp for the issue event.
     timestamp: datetime.datetime
+
+
+class SyncCheckpoint(NamedTuple):
+    """
+    Represents how far an unfinished sync of a project got.
+    """
+
+    # The time issues were listed from, or None when every issue was listed.
+    # Only a sync listing issues from the same time resumes a checkpoint.
+    since: datetime.datetime | None
+    # The index of the first page of issues which is not fully loaded.
+    page: int
+    # Issues on that page with their events and comments fully loaded.
+    loaded_issue_ids: tuple[int, ...]
+    # The latest ``updated_at`` time seen on earlier pages, if any.
+    updated_at: datetime.datetime | None
+    # The GraphQL cursor for the end of the page before, for syncs which
+    # page through issues with cursors instead of page numbers.
+    cursor: str | None = None
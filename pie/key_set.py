@@ -0,0 +1,81 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Sequence
+from typing import NamedTuple
+
+from .issue import Project
+
+
+class KeySet:
+    """
+    A set of tuples of non-negative integers, stored compactly.
+
+    Keys loaded in bulk are kept in sorted parallel arrays of unsigned 64-bit
+    integers, taking 8 bytes per key part, and are searched with ``bisect``.
+    Keys added or removed one at a time afterwards are kept in regular sets,
+    so memory for those only grows with the number of changes in a run.
+    """
+
+    def __init__(self, width: int) -> None:
+        self.width = width
+        self._columns = tuple(array("Q") for _ in range(width))
+        self._added: set[tuple[int, ...]] = set()
+        # Loaded keys which were removed, as the arrays are never changed.
+        self._removed: set[tuple[int, ...]] = set()
+
+    def __len__(self) -> int:
+        return len(self._columns[0]) + len(self._added) - len(self._removed)
+
+    def __contains__(self, key: tuple[int, ...]) -> bool:
+        if key in self._removed:
+            return False
+
+        low = 0
+        high = len(self._columns[0])
+
+        for column, value in zip(self._columns, key, strict=True):
+            low = bisect_left(column, value, low, high)
+            high = bisect_right(column, value, low, high)
+
+            if low == high:
+                return key in self._added
+
+        return True
+
+    def extend_sorted(self, columns: Sequence[Iterable[int]]) -> None:
+        """
+        Append a block of keys given as columns.
+
+        Keys must be appended in ascending order, so the arrays stay sorted.
+        """
+        for column, values in zip(self._columns, columns, strict=True):
+            column.extend(values)
+
+    def add(self, key: tuple[int, ...]) -> None:
+        if key in self._removed:
+            self._removed.remove(key)
+        elif key not in self:
+            self._added.add(key)
+
+    def discard(self, key: tuple[int, ...]) -> None:
+        if key in self._added:
+            self._added.remove(key)
+        elif key in self:
+            self._removed.add(key)
+
+
+class ProjectKeys(NamedTuple):
+    """
+    The keys for rows already stored for a project.
+    """
+
+    # The project the keys were loaded for.
+    project: Project
+    # Issue keys, as (id,)
+    issues: KeySet
+    # Issue comment keys, as (issue_id, id)
+    issue_comments: KeySet
+    # Issue event keys, as (id, related_object_id, type)
+    issue_events: KeySet
+    # Issues whose latest state is closed, as (id,)
+    closed_issues: KeySet
@@ -0,0 +1,319 @@
+import bisect
+import http.server
+import os
+import threading
+import time
+from collections.abc import Generator, Mapping
+from contextlib import contextmanager
+from pathlib import Path
+from typing import NamedTuple
+
+# Upper bounds in seconds for the buckets of latency histograms.
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# Help text for metrics written by pie, keyed by metric name.
+METRIC_DESCRIPTIONS = {
+    "pie_stage_seconds": "Time spent in each stage of loading issues.",
+    "pie_stage_items_total": "Items handled by each stage.",
+    "pie_github_requests_total": "Requests sent to GitHub, by status.",
+    "pie_github_rate_limit_remaining": "Requests left in the rate limit.",
+    "pie_github_rate_limit_reset_timestamp_seconds": (
+        "The Unix time when the rate limit resets."
+    ),
+}
+
+type Labels = tuple[tuple[str, str], ...]
+
+
+class StageSummary(NamedTuple):
+    """
+    Totals for one stage, as printed by ``pie --profile``.
+    """
+
+    stage: str
+    # The number of times the stage ran.
+    run_count: int
+    # The total time spent in the stage.
+    seconds: float
+    # The number of items handled, such as texts encoded or rows written.
+    item_count: int
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.seconds / self.run_count if self.run_count else 0.0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.item_count / self.seconds if self.seconds else 0.0
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # Counts per bucket, with a last bucket for values past every bound.
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+def _labels(labels: Mapping[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+
+    def escape(value: str) -> str:
+        return (
+            value
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n")
+        )
+
+    return (
+        "{"
+        + ",".join(f'{name}="{escape(value)}"' for name, value in labels)
+        + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges, and latency histograms for a run.
+
+    Metrics are identified by a name and a set of labels, and are rendered
+    in the Prometheus text format. Every method is thread safe.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._gauges: dict[str, dict[Labels, float]] = {}
+        self._histograms: dict[str, dict[Labels, _Histogram]] = {}
+
+    def increment(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        with self._lock:
+            values = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            values[key] = values.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            key = _labels(labels)
+            histogram = histograms.get(key)
+
+            if histogram is None:
+                histogram = histograms[key] = _Histogram(self.buckets)
+
+            histogram.observe(value)
+
+    @contextmanager
+    def measure_stage(
+        self,
+        stage: str,
+        item_count: int = 0,
+    ) -> Generator[None]:
+        """
+        Time a stage, and count the items it handles.
+
+        Stages which raise exceptions are still timed.
+        """
+        start_time = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(
+                "pie_stage_seconds",
+                time.perf_counter() - start_time,
+                stage=stage,
+            )
+            self.increment("pie_stage_items_total", item_count, stage=stage)
+
+    def stage_summaries(self) -> list[StageSummary]:
+        """
+        Return totals for every stage which has run, by stage name.
+        """
+        with self._lock:
+            histograms = self._histograms.get("pie_stage_seconds", {})
+            item_counts = self._counters.get("pie_stage_items_total", {})
+
+            return sorted(
+                StageSummary(
+                    stage=dict(labels)["stage"],
+                    run_count=histogram.count,
+                    seconds=histogram.sum,
+                    item_count=int(item_counts.get(labels, 0)),
+                )
+                for labels, histogram in histograms.items()
+            )
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines: list[str] = []
+
+        def header(name: str, metric_type: str) -> None:
+            if name in METRIC_DESCRIPTIONS:
+                lines.append(f"# HELP {name} {METRIC_DESCRIPTIONS[name]}")
+
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        with self._lock:
+            for metric_type, metrics in (
+                ("counter", self._counters),
+                ("gauge", self._gauges),
+            ):
+                for name, values in sorted(metrics.items()):
+                    header(name, metric_type)
+
+                    for labels, value in sorted(values.items()):
+                        lines.append(
+                            f"{name}{_format_labels(labels)} "
+                            f"{_format_value(value)}",
+                        )
+
+            for name, histograms in sorted(self._histograms.items()):
+                header(name, "histogram")
+
+                for labels, histogram in sorted(histograms.items()):
+                    cumulative_count = 0
+                    bounds = [*map(repr, histogram.buckets), "+Inf"]
+
+                    for bound, count in zip(
+                        bounds,
+                        histogram.bucket_counts,
+                        strict=True,
+                    ):
+                        cumulative_count += count
+                        lines.append(
+                            f"{name}_bucket"
+                            f"{_format_labels((*labels, ('le', bound)))} "
+                            f"{cumulative_count}",
+                        )
+
+                    lines.extend(
+                        (
+                            f"{name}_sum{_format_labels(labels)} "
+                            f"{_format_value(histogram.sum)}",
+                            f"{name}_count{_format_labels(labels)} "
+                            f"{histogram.count}",
+                        ),
+                    )
+
+        return "".join(f"{line}\n" for line in lines)
+
+    def write_textfile(self, path: str | Path) -> None:
+        """
+        Write metrics to a file for the node exporter textfile collector.
+
+        The file is replaced in one step, so it is never read half written.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_name(f".{path.name}.{os.getpid()}")
+        temporary_path.write_text(self.render())
+        temporary_path.replace(path)
+
+    def start_http_server(
+        self,
+        port: int,
+        host: str = "",
+    ) -> http.server.ThreadingHTTPServer:
+        """
+        Serve metrics at ``/metrics`` from a background thread.
+
+        Call ``shutdown()`` on the server returned to stop it.
+        """
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+
+                    return
+
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type",
+                    "text/plain; version=0.0.4; charset=utf-8",
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+                # Scrapes would otherwise be logged to stderr.
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(
+            target=server.serve_forever,
+            name="metrics",
+            daemon=True,
+        ).start()
+
+        return server
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+def record_rate_limit(api: str, headers: Mapping[str, str]) -> None:
+    """
+    Record the rate limit values sent with a GitHub response.
+
+    Header names must be lowercase.
+    """
+    if "x-ratelimit-remaining" in headers:
+        METRICS.set_gauge(
+            "pie_github_rate_limit_remaining",
+            float(headers["x-ratelimit-remaining"]),
+            api=api,
+        )
+
+    if "x-ratelimit-reset" in headers:
+        METRICS.set_gauge(
+            "pie_github_rate_limit_reset_timestamp_seconds",
+            float(headers["x-ratelimit-reset"]),
+            api=api,
+        )
+
+
+# Metrics for the process.
+METRICS = MetricsRegistry()
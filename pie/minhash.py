@@ -0,0 +1,116 @@
+import hashlib
+
+import numpy as np
+import numpy.typing as npt
+
+from .encoder import tokenise
+
+# The number of hash functions in a MinHash signature.
+MINHASH_SIZE = 128
+# Signatures are split into this many bands of equal size for LSH. With 4
+# values per band, pairs with a Jaccard similarity of 0.5 share a bucket
+# about 87% of the time, and pairs at 0.2 about 5% of the time.
+LSH_BAND_COUNT = 32
+# The number of consecutive tokens in a shingle.
+SHINGLE_SIZE = 2
+
+
+def _hash_parameters(prefix: str) -> npt.NDArray[np.uint64]:
+    # Parameters come from a fixed hash, so buckets computed by different
+    # runs and NumPy versions can be compared.
+    return np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(
+                    f"{prefix}{index}".encode(),
+                    digest_size=8,
+                ).digest(),
+                "little",
+            )
+            for index in range(MINHASH_SIZE)
+        ],
+        dtype=np.uint64,
+    )
+
+
+# Odd multipliers and increments for multiply-shift hashing.
+_MULTIPLIERS = _hash_parameters("multiplier") | np.uint64(1)
+_INCREMENTS = _hash_parameters("increment")
+
+
+def shingles(text: str) -> set[str]:
+    """
+    Return the runs of ``SHINGLE_SIZE`` tokens in a text.
+
+    Texts shorter than a shingle give their tokens alone.
+    """
+    tokens = tokenise(text)
+
+    if len(tokens) < SHINGLE_SIZE:
+        return set(tokens)
+
+    return {
+        " ".join(tokens[start : start + SHINGLE_SIZE])
+        for start in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash_signature(
+    text_shingles: set[str],
+) -> npt.NDArray[np.uint64] | None:
+    """
+    Compute a MinHash signature for a set of shingles.
+
+    The fraction of equal values in two signatures estimates the Jaccard
+    similarity of the sets. Return ``None`` for an empty set.
+    """
+    if not text_shingles:
+        return None
+
+    hashes = np.fromiter(
+        (
+            int.from_bytes(
+                hashlib.blake2b(shingle.encode(), digest_size=8).digest(),
+                "little",
+            )
+            for shingle in text_shingles
+        ),
+        dtype=np.uint64,
+        count=len(text_shingles),
+    )
+    # Multiplication wraps around at 64 bits, and the top bits are kept.
+    permuted = hashes[:, np.newaxis] * _MULTIPLIERS + _INCREMENTS
+
+    return (permuted >> np.uint64(32)).min(axis=0)
+
+
+def lsh_buckets(signature: npt.NDArray[np.uint64]) -> list[int]:
+    """
+    Hash each band of a signature to a bucket.
+
+    The band number is part of each hash, so equal values in different
+    bands fall in different buckets.
+    """
+    return [
+        int.from_bytes(
+            hashlib.blake2b(
+                band_number.to_bytes(2, "little") + band.tobytes(),
+                digest_size=8,
+            ).digest(),
+            "little",
+        )
+        for band_number, band in enumerate(
+            signature.reshape(LSH_BAND_COUNT, -1),
+        )
+    ]
+
+
+def issue_lsh_buckets(title: str, description: str) -> list[int]:
+    """
+    Return LSH buckets for the shingles of an issue title and description.
+
+    Issues without any tokens have no buckets, so they are never paired.
+    """
+    signature = minhash_signature(shingles(title) | shingles(description))
+
+    return [] if signature is None else lsh_buckets(signature)
@@ -0,0 +1,511 @@
+import datetime
+import itertools
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import Any, Self
+
+import numpy as np
+import numpy.typing as npt
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .clickhouse import SimilarIssueMatch
+from .encoder import (
+    ENCODER_VERSION,
+    VECTOR_SIZE,
+    CompactVector,
+    SparseVector,
+)
+from .issue import (
+    Issue,
+    IssueComment,
+    IssueEvent,
+    IssueEventType,
+    Project,
+    SourceSystemType,
+    SyncCheckpoint,
+)
+from .key_set import KeySet, ProjectKeys
+from .similarity_matrix import IssueVectors, find_similar_vectors
+
+_VECTOR_TYPE: Any = pa.list_(pa.float32(), VECTOR_SIZE)  # pyright: ignore[reportUnknownVariableType]
+_TIMESTAMP_TYPE: Any = pa.timestamp("us", tz="UTC")  # pyright: ignore[reportUnknownVariableType]
+
+ISSUE_SCHEMA: Any = pa.schema(  # pyright: ignore[reportUnknownVariableType]
+    [
+        ("id", pa.uint64()),
+        ("parent_id", pa.uint64()),
+        ("assignee_username", pa.string()),
+        ("title", pa.string()),
+        ("title_vector", _VECTOR_TYPE),
+        ("description", pa.string()),
+        ("description_vector", _VECTOR_TYPE),
+        ("labels", pa.list_(pa.string())),
+        ("lsh_buckets", pa.list_(pa.uint64())),
+        ("created_at", _TIMESTAMP_TYPE),
+        ("encoder_version", pa.string()),
+    ],
+)
+ISSUE_COMMENT_SCHEMA: Any = pa.schema(  # pyright: ignore[reportUnknownVariableType]
+    [
+        ("issue_id", pa.uint64()),
+        ("id", pa.uint64()),
+        ("username", pa.string()),
+        ("body", pa.string()),
+        ("body_vector", _VECTOR_TYPE),
+        ("created_at", _TIMESTAMP_TYPE),
+        ("encoder_version", pa.string()),
+    ],
+)
+ISSUE_EVENT_SCHEMA: Any = pa.schema(  # pyright: ignore[reportUnknownVariableType]
+    [
+        ("id", pa.uint64()),
+        ("related_object_id", pa.uint64()),
+        ("parent_id", pa.uint64()),
+        ("type", pa.uint8()),
+        ("assignee_username", pa.string()),
+        ("timestamp", _TIMESTAMP_TYPE),
+    ],
+)
+_SCHEMAS: dict[str, Any] = {
+    "issues": ISSUE_SCHEMA,
+    "issue_comments": ISSUE_COMMENT_SCHEMA,
+    "issue_events": ISSUE_EVENT_SCHEMA,
+}
+# Loaders for different projects can share a sync state file.
+_SYNC_STATE_LOCK = threading.Lock()
+# Events which open or close an issue.
+_STATE_EVENT_TYPES = (
+    IssueEventType.CREATED,
+    IssueEventType.CLOSED,
+    IssueEventType.REOPENED,
+)
+
+
+class ParquetStorage:
+    """
+    Store and search issues in Parquet files, without a database server.
+
+    Each table is a directory partitioned by project, like
+    ``issues/source_system=GITHUB/project_owner=o/project_name=n/``, and
+    every flush writes one file per table and project. Files are read with
+    memory mapping, so vectors are not copied until they are compared.
+    Compact and sparse vectors are not stored, as similarity searches read
+    whole vectors.
+    """
+
+    def __init__(self, path: str | Path, batch_size: int = 10_000) -> None:
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self._buffers: dict[tuple[str, Project], list[dict[str, Any]]] = {}
+        self._file_numbers = itertools.count()
+        # The number of rows written to each table.
+        self.written_row_counts: dict[str, int] = {}
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    @property
+    def pending_row_count(self) -> int:
+        return sum(len(rows) for rows in self._buffers.values())
+
+    def project_path(self, table: str, project: Project) -> Path:
+        return (
+            self.path
+            / table
+            / f"source_system={project.source_system.name}"
+            / f"project_owner={project.owner}"
+            / f"project_name={project.name}"
+        )
+
+    def _add_row(
+        self,
+        table: str,
+        project: Project,
+        row: dict[str, Any],
+    ) -> None:
+        self._buffers.setdefault((table, project), []).append(row)
+
+        if self.pending_row_count >= self.batch_size:
+            self.flush()
+
+    def add_issue(
+        self,
+        issue: Issue,
+        title_vector: Sequence[float],
+        description_vector: Sequence[float],
+        compact_vectors: tuple[CompactVector, CompactVector] | None = None,
+        sparse_vectors: tuple[SparseVector, SparseVector] | None = None,
+        lsh_buckets: Sequence[int] | None = None,
+    ) -> None:
+        self._add_row(
+            "issues",
+            issue.project,
+            {
+                "id": issue.id,
+                "parent_id": issue.parent_id,
+                "assignee_username": issue.assignee_username,
+                "title": issue.title,
+                "title_vector": title_vector,
+                "description": issue.description,
+                "description_vector": description_vector,
+                "labels": issue.labels,
+                "lsh_buckets": lsh_buckets or [],
+                "created_at": issue.created_at,
+                "encoder_version": ENCODER_VERSION,
+            },
+        )
+
+    def add_issue_comment(
+        self,
+        issue_comment: IssueComment,
+        body_vector: Sequence[float],
+        body_compact: CompactVector | None = None,
+        body_sparse: SparseVector | None = None,
+    ) -> None:
+        self._add_row(
+            "issue_comments",
+            issue_comment.project,
+            {
+                "issue_id": issue_comment.issue_id,
+                "id": issue_comment.id,
+                "username": issue_comment.username,
+                "body": issue_comment.body,
+                "body_vector": body_vector,
+                "created_at": issue_comment.created_at,
+                "encoder_version": ENCODER_VERSION,
+            },
+        )
+
+    def add_issue_event(self, issue_event: IssueEvent) -> None:
+        self._add_row(
+            "issue_events",
+            issue_event.project,
+            {
+                "id": issue_event.id,
+                "related_object_id": issue_event.related_object_id,
+                "parent_id": issue_event.parent_id,
+                "type": int(issue_event.type),
+                "assignee_username": issue_event.assignee_username,
+                "timestamp": issue_event.timestamp,
+            },
+        )
+
+    def flush(self) -> None:
+        """
+        Write buffered rows to a new file for each table and project.
+        """
+        for (table, project), rows in self._buffers.items():
+            directory = self.project_path(table, project)
+            directory.mkdir(parents=True, exist_ok=True)
+            file_name = (
+                f"part-{time.time_ns()}-{os.getpid()}-"
+                f"{next(self._file_numbers)}.parquet"
+            )
+            pq.write_table(
+                pa.Table.from_pylist(  # pyright: ignore[reportUnknownArgumentType]
+                    rows,
+                    schema=_SCHEMAS[table],
+                ),
+                directory / file_name,
+                compression="zstd",
+            )
+            self.written_row_counts[table] = self.written_row_counts.get(
+                table, 0
+            ) + len(rows)
+
+        self._buffers.clear()
+
+    def close(self) -> None:
+        self.flush()
+
+    def _read(
+        self,
+        table: str,
+        project: Project,
+        columns: list[str],
+    ) -> Any:
+        """
+        Read columns for a project as an Arrow table.
+        """
+        directory = self.project_path(table, project)
+
+        if not any(directory.glob("*.parquet")):
+            return _SCHEMAS[table].empty_table().select(columns)
+
+        return pq.read_table(  # pyright: ignore[reportUnknownVariableType]
+            directory,
+            columns=columns,
+            schema=_SCHEMAS[table],
+            memory_map=True,
+        )
+
+    def _read_arrays(
+        self,
+        table: str,
+        project: Project,
+        columns: list[str],
+    ) -> list[npt.NDArray[Any]]:
+        data = self._read(table, project, columns)
+
+        return [data.column(column).to_numpy() for column in columns]
+
+    def _load_key_set(
+        self,
+        table: str,
+        project: Project,
+        columns: list[str],
+    ) -> KeySet:
+        key_set = KeySet(len(columns))
+        keys = np.column_stack(
+            [
+                array.astype(np.uint64)
+                for array in self._read_arrays(table, project, columns)
+            ],
+        )
+
+        if len(keys):
+            # Unique rows come out sorted column by column.
+            keys = np.unique(keys, axis=0)
+            key_set.extend_sorted([column.tolist() for column in keys.T])
+
+        return key_set
+
+    def load_project_keys(self, project: Project) -> ProjectKeys:
+        return ProjectKeys(
+            project=project,
+            issues=self._load_key_set("issues", project, ["id"]),
+            issue_comments=self._load_key_set(
+                "issue_comments",
+                project,
+                ["issue_id", "id"],
+            ),
+            issue_events=self._load_key_set(
+                "issue_events",
+                project,
+                ["id", "related_object_id", "type"],
+            ),
+            closed_issues=self._load_closed_issues(project),
+        )
+
+    def _load_closed_issues(self, project: Project) -> KeySet:
+        key_set = KeySet(1)
+        # IDs come out sorted from the state events.
+        key_set.extend_sorted(
+            [self._issue_ids_by_state(project, closed=True).tolist()],
+        )
+
+        return key_set
+
+    def _load_state(self, name: str) -> dict[str, Any]:
+        try:
+            return json.loads((self.path / name).read_text("utf-8"))
+        except FileNotFoundError:
+            return {}
+
+    def _update_state(self, name: str, key: str, value: Any) -> None:
+        """
+        Set a value in a JSON state file, or remove it when ``None``.
+        """
+        with _SYNC_STATE_LOCK:
+            state = self._load_state(name)
+
+            if value is None:
+                state.pop(key, None)
+            else:
+                state[key] = value
+
+            self.path.mkdir(parents=True, exist_ok=True)
+            temporary_path = (self.path / name).with_suffix(".tmp")
+            temporary_path.write_text(json.dumps(state), "utf-8")
+            # Replacing the file is atomic, so it is never left half written.
+            temporary_path.replace(self.path / name)
+
+    @staticmethod
+    def _sync_state_key(project: Project) -> str:
+        return f"{project.source_system.name}/{project.owner}/{project.name}"
+
+    def get_sync_watermark(
+        self,
+        project: Project,
+    ) -> datetime.datetime | None:
+        updated_at = self._load_state("sync_state.json").get(
+            self._sync_state_key(project),
+        )
+
+        if updated_at is None:
+            return None
+
+        return datetime.datetime.fromisoformat(updated_at)
+
+    def set_sync_watermark(
+        self,
+        project: Project,
+        updated_at: datetime.datetime,
+    ) -> None:
+        self._update_state(
+            "sync_state.json",
+            self._sync_state_key(project),
+            updated_at.isoformat(),
+        )
+
+    def get_sync_checkpoint(self, project: Project) -> SyncCheckpoint | None:
+        data = self._load_state("sync_checkpoints.json").get(
+            self._sync_state_key(project),
+        )
+
+        if data is None:
+            return None
+
+        def parse_time(value: str | None) -> datetime.datetime | None:
+            return datetime.datetime.fromisoformat(value) if value else None
+
+        return SyncCheckpoint(
+            since=parse_time(data["since"]),
+            page=data["page"],
+            loaded_issue_ids=tuple(data["loaded_issue_ids"]),
+            updated_at=parse_time(data["updated_at"]),
+            cursor=data.get("cursor"),
+        )
+
+    def set_sync_checkpoint(
+        self,
+        project: Project,
+        checkpoint: SyncCheckpoint | None,
+    ) -> None:
+        def format_time(value: datetime.datetime | None) -> str | None:
+            return value.isoformat() if value is not None else None
+
+        self._update_state(
+            "sync_checkpoints.json",
+            self._sync_state_key(project),
+            None
+            if checkpoint is None
+            else {
+                "since": format_time(checkpoint.since),
+                "page": checkpoint.page,
+                "loaded_issue_ids": checkpoint.loaded_issue_ids,
+                "updated_at": format_time(checkpoint.updated_at),
+                "cursor": checkpoint.cursor,
+            },
+        )
+
+    def projects(self) -> list[Project]:
+        """
+        Return every project with issues stored, in order.
+        """
+        return sorted(
+            Project(
+                source_system=SourceSystemType[
+                    source_path.name.partition("=")[2]
+                ],
+                owner=owner_path.name.partition("=")[2],
+                name=name_path.name.partition("=")[2],
+            )
+            for source_path in (self.path / "issues").glob("source_system=*")
+            for owner_path in source_path.glob("project_owner=*")
+            for name_path in owner_path.glob("project_name=*")
+        )
+
+    def _issue_ids_by_state(
+        self,
+        project: Project,
+        *,
+        closed: bool,
+    ) -> npt.NDArray[np.uint64]:
+        """
+        Return the IDs of issues whose latest state event closed them, or
+        opened them.
+        """
+        ids, types, timestamps = self._read_arrays(
+            "issue_events",
+            project,
+            ["id", "type", "timestamp"],
+        )
+        is_state_event = np.isin(types, [int(t) for t in _STATE_EVENT_TYPES])
+        ids = ids[is_state_event]
+        types = types[is_state_event]
+        # Sort by ID, then time, and keep the last event for each ID.
+        order = np.lexsort((timestamps[is_state_event], ids))
+        ids = ids[order]
+        types = types[order]
+        is_last = np.append(ids[1:] != ids[:-1], True) if len(ids) else ids
+        is_closed = types[is_last] == int(IssueEventType.CLOSED)
+        state_ids = ids[is_last][is_closed if closed else ~is_closed]
+
+        return state_ids.astype(np.uint64)
+
+    def load_issue_vectors(self, project: Project) -> IssueVectors:
+        """
+        Load the vectors for the open issues in a project.
+        """
+        issues = self._read(
+            "issues",
+            project,
+            ["id", "title", "title_vector", "description_vector"],
+        )
+        ids: npt.NDArray[np.uint64] = issues.column("id").to_numpy()
+        is_open = np.isin(ids, self._issue_ids_by_state(project, closed=False))
+        titles: list[str] = issues.column("title").to_pylist()
+
+        return IssueVectors(
+            project_key=(
+                project.source_system.name,
+                project.owner,
+                project.name,
+            ),
+            ids=ids[is_open].astype(np.uint64),
+            titles=list(itertools.compress(titles, is_open)),
+            title_vectors=_vectors(issues.column("title_vector"))[is_open],
+            description_vectors=_vectors(
+                issues.column("description_vector"),
+            )[is_open],
+        )
+
+    def find_similar_issues(
+        self,
+        max_title_distance: float,
+        max_description_distance: float,
+        *,
+        project: tuple[str, str] | None = None,
+        top_k: int | None = None,
+    ) -> Iterator[SimilarIssueMatch]:
+        """
+        Find similar open issues one project at a time, comparing every pair
+        with `find_similar_vectors`.
+        """
+        for stored_project in self.projects():
+            if project is None or project == (
+                stored_project.owner,
+                stored_project.name,
+            ):
+                yield from find_similar_vectors(
+                    self.load_issue_vectors(stored_project),
+                    max_title_distance,
+                    max_description_distance,
+                    top_k,
+                )
+
+
+def _vectors(column: Any) -> npt.NDArray[np.float32]:
+    """
+    View a column of fixed size vectors as a matrix.
+    """
+    if column.num_chunks == 0:
+        return np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+
+    values: npt.NDArray[np.float32] = (
+        column.combine_chunks().flatten().to_numpy()
+    )
+
+    return values.reshape(-1, VECTOR_SIZE)
@@ -1,72 +1,95 @@
-import hashlib
+import datetime
 import logging
-import math
-import re
-
-from .clickhouse import (
-    get_client,
-    insert_issue,
-    insert_issue_comment,
-    insert_issue_event,
-    issue_comment_exists,
-    issue_event_exists,
-    issue_exists,
+import multiprocessing
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Self
+
+import numpy as np
+import numpy.typing as npt
+
+from .clickhouse import ClickhouseStorage, get_client
+from .encoder import (
+    EMBEDDING_CACHE,
+    TOKEN_HASH_CACHE,
+    compact_vectors,
+    configure_embedding_cache,
+    configure_token_hash_cache,
+    encode_documents,
+    encode_texts,
+    sparse_vectors,
 )
-from .issue import Issue, IssueComment, IssueEvent
+from .issue import (
+    Issue,
+    IssueComment,
+    IssueEvent,
+    IssueEventType,
+    Project,
+    SyncCheckpoint,
+)
+from .key_set import ProjectKeys
+from .minhash import issue_lsh_buckets
+from .storage import StorageBackend
 
 logger = logging.getLogger(__file__)
 logger.setLevel(logging.DEBUG)
 
-VECTOR_SIZE = 768
-EMPTY_VECTOR = [0.0] * VECTOR_SIZE
-
-
-def _split_sentences(text: str) -> list[str]:
-    return [
-        sentence
-        for sentence in re.split(r"[.!?]+\s+", text.strip())
-        if sentence
-    ]
-
-
-def _normalise_vector(vector: list[float]) -> list[float]:
-    magnitude = math.sqrt(sum(value * value for value in vector))
-    if math.isclose(magnitude, 0.0, abs_tol=1e-12):
-        return EMPTY_VECTOR.copy()
+type Vectors = npt.NDArray[np.float32]
 
-    return [value / magnitude for value in vector]
 
+def _encode_issue_batch(
+    titles: list[str],
+    descriptions: list[str],
+    *,
+    minhash: bool = False,
+) -> tuple[Vectors, Vectors, list[list[int]] | None]:
+    return (
+        encode_texts(titles),
+        encode_documents(descriptions),
+        (
+            [
+                issue_lsh_buckets(title, description)
+                for title, description in zip(
+                    titles,
+                    descriptions,
+                    strict=True,
+                )
+            ]
+            if minhash
+            else None
+        ),
+    )
 
-def encode_text(text: str) -> list[float]:
-    # Python 3.15 alpha lacks wheels for the previous ML stack, so use a
-    # deterministic hashed token vector to keep similarity scoring working.
-    vector = [0.0] * VECTOR_SIZE
 
-    for token in re.findall(r"[A-Za-z0-9_']+", text.lower()):
-        token_hash = hashlib.blake2b(
-            token.encode("utf-8"),
-            digest_size=8,
-        ).digest()
-        index = int.from_bytes(token_hash[:4], "big") % VECTOR_SIZE
-        direction = 1.0 if token_hash[4] % 2 == 0 else -1.0
-        vector[index] += direction
+def _initialise_encoding_worker(
+    token_cache_size: int,
+    token_entries: list[tuple[str, tuple[int, float]]],
+    embedding_cache_size: int,
+    embedding_cache_path: str,
+) -> None:
+    configure_token_hash_cache(token_cache_size, token_entries)
+    configure_embedding_cache(embedding_cache_size, embedding_cache_path)
 
-    return _normalise_vector(vector)
 
+def create_encoding_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    Create a process pool for encoding text.
 
-def encode_document(text: str) -> list[float]:
-    sentences = _split_sentences(text)
-    if not sentences:
-        return EMPTY_VECTOR.copy()
-
-    sentence_vectors = [encode_text(sentence) for sentence in sentences]
-    combined_vector = [0.0] * VECTOR_SIZE
-
-    for sentence_vector in sentence_vectors:
-        for index, value in enumerate(sentence_vector):
-            combined_vector[index] += value
-
-    return _normalise_vector(combined_vector)
+    Workers start with the token hashes cached so far, and the same
+    embedding cache settings as this process.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_initialise_encoding_worker,
+        initargs=(
+            TOKEN_HASH_CACHE.max_size,
+            TOKEN_HASH_CACHE.entries(),
+            EMBEDDING_CACHE.max_size,
+            str(EMBEDDING_CACHE.path or ""),
+        ),
+    )
 
 
 class ProjectProcessor:
@@ -77,40 +100,369 @@ class ProjectProcessor:
         clickhouse_username: str,
         clickhouse_password: str,
         clickhouse_database: str,
+        *,
+        batch_size: int = 10_000,
+        flush_interval: float = 60.0,
+        compression: bool | str = True,
+        encode_batch_size: int = 1_000,
+        encoding_workers: int = 0,
+        encoding_executor: Executor | None = None,
+        compact_vectors: bool = False,
+        sparse_vectors: bool = False,
+        minhash: bool = False,
+        storage: StorageBackend | None = None,
     ) -> None:
-        self.clickhouse_client = get_client(
-            host=clickhouse_host,
-            port=clickhouse_port,
-            username=clickhouse_username,
-            password=clickhouse_password,
-            database=clickhouse_database,
+        # Storage passed in is used instead of connecting to ClickHouse, and
+        # is closed with the processor.
+        self.storage = storage or ClickhouseStorage(
+            get_client(
+                host=clickhouse_host,
+                port=clickhouse_port,
+                username=clickhouse_username,
+                password=clickhouse_password,
+                database=clickhouse_database,
+                compression=compression,
+            ),
+            batch_size=batch_size,
+            flush_interval=flush_interval,
         )
+        # Keys for the project being processed, so existence checks don't
+        # need to query the database.
+        self._project_keys: ProjectKeys | None = None
+        # The number of new rows stored by this processor.
+        self.added_issue_count = 0
+        self.added_issue_comment_count = 0
+        self.added_issue_event_count = 0
+        # Rows written by the storage before this processor stored any.
+        self._initial_row_counts = dict(self.storage.written_row_counts)
+        # Checkpoints waiting for the rows stored before them to be written,
+        # with the number of rows each table will have written by then.
+        self._pending_checkpoints: deque[
+            tuple[Project, SyncCheckpoint, dict[str, int]]
+        ] = deque()
+        # Issues and comments are encoded in batches before being written.
+        self.encode_batch_size = encode_batch_size
+        # Write int8 vectors and sign signatures next to full vectors.
+        self.compact_vectors = compact_vectors
+        # Write sparse index and value arrays next to full vectors.
+        self.sparse_vectors = sparse_vectors
+        # Write MinHash LSH buckets for issues.
+        self.minhash = minhash
+        self._pending_issues: list[Issue] = []
+        self._pending_issue_comments: list[IssueComment] = []
+        # Batches being encoded, in the order they will be written.
+        self._encoding_issues: deque[
+            tuple[
+                list[Issue],
+                Future[tuple[Vectors, Vectors, list[list[int]] | None]],
+            ]
+        ] = deque()
+        self._encoding_issue_comments: deque[
+            tuple[list[IssueComment], Future[Vectors]]
+        ] = deque()
+        # Limit batches in flight, so memory doesn't grow without bound when
+        # fetching is faster than encoding.
+        self._max_encoding_batches = max(encoding_workers, 1) * 2
+        # An executor passed in can be shared between processors, and is
+        # left running when this processor is closed.
+        self._executor = encoding_executor
+        self._owns_executor = False
 
-    def store_issue(self, issue: Issue) -> None:
+        if self._executor is None and encoding_workers > 0:
+            self._executor = create_encoding_executor(encoding_workers)
+            self._owns_executor = True
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def flush(self) -> None:
         """
-        Store an issue in the database.
+        Write all buffered rows to the database.
+        """
+        self._encode_pending_issues()
+        self._encode_pending_issue_comments()
+        self._write_encoded_issues(wait=True)
+        self._write_encoded_issue_comments(wait=True)
+        self.storage.flush()
+        self._save_written_checkpoints()
+
+    def close(self) -> None:
         """
-        if not issue_exists(
-            self.clickhouse_client,
-            issue.project,
-            issue.id,
+        Flush buffered rows and close the database connection.
+        """
+        self.flush()
+
+        if self._executor is not None and self._owns_executor:
+            self._executor.shutdown()
+
+        self.storage.close()
+
+    def load_project_keys(self, project: Project) -> ProjectKeys:
+        """
+        Return the keys of rows stored for a project, loading them if needed.
+
+        Keys are only kept for one project at a time, so memory use is
+        bounded by the largest project instead of the whole database.
+        """
+        if self._project_keys is None or self._project_keys.project != project:
+            # Write buffered rows first, so they are loaded with the keys.
+            self._project_keys = None
+            self.flush()
+            self._project_keys = self.storage.load_project_keys(project)
+
+        return self._project_keys
+
+    def get_sync_watermark(self, project: Project) -> datetime.datetime | None:
+        """
+        Return the ``updated_at`` time a project was last synced up to.
+        """
+        return self.storage.get_sync_watermark(project)
+
+    def set_sync_watermark(
+        self,
+        project: Project,
+        updated_at: datetime.datetime,
+    ) -> None:
+        """
+        Record that a project is synced up to ``updated_at``.
+
+        Buffered rows are written first, so the watermark never covers rows
+        which have not been stored.
+        """
+        self.flush()
+        self.storage.set_sync_watermark(project, updated_at)
+
+    def get_sync_checkpoint(self, project: Project) -> SyncCheckpoint | None:
+        """
+        Return the checkpoint saved by an unfinished sync of a project.
+        """
+        return self.storage.get_sync_checkpoint(project)
+
+    def set_sync_checkpoint(
+        self,
+        project: Project,
+        checkpoint: SyncCheckpoint | None,
+    ) -> None:
+        """
+        Save a checkpoint for a project, or remove it with ``None``.
+
+        Checkpoints are saved once the rows stored before them have been
+        written, as the storage writes its batches, so a resumed sync never
+        skips rows which have not been stored. Rows are not flushed early.
+        """
+        if checkpoint is None:
+            # Removing a checkpoint never skips rows, so it is done at once.
+            self._pending_checkpoints = deque(
+                pending
+                for pending in self._pending_checkpoints
+                if pending[0] != project
+            )
+            self.storage.set_sync_checkpoint(project, None)
+
+            return
+
+        self._pending_checkpoints.append(
+            (project, checkpoint, self._stored_row_counts()),
+        )
+        self._save_written_checkpoints()
+
+    def _stored_row_counts(self) -> dict[str, int]:
+        """
+        Return the number of rows each table will have written once every
+        row stored so far is written.
+        """
+        return {
+            table: self._initial_row_counts.get(table, 0) + count
+            for table, count in (
+                ("issues", self.added_issue_count),
+                ("issue_comments", self.added_issue_comment_count),
+                ("issue_events", self.added_issue_event_count),
+            )
+        }
+
+    def _save_written_checkpoints(self) -> None:
+        """
+        Save the latest checkpoint for each project whose rows are written.
+        """
+        written_row_counts = self.storage.written_row_counts
+        checkpoints: dict[Project, SyncCheckpoint] = {}
+
+        while self._pending_checkpoints and all(
+            written_row_counts.get(table, 0) >= count
+            for table, count in self._pending_checkpoints[0][2].items()
         ):
-            logging.info("Adding issue: %d", issue.id)
+            project, checkpoint, _ = self._pending_checkpoints.popleft()
+            checkpoints[project] = checkpoint
+
+        for project, checkpoint in checkpoints.items():
+            self.storage.set_sync_checkpoint(project, checkpoint)
 
-            title_vector = encode_text(issue.title)
+    def _submit_encoding[**P, T](
+        self,
+        function: Callable[P, T],
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> Future[T]:
+        if self._executor is not None:
+            return self._executor.submit(function, *args, **kwargs)
 
-            if issue.description.strip():
-                description_vector = encode_document(issue.description)
-            else:
-                description_vector = EMPTY_VECTOR.copy()
+        future: Future[T] = Future()
+        future.set_result(function(*args, **kwargs))
+
+        return future
+
+    def _encode_pending_issues(self) -> None:
+        if not self._pending_issues:
+            return
+
+        issues = self._pending_issues
+        self._pending_issues = []
+        self._encoding_issues.append(
+            (
+                issues,
+                self._submit_encoding(
+                    _encode_issue_batch,
+                    [issue.title for issue in issues],
+                    [issue.description for issue in issues],
+                    minhash=self.minhash,
+                ),
+            ),
+        )
+        self._write_encoded_issues(wait=False)
+
+    def _write_encoded_issues(self, *, wait: bool) -> None:
+        """
+        Write encoded issue batches in the order they were submitted.
 
-            insert_issue(
-                self.clickhouse_client,
+        Batches are only waited for when ``wait`` is set, or when too many
+        batches are in flight.
+        """
+        while self._encoding_issues and (
+            wait
+            or self._encoding_issues[0][1].done()
+            or len(self._encoding_issues) > self._max_encoding_batches
+        ):
+            issues, future = self._encoding_issues.popleft()
+            title_vectors, description_vectors, issue_buckets = future.result()
+            issue_compact_vectors = (
+                list(
+                    zip(
+                        compact_vectors(title_vectors),
+                        compact_vectors(description_vectors),
+                        strict=True,
+                    ),
+                )
+                if self.compact_vectors
+                else [None] * len(issues)
+            )
+            issue_sparse_vectors = (
+                list(
+                    zip(
+                        sparse_vectors(title_vectors),
+                        sparse_vectors(description_vectors),
+                        strict=True,
+                    ),
+                )
+                if self.sparse_vectors
+                else [None] * len(issues)
+            )
+
+            for (
                 issue,
                 title_vector,
                 description_vector,
+                compact,
+                sparse,
+                buckets,
+            ) in zip(
+                issues,
+                title_vectors.tolist(),
+                description_vectors.tolist(),
+                issue_compact_vectors,
+                issue_sparse_vectors,
+                issue_buckets or [None] * len(issues),
+                strict=True,
+            ):
+                self.storage.add_issue(
+                    issue,
+                    title_vector,
+                    description_vector,
+                    compact,
+                    sparse,
+                    buckets,
+                )
+
+    def _encode_pending_issue_comments(self) -> None:
+        if not self._pending_issue_comments:
+            return
+
+        issue_comments = self._pending_issue_comments
+        self._pending_issue_comments = []
+        self._encoding_issue_comments.append(
+            (
+                issue_comments,
+                self._submit_encoding(
+                    encode_documents,
+                    [issue_comment.body for issue_comment in issue_comments],
+                ),
+            ),
+        )
+        self._write_encoded_issue_comments(wait=False)
+
+    def _write_encoded_issue_comments(self, *, wait: bool) -> None:
+        while self._encoding_issue_comments and (
+            wait
+            or self._encoding_issue_comments[0][1].done()
+            or len(self._encoding_issue_comments) > self._max_encoding_batches
+        ):
+            issue_comments, future = self._encoding_issue_comments.popleft()
+            body_vectors = future.result()
+            body_compact_vectors = (
+                compact_vectors(body_vectors)
+                if self.compact_vectors
+                else [None] * len(issue_comments)
+            )
+            body_sparse_vectors = (
+                sparse_vectors(body_vectors)
+                if self.sparse_vectors
+                else [None] * len(issue_comments)
             )
 
+            for issue_comment, body_vector, body_compact, body_sparse in zip(
+                issue_comments,
+                body_vectors.tolist(),
+                body_compact_vectors,
+                body_sparse_vectors,
+                strict=True,
+            ):
+                self.storage.add_issue_comment(
+                    issue_comment,
+                    body_vector,
+                    body_compact,
+                    body_sparse,
+                )
+
+    def store_issue(self, issue: Issue) -> None:
+        """
+        Store an issue in the database.
+        """
+        issue_keys = self.load_project_keys(issue.project).issues
+        key = (issue.id,)
+
+        if key not in issue_keys:
+            logging.info("Adding issue: %d", issue.id)
+
+            self._pending_issues.append(issue)
+            issue_keys.add(key)
+            self.added_issue_count += 1
+
+            if len(self._pending_issues) >= self.encode_batch_size:
+                self._encode_pending_issues()
+                self._save_written_checkpoints()
+
     def store_issue_comment(self, issue_comment: IssueComment) -> None:
         """
         Store an issue comment in the database.
@@ -118,29 +470,31 @@ class ProjectProcessor:
         Return ``True`` if the comment is stored, and ``False`` if it already
         exists.
         """
-        if not issue_comment_exists(
-            self.clickhouse_client,
+        comment_keys = self.load_project_keys(
             issue_comment.project,
-            issue_comment.issue_id,
-            issue_comment.id,
-        ):
+        ).issue_comments
+        key = (issue_comment.issue_id, issue_comment.id)
+
+        if key not in comment_keys:
             logging.info("Adding issue comment: %d", issue_comment.id)
 
-            body_vector = encode_document(issue_comment.body)
+            self._pending_issue_comments.append(issue_comment)
+            comment_keys.add(key)
+            self.added_issue_comment_count += 1
 
-            insert_issue_comment(
-                self.clickhouse_client,
-                issue_comment,
-                body_vector,
-            )
+            if len(self._pending_issue_comments) >= self.encode_batch_size:
+                self._encode_pending_issue_comments()
+                self._save_written_checkpoints()
 
     def store_issue_event(self, issue_event: IssueEvent) -> None:
-        if not issue_event_exists(
-            self.clickhouse_client,
-            issue_event.project,
+        event_keys = self.load_project_keys(issue_event.project).issue_events
+        key = (
             issue_event.id,
             issue_event.related_object_id,
-        ):
+            int(issue_event.type),
+        )
+
+        if key not in event_keys:
             logging.info(
                 "Adding issue event: (%d, %s, %d)",
                 issue_event.id,
@@ -148,7 +502,38 @@ class ProjectProcessor:
                 issue_event.related_object_id,
             )
 
-            insert_issue_event(
-                self.clickhouse_client,
-                issue_event,
-            )
+            self.storage.add_issue_event(issue_event)
+            event_keys.add(key)
+            self.added_issue_event_count += 1
+            self._save_written_checkpoints()
+
+            closed_issues = self.load_project_keys(
+                issue_event.project,
+            ).closed_issues
+
+            if issue_event.type == IssueEventType.CLOSED:
+                closed_issues.add((issue_event.id,))
+            elif issue_event.type == IssueEventType.REOPENED:
+                closed_issues.discard((issue_event.id,))
+
+    def has_issue_event(
+        self,
+        project: Project,
+        issue_id: int,
+        related_object_id: int,
+        event_type: IssueEventType,
+    ) -> bool:
+        """
+        Check if an event with the given key is stored for an issue.
+        """
+        return (
+            issue_id,
+            related_object_id,
+            int(event_type),
+        ) in self.load_project_keys(project).issue_events
+
+    def is_issue_closed(self, project: Project, issue_id: int) -> bool:
+        """
+        Check if the latest state stored for an issue is closed.
+        """
+        return (issue_id,) in self.load_project_keys(project).closed_issues
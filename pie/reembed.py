@@ -0,0 +1,380 @@
+import argparse
+import logging
+import math
+import sys
+from collections.abc import Callable, Iterable, Sequence
+from typing import Any, NamedTuple, cast
+
+from clickhouse_connect.driver.client import Client
+from clickhouse_connect.driver.summary import QuerySummary
+
+from pie.clickhouse import BatchWriter, get_client
+from pie.encoder import (
+    ENCODER_VERSION,
+    compact_vectors,
+    configure_embedding_cache,
+    encode_documents,
+    encode_texts,
+    sparse_vectors,
+)
+from pie.project_processor import Vectors
+
+from .config import load_configuration
+
+
+class ReembedTable(NamedTuple):
+    """
+    A table with vectors which can be encoded again.
+    """
+
+    name: str
+    # The columns the table is ordered by, which identify each row.
+    key_columns: tuple[str, ...]
+    # Text columns with the function to encode them with. The vectors for
+    # a "title" column are stored in "title_vector" and the matching
+    # compact and sparse columns.
+    text_columns: tuple[tuple[str, Callable[[Sequence[str]], Vectors]], ...]
+
+
+REEMBED_TABLES = (
+    ReembedTable(
+        name="issues",
+        key_columns=("source_system", "project_owner", "project_name", "id"),
+        text_columns=(
+            ("title", encode_texts),
+            ("description", encode_documents),
+        ),
+    ),
+    ReembedTable(
+        name="issue_comments",
+        key_columns=(
+            "source_system",
+            "project_owner",
+            "project_name",
+            "issue_id",
+            "id",
+        ),
+        text_columns=(("body", encode_documents),),
+    ),
+)
+
+
+def _vector_columns(text_column: str) -> tuple[str, ...]:
+    return (
+        f"{text_column}_vector",
+        f"{text_column}_vector_int8",
+        f"{text_column}_signature",
+        f"{text_column}_indices",
+        f"{text_column}_values",
+    )
+
+
+def _encode_rows(
+    table: ReembedTable,
+    column_names: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+    *,
+    compact: bool,
+    sparse: bool,
+) -> tuple[tuple[str, ...], list[tuple[Any, ...]]]:
+    """
+    Encode the text columns of rows, and add vector columns to them.
+
+    Return the new column names with the new rows.
+    """
+    new_column_names = (*column_names, "encoder_version")
+    new_columns: list[Iterable[Any]] = [[ENCODER_VERSION] * len(rows)]
+
+    for text_column, encode in table.text_columns:
+        text_index = column_names.index(text_column)
+        vectors = encode([row[text_index] for row in rows])
+        new_column_names += (f"{text_column}_vector",)
+        new_columns.append(vectors.tolist())
+
+        if compact:
+            new_column_names += _vector_columns(text_column)[1:3]
+            new_columns.extend(zip(*compact_vectors(vectors), strict=True))
+
+        if sparse:
+            new_column_names += _vector_columns(text_column)[3:]
+            new_columns.extend(zip(*sparse_vectors(vectors), strict=True))
+
+    new_values = zip(*new_columns, strict=True)
+
+    return new_column_names, [
+        (*row, *values) for row, values in zip(rows, new_values, strict=True)
+    ]
+
+
+def _missing_condition(table: ReembedTable) -> str:
+    keys = ", ".join(table.key_columns)
+
+    return f"({keys}) NOT IN (SELECT {keys} FROM {table.name}_reembed)"
+
+
+def _copy_pass(
+    client: Client,
+    writer: BatchWriter,
+    table: ReembedTable,
+    source_table: str,
+    *,
+    batch_size: int,
+    compact: bool,
+    sparse: bool,
+    force: bool,
+) -> int:
+    """
+    Copy rows from ``source_table`` which are not in the new table yet, and
+    return the count.
+    """
+    new_table = f"{table.name}_reembed"
+    keys = ", ".join(table.key_columns)
+    missing_condition = _missing_condition(table)
+    copied_count = 0
+
+    if not force:
+        # Rows which are up to date are copied without leaving ClickHouse.
+        summary = client.command(
+            f"""
+            INSERT INTO {new_table}
+            SELECT * FROM {source_table}
+            WHERE encoder_version = %s AND {missing_condition}
+            """,
+            [ENCODER_VERSION],
+        )
+
+        if isinstance(summary, QuerySummary):
+            copied_count += summary.written_rows
+
+    table_columns = client.query(
+        f"SELECT * FROM {source_table} LIMIT 0",
+    ).column_names
+    # Vectors and the encoder version are replaced.
+    replaced_columns = {"encoder_version"} | {
+        column
+        for text_column, _ in table.text_columns
+        for column in _vector_columns(text_column)
+    }
+    column_names = [
+        column for column in table_columns if column not in replaced_columns
+    ]
+
+    with client.query_row_block_stream(
+        f"""
+        SELECT {", ".join(column_names)}
+        FROM {source_table}
+        WHERE {missing_condition}
+        ORDER BY {keys}
+        """,
+        settings={"max_block_size": batch_size},
+    ) as stream:
+        for block in cast(Iterable[Sequence[Sequence[Any]]], stream):
+            new_column_names, rows = _encode_rows(
+                table,
+                column_names,
+                block,
+                compact=compact,
+                sparse=sparse,
+            )
+
+            for row in rows:
+                writer.add_row(new_table, new_column_names, row)
+
+            copied_count += len(rows)
+
+    writer.flush()
+
+    return copied_count
+
+
+def reembed_table(
+    client: Client,
+    writer: BatchWriter,
+    table: ReembedTable,
+    *,
+    batch_size: int = 1_000,
+    compact: bool = False,
+    sparse: bool = False,
+    force: bool = False,
+) -> int:
+    """
+    Encode the vectors in a table again with the current encoder.
+
+    Rows are copied in key order into ``<table>_reembed``, with new vectors
+    for rows encoded by another encoder, or for every row with ``force``.
+    Rows are read in blocks of ``batch_size``, so the table is never held
+    in memory. Rows already copied are skipped, so an interrupted run
+    resumes where it stopped. Once every row is copied, the table is
+    renamed to ``<table>_reembed_old``, so inserts into it fail, and rows
+    inserted since the last pass are copied. The new table then replaces
+    it, and the old rows are dropped. Return the number of rows copied.
+
+    ``writer`` must use another connection, as rows are written while the
+    table is being read.
+    """
+    new_table = f"{table.name}_reembed"
+    old_table = f"{table.name}_reembed_old"
+
+    if client.command(f"EXISTS TABLE {old_table}"):
+        if client.command(f"EXISTS TABLE {table.name}"):
+            # A run stopped after the new table replaced the old one.
+            client.command(f"DROP TABLE {old_table}")
+        else:
+            # A run stopped before the new table replaced the old one.
+            client.command(f"RENAME TABLE {old_table} TO {table.name}")
+
+    client.command(f"CREATE TABLE IF NOT EXISTS {new_table} AS {table.name}")
+    total_count = 0
+
+    def copy_rows(source_table: str, *, force: bool) -> int:
+        return _copy_pass(
+            client,
+            writer,
+            table,
+            source_table,
+            batch_size=batch_size,
+            compact=compact,
+            sparse=sparse,
+            force=force,
+        )
+
+    # Rows inserted while copying are picked up by another pass.
+    while pass_count := copy_rows(table.name, force=force):
+        total_count += pass_count
+        logging.info("Copied %d rows into %s", total_count, new_table)
+        force = False
+
+    # Loaders can't insert rows into the table while it is renamed, so no
+    # rows are inserted after the last pass.
+    client.command(f"RENAME TABLE {table.name} TO {old_table}")
+
+    try:
+        total_count += copy_rows(old_table, force=False)
+        missing_count = client.command(
+            f"""
+            SELECT count()
+            FROM {old_table}
+            WHERE {_missing_condition(table)}
+            """,
+        )
+
+        if missing_count:
+            raise RuntimeError(
+                f"{missing_count} rows in {table.name} were not copied "
+                f"into {new_table}",
+            )
+    except BaseException:
+        client.command(f"RENAME TABLE {old_table} TO {table.name}")
+
+        raise
+
+    client.command(f"RENAME TABLE {new_table} TO {table.name}")
+    client.command(f"DROP TABLE {old_table}")
+
+    return total_count
+
+
+class Arguments(NamedTuple):
+    config_path: str
+    # The names of the tables to encode again.
+    tables: tuple[str, ...]
+    batch_size: int
+    # Encode every row again, even when the encoder version matches.
+    force: bool
+
+
+def parse_arguments() -> Arguments:
+    parser = argparse.ArgumentParser(
+        "pie.reembed",
+        description="Encode stored vectors again with the current encoder",
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        type=str,
+        help="Path to TOML config file",
+        default="config.toml",
+    )
+    parser.add_argument(
+        "-t",
+        "--table",
+        action="append",
+        choices=[table.name for table in REEMBED_TABLES],
+        help="A table to encode again, which can be given more than once. "
+        "Defaults to every table with vectors",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=1_000,
+        help="Rows to read and encode at a time",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Encode rows again even if the encoder version is unchanged",
+    )
+
+    args = parser.parse_args()
+
+    return Arguments(
+        config_path=args.config,
+        tables=tuple(
+            args.table or [table.name for table in REEMBED_TABLES],
+        ),
+        batch_size=args.batch_size,
+        force=args.force,
+    )
+
+
+def main() -> None:
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+
+    args = parse_arguments()
+    config = load_configuration(args.config_path)
+    configure_embedding_cache(
+        config.encoding.embedding_cache_size,
+        config.encoding.embedding_cache_path,
+    )
+    clients = [
+        get_client(
+            host=config.clickhouse.host,
+            port=config.clickhouse.port,
+            username=config.clickhouse.username,
+            password=config.clickhouse.password,
+            database=config.clickhouse.database,
+            compression=config.clickhouse.compression,
+        )
+        for _ in range(2)
+    ]
+
+    with BatchWriter(
+        clients[1],
+        batch_size=config.clickhouse.batch_size,
+        flush_interval=math.inf,
+    ) as writer:
+        for table in REEMBED_TABLES:
+            if table.name in args.tables:
+                row_count = reembed_table(
+                    clients[0],
+                    writer,
+                    table,
+                    batch_size=args.batch_size,
+                    compact=config.clickhouse.compact_vectors,
+                    sparse=config.clickhouse.sparse_vectors,
+                    force=args.force,
+                )
+                logging.info(
+                    "Encoded %s again with %s: %d rows",
+                    table.name,
+                    ENCODER_VERSION,
+                    row_count,
+                )
+
+    for client in clients:
+        client.close()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()  # pragma: no cover
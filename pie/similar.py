@@ -1,7 +1,25 @@
 import argparse
-from typing import NamedTuple
+import csv
+import itertools
+import json
+import sys
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple, TextIO
 
-from pie.clickhouse import find_similar_issues, get_client
+from clickhouse_connect.driver.client import Client
+
+from pie.clickhouse import (
+    SimilarIssueMatch,
+    find_similar_issues,
+    find_similar_issues_indexed,
+    find_similar_issues_lsh,
+    find_similar_issues_prefiltered,
+    find_stored_similar_issues,
+    get_client,
+    update_similar_pairs,
+)
+from pie.similarity_matrix import find_similar_issues_matrix
+from pie.storage import open_parquet_storage
 
 from .config import load_configuration
 
@@ -10,6 +28,38 @@ class Arguments(NamedTuple):
     config_path: str
     max_title_distance: float
     max_description_distance: float
+    # "exact" compares every pair in ClickHouse, "indexed" uses the vector
+    # index, "matrix" compares every pair in process with NumPy,
+    # "incremental" compares new issues into the similar_pairs table, and
+    # "lsh" only compares issues sharing a MinHash LSH bucket. None picks
+    # "exact" for ClickHouse storage and "matrix" for Parquet files.
+    mode: str | None
+    # The number of nearest neighbours to check for each issue when indexed.
+    neighbour_count: int
+    # The most matches to output, if limited.
+    limit: int | None
+    # The most matches to output for each issue, if limited.
+    top_k_per_issue: int | None
+    # An (owner, name) project to search within, if any.
+    project: tuple[str, str] | None
+    # "text", "jsonl" or "csv".
+    output_format: str
+    # The most bits title signatures can differ by in exact mode, if
+    # pairs are prefiltered by signature.
+    max_signature_distance: int | None
+    # Read sparse vector columns in exact and matrix modes.
+    sparse: bool
+
+
+def parse_project(value: str) -> tuple[str, str]:
+    owner, separator, name = value.partition("/")
+
+    if not separator or not owner or not name:
+        raise argparse.ArgumentTypeError(
+            f"expected a project as owner/name, not {value!r}",
+        )
+
+    return owner, name
 
 
 def parse_arguments() -> Arguments:
@@ -41,20 +91,229 @@ def parse_arguments() -> Arguments:
         default=0.2,
         help="Maximum description distance",
     )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        choices=("exact", "indexed", "matrix", "incremental", "lsh"),
+        help="Compare every pair of issues in ClickHouse, search the title "
+        "vector index, compare every pair in memory, only compare new "
+        "issues into stored pairs, or only compare issues sharing an LSH "
+        "bucket. Defaults to exact, or matrix for Parquet files",
+    )
+    parser.add_argument(
+        "-k",
+        "--neighbours",
+        type=int,
+        default=10,
+        help="Nearest neighbours to check for each issue in indexed mode",
+    )
+    parser.add_argument(
+        "-l",
+        "--limit",
+        type=int,
+        help="Stop after this many matches",
+    )
+    parser.add_argument(
+        "--top-k-per-issue",
+        type=int,
+        help="Only output the nearest matches for each issue",
+    )
+    parser.add_argument(
+        "-p",
+        "--project",
+        type=parse_project,
+        help="Only search one project, given as owner/name",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=("text", "jsonl", "csv"),
+        default="text",
+        help="Output format",
+    )
+    parser.add_argument(
+        "-s",
+        "--signature-distance",
+        type=int,
+        help="In exact mode, only compare pairs whose title sign signatures "
+        "differ by at most this many bits",
+    )
+    parser.add_argument(
+        "--sparse",
+        action="store_true",
+        help="Compare sparse vectors in exact and matrix modes",
+    )
 
     # Parse the arguments and store them in a Namespace object
     args = parser.parse_args()
 
+    if args.signature_distance is not None:
+        if args.mode not in {None, "exact"}:
+            parser.error("--signature-distance only applies to --mode exact")
+
+        if args.sparse:
+            parser.error("--signature-distance can't be used with --sparse")
+
+    if args.sparse and args.mode not in {None, "exact", "matrix"}:
+        parser.error("--sparse only applies to --mode exact or matrix")
+
     return Arguments(
         config_path=args.config,
         max_title_distance=args.title_distance,
         max_description_distance=args.description_distance,
+        mode=args.mode,
+        neighbour_count=args.neighbours,
+        limit=args.limit,
+        top_k_per_issue=args.top_k_per_issue,
+        project=args.project,
+        output_format=args.format,
+        max_signature_distance=args.signature_distance,
+        sparse=args.sparse,
     )
 
 
+def parquet_argument_error(args: Arguments) -> str | None:
+    """
+    Return an error for arguments Parquet storage can't search with, if any.
+
+    Every pair of open issues in Parquet files is compared in memory, as in
+    matrix mode, with full vectors.
+    """
+    if args.mode not in {None, "matrix"}:
+        return f"--mode {args.mode} needs ClickHouse storage"
+
+    if args.max_signature_distance is not None:
+        return "--signature-distance needs ClickHouse storage"
+
+    if args.sparse:
+        return "--sparse needs ClickHouse storage"
+
+    return None
+
+
+def find_matches(
+    client: Client,
+    args: Arguments,
+) -> Iterator[SimilarIssueMatch]:
+    """
+    Find similar issues with the search mode given in the arguments.
+    """
+    match args.mode:
+        case "indexed":
+            matches = find_similar_issues_indexed(
+                client,
+                max_title_distance=args.max_title_distance,
+                max_description_distance=args.max_description_distance,
+                neighbour_count=args.neighbour_count,
+                project=args.project,
+                top_k=args.top_k_per_issue,
+            )
+        case "matrix":
+            matches = find_similar_issues_matrix(
+                client,
+                max_title_distance=args.max_title_distance,
+                max_description_distance=args.max_description_distance,
+                top_k=args.top_k_per_issue,
+                project=args.project,
+                sparse=args.sparse,
+            )
+        case "incremental":
+            update_similar_pairs(
+                client,
+                max_title_distance=args.max_title_distance,
+                max_description_distance=args.max_description_distance,
+            )
+            matches = find_stored_similar_issues(
+                client,
+                max_title_distance=args.max_title_distance,
+                max_description_distance=args.max_description_distance,
+                project=args.project,
+                top_k=args.top_k_per_issue,
+            )
+        case "lsh":
+            matches = find_similar_issues_lsh(
+                client,
+                max_title_distance=args.max_title_distance,
+                max_description_distance=args.max_description_distance,
+                project=args.project,
+                top_k=args.top_k_per_issue,
+            )
+        case _ if args.max_signature_distance is not None:
+            matches = find_similar_issues_prefiltered(
+                client,
+                max_title_distance=args.max_title_distance,
+                max_description_distance=args.max_description_distance,
+                max_signature_distance=args.max_signature_distance,
+                project=args.project,
+                top_k=args.top_k_per_issue,
+            )
+        case _:
+            matches = find_similar_issues(
+                client,
+                max_title_distance=args.max_title_distance,
+                max_description_distance=args.max_description_distance,
+                project=args.project,
+                top_k=args.top_k_per_issue,
+                sparse=args.sparse,
+            )
+
+    return itertools.islice(matches, args.limit)
+
+
+def write_matches(
+    matches: Iterable[SimilarIssueMatch],
+    output_format: str,
+    file: TextIO,
+) -> None:
+    """
+    Write matches to a file as they are found.
+    """
+    match output_format:
+        case "jsonl":
+            for match in matches:
+                file.write(json.dumps(match._asdict()) + "\n")
+        case "csv":
+            writer = csv.writer(file)
+            writer.writerow(SimilarIssueMatch._fields)
+            writer.writerows(matches)
+        case _:
+            for match in matches:
+                print(
+                    match.issue1_id,
+                    "->",
+                    match.issue2_id,
+                    f"({match.title_distance:0.2f}, "
+                    f"{match.description_distance:0.2f})",
+                    file=file,
+                )
+                print("Title 1:", match.issue1_title, file=file)
+                print("Title 2:", match.issue2_title, file=file)
+                print(file=file)
+
+
 def main() -> None:
     args = parse_arguments()
     config = load_configuration(args.config_path)
+
+    if config.storage.backend == "parquet":
+        if error := parquet_argument_error(args):
+            sys.exit(error)
+
+        storage = open_parquet_storage(config.storage.path)
+        matches = storage.find_similar_issues(
+            max_title_distance=args.max_title_distance,
+            max_description_distance=args.max_description_distance,
+            project=args.project,
+            top_k=args.top_k_per_issue,
+        )
+        write_matches(
+            itertools.islice(matches, args.limit),
+            args.output_format,
+            sys.stdout,
+        )
+
+        return
+
     client = get_client(
         host=config.clickhouse.host,
         port=config.clickhouse.port,
@@ -63,23 +322,7 @@ def main() -> None:
         database=config.clickhouse.database,
     )
 
-    for result in find_similar_issues(
-        client,
-        max_title_distance=args.max_title_distance,
-        max_description_distance=args.max_description_distance,
-    ):
-        title_distance = result.title_distance
-        description_distance = result.description_distance
-
-        print(
-            result.issue1_id,
-            "->",
-            result.issue2_id,
-            f"({title_distance:0.2f}, {description_distance:0.2f})",
-        )
-        print("Title 1:", result[2])
-        print("Title 2:", result[3])
-        print()
+    write_matches(find_matches(client, args), args.output_format, sys.stdout)
 
 
 if __name__ == "__main__":  # pragma: no cover
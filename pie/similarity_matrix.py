@@ -0,0 +1,300 @@
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any, NamedTuple, cast
+
+import numpy as np
+import numpy.typing as npt
+from clickhouse_connect.driver.client import Client
+
+from .clickhouse import SimilarIssueMatch, project_filter
+from .encoder import dense_vectors
+from .project_processor import Vectors
+
+
+class IssueVectors(NamedTuple):
+    """
+    The vectors for the open issues in one project, as matrices.
+    """
+
+    # The project the issues belong to, as stored in ClickHouse.
+    project_key: tuple[str, str, str]
+    # Issue IDs, in the same order as the rows of each matrix.
+    ids: npt.NDArray[np.uint64]
+    titles: list[str]
+    # A row for each title vector.
+    title_vectors: Vectors
+    # A row for each description vector.
+    description_vectors: Vectors
+
+
+class _IssueVectorsBuilder:
+    """
+    Collect rows for one project, converting vectors to arrays as it goes.
+
+    With ``sparse``, vectors are added as (indices, values) pairs.
+    """
+
+    def __init__(
+        self,
+        project_key: tuple[str, str, str],
+        *,
+        sparse: bool = False,
+    ) -> None:
+        self.project_key = project_key
+        self.sparse = sparse
+        self.ids: list[int] = []
+        self.titles: list[str] = []
+        self._title_rows: list[Any] = []
+        self._description_rows: list[Any] = []
+        self._title_chunks: list[Vectors] = []
+        self._description_chunks: list[Vectors] = []
+
+    def add(
+        self,
+        issue_id: int,
+        title: str,
+        title_vector: Any,
+        description_vector: Any,
+    ) -> None:
+        self.ids.append(issue_id)
+        self.titles.append(title)
+        self._title_rows.append(title_vector)
+        self._description_rows.append(description_vector)
+
+    def convert_pending(self) -> None:
+        """
+        Convert vectors added so far to float32, to free the Python lists.
+        """
+        if self._title_rows:
+            self._title_chunks.append(self._to_matrix(self._title_rows))
+            self._description_chunks.append(
+                self._to_matrix(self._description_rows),
+            )
+            self._title_rows = []
+            self._description_rows = []
+
+    def _to_matrix(self, rows: list[Any]) -> Vectors:
+        if self.sparse:
+            return dense_vectors(
+                [indices for indices, _ in rows],
+                [values for _, values in rows],
+            )
+
+        return np.asarray(rows, dtype=np.float32)
+
+    def build(self) -> IssueVectors:
+        self.convert_pending()
+
+        return IssueVectors(
+            project_key=self.project_key,
+            ids=np.asarray(self.ids, dtype=np.uint64),
+            titles=self.titles,
+            title_vectors=np.concatenate(self._title_chunks),
+            description_vectors=np.concatenate(self._description_chunks),
+        )
+
+
+def iter_open_issue_vectors(
+    client: Client,
+    project: tuple[str, str] | None = None,
+    *,
+    sparse: bool = False,
+) -> Iterator[IssueVectors]:
+    """
+    Stream the vectors for open issues, one project at a time.
+
+    Only one project's vectors are held in memory at once. With ``sparse``,
+    vectors are read from the sparse columns, which transfers far less
+    data, and expanded in memory.
+    """
+    builder: _IssueVectorsBuilder | None = None
+    project_condition, project_parameters = project_filter("issue", project)
+    vector_columns = (
+        """
+        (issue.title_indices, issue.title_values),
+        (issue.description_indices, issue.description_values)
+        """
+        if sparse
+        else "issue.title_vector, issue.description_vector"
+    )
+
+    with client.query_row_block_stream(
+        f"""
+        SELECT
+            issue.source_system,
+            issue.project_owner,
+            issue.project_name,
+            issue.id,
+            issue.title,
+            {vector_columns}
+        FROM issues AS issue
+        INNER JOIN (
+            SELECT source_system, project_owner, project_name, id
+            FROM issue_states FINAL
+            WHERE state = 'OPEN'
+        ) AS open_issue
+        ON open_issue.source_system = issue.source_system
+        AND open_issue.project_owner = issue.project_owner
+        AND open_issue.project_name = issue.project_name
+        AND open_issue.id = issue.id
+        WHERE 1 {project_condition}
+        ORDER BY
+            issue.source_system,
+            issue.project_owner,
+            issue.project_name,
+            issue.id
+        """,
+        project_parameters,
+    ) as stream:
+        for block in cast(Iterable[Sequence[Sequence[Any]]], stream):
+            for (
+                source_system,
+                owner,
+                name,
+                issue_id,
+                title,
+                title_vector,
+                description_vector,
+            ) in block:
+                project_key = (source_system, owner, name)
+
+                if builder is None or builder.project_key != project_key:
+                    if builder is not None:
+                        yield builder.build()
+
+                    builder = _IssueVectorsBuilder(project_key, sparse=sparse)
+
+                builder.add(issue_id, title, title_vector, description_vector)
+
+            if builder is not None:
+                builder.convert_pending()
+
+    if builder is not None:
+        yield builder.build()
+
+
+def _cosine_distances(
+    block_vectors: Vectors,
+    vectors: Vectors,
+    block_has_vector: npt.NDArray[np.bool_],
+    has_vector: npt.NDArray[np.bool_],
+) -> Vectors:
+    """
+    Compute cosine distances for unit vectors with a matrix multiply.
+
+    Zero vectors have no direction, so their distances are infinite.
+    """
+    distances = 1.0 - block_vectors @ vectors.T
+    distances[~block_has_vector] = np.inf
+    distances[:, ~has_vector] = np.inf
+
+    return distances
+
+
+def find_similar_vectors(
+    issue_vectors: IssueVectors,
+    max_title_distance: float,
+    max_description_distance: float,
+    top_k: int | None = 10,
+    block_size: int = 1024,
+) -> Iterator[SimilarIssueMatch]:
+    """
+    Find similar issues in one project with blocked matrix multiplies.
+
+    Stored vectors are unit-normalised, so dot products are cosine
+    similarities. Distances are computed for ``block_size`` issues against
+    the whole project at once, so memory use grows with the block size
+    instead of with the square of the number of issues. Up to ``top_k``
+    matches, or every match when it is ``None``, are yielded for each
+    issue, nearest title first.
+    """
+    title_vectors = issue_vectors.title_vectors
+    description_vectors = issue_vectors.description_vectors
+    issue_count = len(issue_vectors.ids)
+    match_count = issue_count if top_k is None else min(top_k, issue_count)
+
+    if match_count == 0:
+        return
+
+    has_title = np.any(title_vectors != 0, axis=1)
+    has_description = np.any(description_vectors != 0, axis=1)
+
+    for start in range(0, issue_count, block_size):
+        end = min(start + block_size, issue_count)
+        title_distances = _cosine_distances(
+            title_vectors[start:end],
+            title_vectors,
+            has_title[start:end],
+            has_title,
+        )
+        description_distances = _cosine_distances(
+            description_vectors[start:end],
+            description_vectors,
+            has_description[start:end],
+            has_description,
+        )
+        block_rows = np.arange(end - start)
+        # Issues never match themselves.
+        title_distances[block_rows, block_rows + start] = np.inf
+        title_distances[
+            (title_distances > max_title_distance)
+            | (description_distances > max_description_distance)
+        ] = np.inf
+
+        nearest = np.argpartition(
+            title_distances,
+            match_count - 1,
+            axis=1,
+        )[:, :match_count]
+        nearest_distances = np.take_along_axis(title_distances, nearest, 1)
+        order = np.argsort(nearest_distances, axis=1, kind="stable")
+        nearest = np.take_along_axis(nearest, order, 1)
+
+        for row, columns in enumerate(nearest):
+            issue_index = start + row
+
+            for column in columns:
+                title_distance = title_distances[row, column]
+
+                if not np.isfinite(title_distance):
+                    break
+
+                yield SimilarIssueMatch(
+                    int(issue_vectors.ids[issue_index]),
+                    int(issue_vectors.ids[column]),
+                    issue_vectors.titles[issue_index],
+                    issue_vectors.titles[column],
+                    float(title_distance),
+                    float(description_distances[row, column]),
+                    issue_vectors.project_key[1],
+                    issue_vectors.project_key[2],
+                )
+
+
+def find_similar_issues_matrix(
+    client: Client,
+    max_title_distance: float,
+    max_description_distance: float,
+    top_k: int | None = 10,
+    block_size: int = 1024,
+    *,
+    project: tuple[str, str] | None = None,
+    sparse: bool = False,
+) -> Iterator[SimilarIssueMatch]:
+    """
+    Find similar open issues in every project in process with NumPy.
+
+    Each project's vectors are read from ClickHouse once, and all pairs are
+    compared with `find_similar_vectors`.
+    """
+    for issue_vectors in iter_open_issue_vectors(
+        client,
+        project,
+        sparse=sparse,
+    ):
+        yield from find_similar_vectors(
+            issue_vectors,
+            max_title_distance,
+            max_description_distance,
+            top_k,
+            block_size,
+        )
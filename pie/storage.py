@@ -0,0 +1,107 @@
+import datetime
+from collections.abc import Iterator, Sequence
+from typing import Protocol
+
+from .clickhouse import SimilarIssueMatch
+from .encoder import CompactVector, SparseVector
+from .issue import Issue, IssueComment, IssueEvent, Project, SyncCheckpoint
+from .key_set import ProjectKeys
+
+
+class StorageBackend(Protocol):
+    """
+    Somewhere to store issues, comments and events, and search them.
+
+    Rows added may be buffered until the storage is flushed or closed.
+    """
+
+    # The number of rows written to each table, which only grows.
+    written_row_counts: dict[str, int]
+
+    def load_project_keys(self, project: Project) -> ProjectKeys:
+        """
+        Load the keys of every row stored for a project.
+        """
+        ...
+
+    def add_issue(
+        self,
+        issue: Issue,
+        title_vector: Sequence[float],
+        description_vector: Sequence[float],
+        compact_vectors: tuple[CompactVector, CompactVector] | None = None,
+        sparse_vectors: tuple[SparseVector, SparseVector] | None = None,
+        lsh_buckets: Sequence[int] | None = None,
+    ) -> None: ...
+
+    def add_issue_comment(
+        self,
+        issue_comment: IssueComment,
+        body_vector: Sequence[float],
+        body_compact: CompactVector | None = None,
+        body_sparse: SparseVector | None = None,
+    ) -> None: ...
+
+    def add_issue_event(self, issue_event: IssueEvent) -> None: ...
+
+    def get_sync_watermark(
+        self,
+        project: Project,
+    ) -> datetime.datetime | None: ...
+
+    def set_sync_watermark(
+        self,
+        project: Project,
+        updated_at: datetime.datetime,
+    ) -> None: ...
+
+    def get_sync_checkpoint(self, project: Project) -> SyncCheckpoint | None:
+        """
+        Return the checkpoint saved by an unfinished sync of a project.
+        """
+        ...
+
+    def set_sync_checkpoint(
+        self,
+        project: Project,
+        checkpoint: SyncCheckpoint | None,
+    ) -> None:
+        """
+        Save a checkpoint for a project, or remove it with ``None``.
+        """
+        ...
+
+    def find_similar_issues(
+        self,
+        max_title_distance: float,
+        max_description_distance: float,
+        *,
+        project: tuple[str, str] | None = None,
+        top_k: int | None = None,
+    ) -> Iterator[SimilarIssueMatch]:
+        """
+        Find pairs of similar open issues, nearest titles first for each
+        issue.
+        """
+        ...
+
+    def flush(self) -> None: ...
+
+    def close(self) -> None: ...
+
+
+def open_parquet_storage(
+    path: str,
+    batch_size: int = 10_000,
+) -> StorageBackend:
+    """
+    Open storage in Parquet files, which needs the optional pyarrow package.
+    """
+    try:
+        from .parquet_storage import ParquetStorage
+    except ImportError as error:
+        raise RuntimeError(
+            "Parquet storage needs pyarrow, installed with pie[parquet]",
+        ) from error
+
+    return ParquetStorage(path, batch_size)
@@ -0,0 +1,80 @@
+from collections.abc import Sequence
+from typing import Any, NamedTuple
+
+
+class FakeStream:
+    """
+    A stand-in for a ClickHouse block stream, which yields fixed blocks.
+    """
+
+    def __init__(self, blocks: list[Any]) -> None:
+        self.blocks = blocks
+
+    def __enter__(self) -> list[Any]:
+        return self.blocks
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+
+class FakeQueryResult(NamedTuple):
+    """
+    A stand-in for the result of a ClickHouse query.
+    """
+
+    result_rows: list[tuple[Any, ...]]
+
+
+class FakeClickhouseClient:
+    """
+    An in-memory stand-in for a ClickHouse client which records inserts.
+
+    This runs the storage path without a server, for tests and benchmarks.
+    Queries find no rows, as if the database were empty. Rows inserted one
+    at a time, such as sync state, are recorded column by column like bulk
+    inserts.
+    With ``record_rows`` off, inserted rows are only counted, so memory use
+    doesn't grow with the rows written.
+    """
+
+    def __init__(self, *, record_rows: bool = True) -> None:
+        self.record_rows = record_rows
+        self.inserts: list[tuple[str, Sequence[Sequence[Any]], Any]] = []
+        # Tables inserted into row by row instead of column by column.
+        self.row_oriented_tables: set[str] = set()
+        self.inserted_row_count = 0
+        self.closed = False
+
+    def insert(
+        self,
+        table: str,
+        data: Sequence[Sequence[Any]],
+        column_names: Sequence[str],
+        *,
+        column_oriented: bool = False,
+    ) -> None:
+        if not column_oriented:
+            self.row_oriented_tables.add(table)
+            data = [list(column) for column in zip(*data, strict=True)]
+
+        self.inserted_row_count += len(data[0]) if data else 0
+
+        if self.record_rows:
+            self.inserts.append((table, data, column_names))
+
+    def inserted_rows(self, table: str) -> list[dict[str, Any]]:
+        return [
+            dict(zip(column_names, row, strict=True))
+            for insert_table, columns, column_names in self.inserts
+            if insert_table == table
+            for row in zip(*columns, strict=True)
+        ]
+
+    def query(self, *args: Any, **kwargs: Any) -> FakeQueryResult:
+        return FakeQueryResult([])
+
+    def query_column_block_stream(self, *args: Any) -> FakeStream:
+        return FakeStream([])
+
+    def close(self) -> None:
+        self.closed = True
@@ -9,8 +9,27 @@ CREATE TABLE issues (
     title_vector Array(Float32),
     description String,
     description_vector Array(Float32),
+    -- Optional compact vectors, written when compact_vectors is set.
+    title_vector_int8 Array(Int8),
+    title_signature FixedString(96),
+    description_vector_int8 Array(Int8),
+    description_signature FixedString(96),
+    -- Optional sparse vectors, written when sparse_vectors is set.
+    title_indices Array(UInt16),
+    title_values Array(Float32),
+    description_indices Array(UInt16),
+    description_values Array(Float32),
+    -- Optional MinHash LSH buckets, written when minhash is set.
+    lsh_buckets Array(UInt64),
     labels Array(String),
-    created_at DateTime64
+    created_at DateTime64,
+    -- The name and version of the encoder which produced the vectors.
+    encoder_version LowCardinality(String),
+    -- When the row was inserted, for finding new issues.
+    inserted_at DateTime64(3, 'UTC') DEFAULT now64(3),
+    -- An HNSW index for approximate nearest neighbour search on titles.
+    INDEX title_vector_index title_vector
+    TYPE vector_similarity('hnsw', 'cosineDistance', 768)
 )
 ENGINE = MergeTree()
 ORDER BY (source_system, project_owner, project_name, id)
@@ -25,7 +44,12 @@ CREATE TABLE issue_comments (
     username LowCardinality(String),
     body String,
     body_vector Array(Float32),
-    created_at DateTime64
+    body_vector_int8 Array(Int8),
+    body_signature FixedString(96),
+    body_indices Array(UInt16),
+    body_values Array(Float32),
+    created_at DateTime64,
+    encoder_version LowCardinality(String)
 )
 ENGINE = MergeTree()
 ORDER BY (source_system, project_owner, project_name, issue_id, id)
@@ -53,3 +77,82 @@ CREATE TABLE issue_events (
 ENGINE = MergeTree()
 ORDER BY (source_system, project_owner, project_name, id, related_object_id, timestamp)
 PARTITION BY source_system;
+
+-- The latest open or closed state for each issue, maintained from
+-- issue_events by issue_states_mv. Query it with FINAL.
+CREATE TABLE issue_states (
+    source_system Enum8('GITHUB' = 0, 'JIRA' = 1),
+    project_owner LowCardinality(String),
+    project_name LowCardinality(String),
+    id UInt64,
+    state Enum8('OPEN' = 0, 'CLOSED' = 1),
+    updated_at DateTime64
+)
+ENGINE = ReplacingMergeTree(updated_at)
+ORDER BY (source_system, project_owner, project_name, id);
+
+CREATE MATERIALIZED VIEW issue_states_mv TO issue_states AS
+SELECT
+    source_system,
+    project_owner,
+    project_name,
+    id,
+    if(type = 'CLOSED', 'CLOSED', 'OPEN') AS state,
+    timestamp AS updated_at
+FROM issue_events
+WHERE type IN ('CREATED', 'CLOSED', 'REOPENED');
+
+-- Pairs of similar issues, with issue1_id < issue2_id.
+CREATE TABLE similar_pairs (
+    source_system Enum8('GITHUB' = 0, 'JIRA' = 1),
+    project_owner LowCardinality(String),
+    project_name LowCardinality(String),
+    issue1_id UInt64,
+    issue2_id UInt64,
+    title_distance Float32,
+    description_distance Float32,
+    found_at DateTime64(3, 'UTC')
+)
+ENGINE = ReplacingMergeTree(found_at)
+ORDER BY (source_system, project_owner, project_name, issue1_id, issue2_id);
+
+-- The time up to which inserted issues have been compared into
+-- similar_pairs, for each pair of distance thresholds.
+CREATE TABLE similar_pairs_state (
+    max_title_distance Float64,
+    max_description_distance Float64,
+    inserted_at DateTime64(3, 'UTC'),
+    computed_at DateTime64(3, 'UTC')
+)
+ENGINE = ReplacingMergeTree(computed_at)
+ORDER BY (max_title_distance, max_description_distance);
+
+CREATE TABLE sync_state (
+    source_system Enum8('GITHUB' = 0, 'JIRA' = 1),
+    project_owner LowCardinality(String),
+    project_name LowCardinality(String),
+    updated_at DateTime64(3, 'UTC'),
+    synced_at DateTime64(3, 'UTC')
+)
+ENGINE = ReplacingMergeTree(synced_at)
+ORDER BY (source_system, project_owner, project_name);
+
+-- How far an unfinished sync of each project got, so a restarted run
+-- resumes from the same page of issues.
+CREATE TABLE sync_checkpoints (
+    source_system Enum8('GITHUB' = 0, 'JIRA' = 1),
+    project_owner LowCardinality(String),
+    project_name LowCardinality(String),
+    -- The time issues were listed from, or NULL when every issue was listed.
+    since Nullable(DateTime64(3, 'UTC')),
+    page UInt32,
+    loaded_issue_ids Array(UInt64),
+    updated_at Nullable(DateTime64(3, 'UTC')),
+    -- The GraphQL cursor for the end of the page before, if any.
+    cursor Nullable(String),
+    -- Set when the sync finishes, so the checkpoint is no longer resumed.
+    finished Bool,
+    saved_at DateTime64(3, 'UTC')
+)
+ENGINE = ReplacingMergeTree(saved_at)
+ORDER BY (source_system, project_owner, project_name);
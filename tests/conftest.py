@@ -4,6 +4,8 @@ from typing import Any, NoReturn
 
 import pytest
 
+from pie.testing import FakeClickhouseClient
+
 
 @pytest.fixture(autouse=True)
 def no_network(request: Any) -> Generator[None]:
@@ -36,3 +38,18 @@ def no_network(request: Any) -> Generator[None]:
     finally:
         socket.socket = orig_socket
         socket.create_connection = orig_create_connection
+
+
+@pytest.fixture
+def clickhouse_client(monkeypatch: pytest.MonkeyPatch) -> FakeClickhouseClient:
+    """
+    Replace ClickHouse connections made by ProjectProcessor with a fake.
+    """
+    client = FakeClickhouseClient()
+
+    def get_client(**kwargs: Any) -> FakeClickhouseClient:
+        return client
+
+    monkeypatch.setattr("pie.project_processor.get_client", get_client)
+
+    return client
@@ -0,0 +1,53 @@
+from pie.benchmark import (
+    STOCK_COMMENTS,
+    compare_results,
+    generate_corpus,
+    results_to_json,
+    run_benchmarks,
+)
+
+
+def test_generate_corpus_is_repeatable() -> None:
+    corpus = generate_corpus(200, seed=1)
+
+    assert corpus == generate_corpus(200, seed=1)
+    assert len(corpus.issues) == 200
+    assert corpus.issue_comments
+    assert any(
+        comment.body in STOCK_COMMENTS for comment in corpus.issue_comments
+    )
+    assert all(issue.title for issue in corpus.issues)
+
+
+def test_run_benchmarks_emits_comparable_json() -> None:
+    results = run_benchmarks(50)
+    data = results_to_json(results)
+
+    assert [result["name"] for result in data["results"]] == [
+        "encode_titles",
+        "encode_descriptions",
+        "encode_comments",
+        "store",
+        "store.encode_document",
+        "store.encode_text",
+        "store.insert_issue_comments",
+        "store.insert_issues",
+        "store.load_project_keys",
+        "similarity_matrix",
+    ]
+    assert all(
+        result.peak_memory
+        for result in results
+        if not result.name.startswith("store.")
+    )
+    assert {
+        result.name: result.item_count
+        for result in results
+        if result.name.startswith("store.encode")
+    } == {
+        "store.encode_document": results[2].item_count + 50,
+        "store.encode_text": 50,
+    }
+    assert results[0].item_count == 50
+    assert len(compare_results(data, data)) == len(results)
+    assert "+0.0% time" in compare_results(data, data)[0]
@@ -0,0 +1,234 @@
+import datetime
+from collections.abc import Callable, Sequence
+from typing import Any, cast
+
+from clickhouse_connect.driver.client import Client
+
+from pie.clickhouse import (
+    ISSUE_EVENT_COLUMNS,
+    BatchWriter,
+    SimilarIssueMatch,
+    find_similar_issues,
+    find_similar_issues_indexed,
+    find_similar_issues_lsh,
+    find_similar_issues_prefiltered,
+    update_similar_pairs,
+)
+from pie.issue import IssueEvent, IssueEventType, Project, SourceSystemType
+from pie.testing import FakeClickhouseClient, FakeQueryResult, FakeStream
+
+PROJECT = Project(
+    source_system=SourceSystemType.GITHUB,
+    owner="dense-analysis",
+    name="pie",
+)
+
+
+class FakeQueryClient:
+    """
+    A client which answers queries with rows chosen by a function.
+    """
+
+    def __init__(
+        self,
+        answer: Callable[[str, Sequence[Any]], list[tuple[Any, ...]]],
+    ) -> None:
+        self.answer = answer
+        self.queries: list[tuple[str, Sequence[Any]]] = []
+        self.commands: list[tuple[str, Sequence[Any]]] = []
+
+    def query(
+        self,
+        query: str,
+        parameters: Sequence[Any] = (),
+        settings: dict[str, Any] | None = None,
+    ) -> FakeQueryResult:
+        self.queries.append((query, parameters))
+        return FakeQueryResult(self.answer(query, parameters))
+
+    def query_row_block_stream(
+        self,
+        query: str,
+        parameters: Sequence[Any] = (),
+    ) -> FakeStream:
+        self.queries.append((query, parameters))
+        return FakeStream([self.answer(query, parameters)])
+
+    def command(self, command: str, parameters: Sequence[Any] = ()) -> None:
+        self.commands.append((command, parameters))
+
+
+def make_event(issue_id: int) -> IssueEvent:
+    return IssueEvent(
+        project=PROJECT,
+        id=issue_id,
+        related_object_id=0,
+        parent_id=0,
+        type=IssueEventType.CREATED,
+        assignee_username="",
+        timestamp=datetime.datetime(2024, 1, issue_id),
+    )
+
+
+def test_batch_writer_flushes_columns_when_batch_is_full() -> None:
+    client = FakeClickhouseClient()
+    writer = BatchWriter(cast(Client, client), batch_size=2)
+
+    writer.add_issue_event(make_event(1))
+    assert client.inserts == []
+
+    writer.add_issue_event(make_event(2))
+
+    assert len(client.inserts) == 1
+    table, columns, column_names = client.inserts[0]
+    assert table == "issue_events"
+    assert column_names == ISSUE_EVENT_COLUMNS
+    assert columns[3] == [1, 2]
+    assert client.row_oriented_tables == set()
+    assert writer.pending_row_count == 0
+
+
+def test_batch_writer_flushes_remaining_rows_on_exit() -> None:
+    client = FakeClickhouseClient()
+
+    with BatchWriter(cast(Client, client), batch_size=100) as writer:
+        writer.add_issue_event(make_event(1))
+
+    assert [table for table, _, _ in client.inserts] == ["issue_events"]
+
+
+def test_batch_writer_flushes_after_interval() -> None:
+    client = FakeClickhouseClient()
+    writer = BatchWriter(
+        cast(Client, client),
+        batch_size=100,
+        flush_interval=0.0,
+    )
+
+    writer.add_issue_event(make_event(1))
+
+    assert len(client.inserts) == 1
+
+
+def test_find_similar_issues_indexed_checks_nearest_open_issues() -> None:
+    project_key = ("GITHUB", "dense-analysis", "pie")
+
+    def answer(query: str, parameters: Sequence[Any]) -> list[Any]:
+        if "UNION ALL" in query:
+            # One part for each issue, which only finds open issues.
+            assert query.count("state = 'OPEN'") == 2
+            assert parameters[:2] == (1, [1.0])
+            assert parameters[11:13] == (2, [1.0])
+            assert parameters[10] == parameters[21] == 3
+
+            # Issue 2 has a different description.
+            return [
+                (2, 1, "Crash", 0.1, 0.1),
+                (1, 2, "Crashes", 0.1, 1.0),
+            ]
+
+        if "issue_states" in query:
+            return [(*project_key, 1), (*project_key, 2)]
+
+        assert parameters == (*project_key, [1, 2])
+        return [(1, "Crash", [1.0], [1.0]), (2, "Crashes", [1.0], [0.0])]
+
+    client = FakeQueryClient(answer)
+
+    assert list(
+        find_similar_issues_indexed(
+            cast(Client, client),
+            max_title_distance=0.2,
+            max_description_distance=0.2,
+            neighbour_count=3,
+        ),
+    ) == [
+        SimilarIssueMatch(
+            2,
+            1,
+            "Crashes",
+            "Crash",
+            0.1,
+            0.1,
+            "dense-analysis",
+            "pie",
+        ),
+    ]
+    # One query for open issues, one for their vectors, and one to search
+    # for the batch.
+    assert len(client.queries) == 3
+
+
+def test_update_similar_pairs_compares_issues_since_watermark() -> None:
+    def answer(query: str, parameters: Sequence[Any]) -> list[Any]:
+        if "similar_pairs_state" in query:
+            assert parameters == (0.2, 0.3)
+            return [(1_000,)]
+
+        return [(2_500,)]
+
+    client = FakeQueryClient(answer)
+
+    update_similar_pairs(cast(Client, client), 0.2, 0.3)
+
+    assert [parameters for _, parameters in client.commands] == [
+        (1_000, 2_500, 2_500, 0.2, 0.3),
+        (0.2, 0.3, 2_500),
+    ]
+
+
+def test_update_similar_pairs_skips_when_no_issues_are_new() -> None:
+    client = FakeQueryClient(lambda query, parameters: [(1_000,)])
+
+    update_similar_pairs(cast(Client, client), 0.2, 0.3)
+
+    assert client.commands == []
+
+
+def test_find_similar_issues_streams_matches_for_a_project() -> None:
+    row = (1, 2, "Crash", "Crashes", 0.1, 0.1, "dense-analysis", "pie")
+    client = FakeQueryClient(lambda query, parameters: [row])
+
+    matches = find_similar_issues(
+        cast(Client, client),
+        0.2,
+        0.3,
+        project=("dense-analysis", "pie"),
+        top_k=5,
+    )
+
+    # Nothing is queried until matches are read.
+    assert client.queries == []
+    assert list(matches) == [SimilarIssueMatch(*row)]
+    query, parameters = client.queries[0]
+    assert "LIMIT %s BY" in query
+    assert parameters == (0.2, 0.3, "dense-analysis", "pie", 5)
+
+
+def test_find_similar_issues_prefiltered_compares_signatures_first() -> None:
+    client = FakeQueryClient(lambda query, parameters: [])
+
+    assert not list(
+        find_similar_issues_prefiltered(
+            cast(Client, client),
+            0.2,
+            0.3,
+            max_signature_distance=40,
+            project=("dense-analysis", "pie"),
+        ),
+    )
+    query, parameters = client.queries[0]
+    # 96 byte signatures are compared as twelve 64-bit integers.
+    assert query.count("bitCount") == 12
+    assert parameters == ("dense-analysis", "pie", 40, 0.2, 0.3)
+
+
+def test_find_similar_issues_lsh_pairs_issues_sharing_buckets() -> None:
+    client = FakeQueryClient(lambda query, parameters: [])
+
+    assert not list(
+        find_similar_issues_lsh(cast(Client, client), 0.2, 0.3, top_k=2),
+    )
+    query, parameters = client.queries[0]
+    assert "ARRAY JOIN lsh_buckets" in query
+    assert parameters == (0.2, 0.3, 2)
@@ -31,3 +31,22 @@ name = "pie"
     assert config.clickhouse.database == "issues"
     assert repo.owner == "dense-analysis"
     assert repo.name == "pie"
+
+
+def test_load_configuration_shares_requests_between_tokens(
+    tmp_path: Path,
+) -> None:
+    config_path = tmp_path / "config.toml"
+    config_path.write_text(
+        """
+github_token = "first"
+github_tokens = ["second", "first", "third"]
+""".strip(),
+        encoding="utf-8",
+    )
+
+    config = load_configuration(str(config_path))
+
+    assert config.github_token == "first"
+    assert config.github_tokens == ("first", "second", "third")
+    assert config.github_request_burst == 500
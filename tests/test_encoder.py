@@ -0,0 +1,186 @@
+import hashlib
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+from pie.encoder import (
+    EMPTY_VECTOR,
+    SIGNATURE_SIZE,
+    VECTOR_SIZE,
+    EmbeddingCache,
+    EmbeddingCacheInfo,
+    TokenHashCache,
+    TokenHashCacheInfo,
+    compact_vectors,
+    dense_vectors,
+    encode_document,
+    encode_documents,
+    encode_text,
+    encode_texts,
+    sparse_vectors,
+)
+
+
+def test_encode_text_is_deterministic() -> None:
+    assert encode_text("same text") == encode_text("same text")
+
+
+def test_encode_document_returns_empty_vector_for_blank_text() -> None:
+    assert encode_document("   ") == EMPTY_VECTOR
+
+
+def test_encode_document_returns_expected_vector_size() -> None:
+    assert (
+        len(
+            encode_document("One sentence. Another sentence."),
+        )
+        == VECTOR_SIZE
+    )
+
+
+def test_encode_text_sets_hashed_token_index() -> None:
+    token_hash = hashlib.blake2b(b"error", digest_size=8).digest()
+    index = int.from_bytes(token_hash[:4], "big") % VECTOR_SIZE
+    direction = 1.0 if token_hash[4] % 2 == 0 else -1.0
+    expected = EMPTY_VECTOR.copy()
+    expected[index] = direction
+
+    assert encode_text("Error") == expected
+
+
+def test_encode_texts_matches_per_token_encoder() -> None:
+    # Non-zero values from the encoder which summed one token at a time.
+    expected: dict[str, dict[int, float]] = {
+        "Linting fails": {464: 0.7071067811865475, 564: 0.7071067811865475},
+        "": {},
+        "the the error": {108: 0.8944271909999159, 522: 0.4472135954999579},
+        "Error: lint error, lint ERROR": {
+            1: 0.5547001962252291,
+            522: 0.8320502943378437,
+        },
+    }
+    matrix = encode_texts(list(expected))
+
+    assert matrix.dtype == np.float32
+    assert matrix.shape == (len(expected), VECTOR_SIZE)
+
+    for row, values in zip(matrix, expected.values(), strict=True):
+        golden = np.zeros(VECTOR_SIZE, dtype=np.float32)
+        golden[list(values)] = list(values.values())
+
+        assert np.array_equal(row, golden)
+
+
+def test_encode_documents_normalises_each_document() -> None:
+    matrix = encode_documents(
+        ["First sentence. Second one!", "", "Only one"],
+    )
+    magnitudes = np.linalg.norm(matrix, axis=1)
+
+    assert np.allclose(magnitudes, [1.0, 0.0, 1.0])
+
+
+def test_token_hash_cache_counts_hits_and_evicts() -> None:
+    cache = TokenHashCache(max_size=2)
+
+    first = cache.get("error")
+    assert cache.get("error") == first
+    cache.get("lint")
+    cache.get("fix")
+
+    assert cache.info() == TokenHashCacheInfo(
+        hits=1,
+        misses=3,
+        size=2,
+        max_size=2,
+    )
+
+
+def test_token_hash_cache_round_trips_vocabulary(tmp_path: Path) -> None:
+    vocabulary_path = tmp_path / "vocabulary.tsv"
+    cache = TokenHashCache()
+    expected = cache.get("error")
+    cache.save_vocabulary(vocabulary_path)
+
+    preloaded_cache = TokenHashCache()
+
+    assert preloaded_cache.load_vocabulary(vocabulary_path) == 1
+    assert preloaded_cache.get("error") == expected
+    assert preloaded_cache.info().misses == 0
+
+
+def test_embedding_cache_encodes_each_distinct_text_once(
+    tmp_path: Path,
+) -> None:
+    encoded_texts: list[str] = []
+
+    def encode(texts: Sequence[str]) -> npt.NDArray[np.float32]:
+        encoded_texts.extend(texts)
+
+        return encode_documents(texts)
+
+    cache = EmbeddingCache(max_size=1, path=tmp_path / "embeddings.sqlite")
+    vectors = cache.encode("document", ["+1", "Same here", "+1"], encode)
+
+    assert encoded_texts == ["+1", "Same here"]
+    assert np.array_equal(vectors, encode_documents(["+1", "Same here", "+1"]))
+
+    # "+1" was evicted from memory, but is still in the persistent file.
+    cache.encode("document", ["Same here", "+1"], encode)
+    # Texts encoded another way are cached separately.
+    cache.encode("text", ["+1"], encode)
+    cache.close()
+
+    assert encoded_texts == ["+1", "Same here", "+1"]
+    assert cache.info() == EmbeddingCacheInfo(
+        hits=1,
+        persistent_hits=1,
+        misses=4,
+        size=1,
+        max_size=1,
+    )
+
+    reopened_cache = EmbeddingCache(path=tmp_path / "embeddings.sqlite")
+
+    assert np.array_equal(
+        reopened_cache.encode("text", ["+1"], encode),
+        encode_texts(["+1"]),
+    )
+    assert reopened_cache.info().persistent_hits == 1
+
+
+def test_compact_vectors_quantize_and_pack_signs() -> None:
+    vectors = encode_texts(["Linting fails", "Linting fails badly"])
+    compact = compact_vectors(vectors)
+
+    assert len(compact[0].signature) == SIGNATURE_SIZE
+    assert np.array_equal(
+        np.unpackbits(np.frombuffer(compact[0].signature, dtype=np.uint8)),
+        (vectors[0] > 0).astype(np.uint8),
+    )
+    # Quantized dot products approximate cosine similarity.
+    quantized = np.array([row.quantized for row in compact], dtype=np.int32)
+    assert (
+        abs(
+            quantized[0] @ quantized[1] / 127**2 - vectors[0] @ vectors[1],
+        )
+        < 0.02
+    )
+
+
+def test_sparse_vectors_round_trip() -> None:
+    vectors = encode_texts(["Linting fails", "", "Fix the linter"])
+    sparse = sparse_vectors(vectors)
+
+    assert len(sparse[0].indices) == 2
+    assert sparse[1].indices == []
+    assert sparse[2].indices == sorted(sparse[2].indices)
+    assert np.array_equal(
+        dense_vectors(
+            [vector.indices for vector in sparse],
+            [vector.values for vector in sparse],
+        ),
+        vectors,
+    )
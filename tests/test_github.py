@@ -0,0 +1,401 @@
+import datetime
+from typing import Any, NamedTuple, cast
+
+import pytest
+from github import Github
+from github.GithubObject import NotSet
+
+from pie.github import fetch_github_issues, fetch_github_repository_issues
+from pie.issue import (
+    Issue,
+    IssueComment,
+    IssueEvent,
+    IssueEventType,
+    Project,
+    SourceSystemType,
+    SyncCheckpoint,
+)
+from pie.project_processor import ProjectProcessor
+
+PROJECT = Project(
+    source_system=SourceSystemType.GITHUB,
+    owner="dense-analysis",
+    name="pie",
+)
+CREATED_AT = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+
+
+class FakeUser(NamedTuple):
+    login: str
+
+
+class FakeLabel(NamedTuple):
+    name: str
+
+
+class FakeComment:
+    def __init__(
+        self,
+        comment_id: int,
+        body: str,
+        issue_number: int = 1,
+    ) -> None:
+        self.id = comment_id
+        self.user = FakeUser("w0rp")
+        self.body = body
+        self.created_at = CREATED_AT
+        self.issue_url = (
+            "https://api.github.com/repos/dense-analysis/pie/issues/"
+            f"{issue_number}"
+        )
+
+
+class FakeEventIssue(NamedTuple):
+    number: int
+
+
+class FakeEvent(NamedTuple):
+    id: int
+    event: str
+    issue: FakeEventIssue
+    created_at: datetime.datetime
+
+
+class FakeIssue:
+    def __init__(
+        self,
+        number: int,
+        updated_at: datetime.datetime,
+        comments: list[FakeComment],
+        *,
+        pull_request: bool = False,
+    ) -> None:
+        self.number = number
+        self.title = f"Issue {number}"
+        self.body = "Description"
+        self.assignee = None
+        self.labels = [FakeLabel("bug")]
+        self.created_at = CREATED_AT
+        self.updated_at = updated_at
+        self.closed_at: datetime.datetime | None = None
+        self.pull_request = object() if pull_request else None
+        self.comments = comments
+        self.comments_since: list[Any] = []
+
+    def get_comments(self, since: Any = NotSet) -> list[FakeComment]:
+        self.comments_since.append(since)
+        return self.comments
+
+
+class FakeIssueList(list[FakeIssue]):
+    def __init__(self, issues: list[FakeIssue], page_size: int) -> None:
+        super().__init__(issues)
+        self.page_size = page_size
+        self.requested_pages: list[int] = []
+
+    def get_page(self, page: int) -> list[FakeIssue]:
+        self.requested_pages.append(page)
+        return self[page * self.page_size : (page + 1) * self.page_size]
+
+
+class FakeRepo:
+    def __init__(
+        self,
+        issues: list[FakeIssue],
+        events: list[FakeEvent] | None = None,
+        page_size: int = 100,
+    ) -> None:
+        self.issues = FakeIssueList(issues, page_size)
+        self.events = events or []
+        self.issues_since: list[Any] = []
+        self.comments_since: list[Any] = []
+
+    def get_issues(
+        self,
+        state: str,
+        since: Any = NotSet,
+        sort: str = "created",
+        direction: str = "desc",
+    ) -> FakeIssueList:
+        self.issues_since.append(since)
+        return self.issues
+
+    def get_issues_comments(self, since: Any = NotSet) -> list[FakeComment]:
+        self.comments_since.append(since)
+        return [comment for issue in self.issues for comment in issue.comments]
+
+    def get_issues_events(self) -> list[FakeEvent]:
+        return self.events
+
+
+class FakeGithub:
+    def __init__(self, repo: FakeRepo) -> None:
+        self.repo = repo
+
+    def get_repo(self, full_name: str) -> FakeRepo:
+        assert full_name == "dense-analysis/pie"
+        return self.repo
+
+
+class RecordingProcessor:
+    def __init__(self) -> None:
+        self.issues: list[Issue] = []
+        self.issue_comments: list[IssueComment] = []
+        self.issue_events: list[IssueEvent] = []
+        self.checkpoints: list[SyncCheckpoint | None] = []
+
+    def store_issue(self, issue: Issue) -> None:
+        self.issues.append(issue)
+
+    def store_issue_comment(self, issue_comment: IssueComment) -> None:
+        self.issue_comments.append(issue_comment)
+
+    def store_issue_event(self, issue_event: IssueEvent) -> None:
+        self.issue_events.append(issue_event)
+
+    def has_issue_event(
+        self,
+        project: Project,
+        issue_id: int,
+        related_object_id: int,
+        event_type: IssueEventType,
+    ) -> bool:
+        return any(
+            (issue_event.id, issue_event.related_object_id, issue_event.type)
+            == (issue_id, related_object_id, event_type)
+            for issue_event in self.issue_events
+        )
+
+    def is_issue_closed(self, project: Project, issue_id: int) -> bool:
+        states = [
+            issue_event.type
+            for issue_event in self.issue_events
+            if issue_event.id == issue_id
+            and issue_event.type
+            in {IssueEventType.CLOSED, IssueEventType.REOPENED}
+        ]
+
+        return bool(states) and states[-1] == IssueEventType.CLOSED
+
+    def get_sync_checkpoint(self, project: Project) -> SyncCheckpoint | None:
+        return self.checkpoints[-1] if self.checkpoints else None
+
+    def set_sync_checkpoint(
+        self,
+        project: Project,
+        checkpoint: SyncCheckpoint | None,
+    ) -> None:
+        self.checkpoints.append(checkpoint)
+
+
+def test_fetch_github_issues_passes_since_and_returns_watermark() -> None:
+    since = datetime.datetime(2024, 2, 1, tzinfo=datetime.UTC)
+    latest = datetime.datetime(2024, 3, 1, tzinfo=datetime.UTC)
+    issue = FakeIssue(1, latest, [FakeComment(10, "Same here")])
+    pull_request = FakeIssue(
+        2,
+        datetime.datetime(2024, 2, 2, tzinfo=datetime.UTC),
+        [],
+        pull_request=True,
+    )
+    repo = FakeRepo([issue, pull_request])
+    processor = RecordingProcessor()
+
+    high_water_mark = fetch_github_issues(
+        cast(ProjectProcessor, processor),
+        cast(Github, FakeGithub(repo)),
+        PROJECT,
+        since,
+    )
+
+    assert high_water_mark == latest
+    assert repo.issues_since == [since]
+    assert issue.comments_since == [since]
+    assert [issue.id for issue in processor.issues] == [1]
+    assert [comment.id for comment in processor.issue_comments] == [10]
+
+
+def test_fetch_github_issues_resumes_from_checkpoint() -> None:
+    latest = datetime.datetime(2024, 3, 1, tzinfo=datetime.UTC)
+    issues = [FakeIssue(number, latest, []) for number in range(1, 6)]
+    repo = FakeRepo(issues, page_size=2)
+    processor = RecordingProcessor()
+
+    def fail(since: Any = NotSet) -> list[FakeComment]:
+        raise RuntimeError("Connection reset")
+
+    # Loading stops part way through the second page.
+    issues[3].get_comments = fail
+
+    with pytest.raises(RuntimeError):
+        fetch_github_issues(
+            cast(ProjectProcessor, processor),
+            cast(Github, FakeGithub(repo)),
+            PROJECT,
+        )
+
+    assert processor.checkpoints == [
+        SyncCheckpoint(None, 1, (), latest),
+        SyncCheckpoint(None, 1, (3,), latest),
+    ]
+
+    issues[3].get_comments = lambda since=NotSet: []
+    processor.issues.clear()
+    repo.issues.requested_pages.clear()
+
+    high_water_mark = fetch_github_issues(
+        cast(ProjectProcessor, processor),
+        cast(Github, FakeGithub(repo)),
+        PROJECT,
+    )
+
+    assert high_water_mark == latest
+    assert repo.issues.requested_pages == [1, 2, 3]
+    assert [issue.id for issue in processor.issues] == [4, 5]
+    assert processor.checkpoints[-1] is None
+
+
+def test_fetch_github_repository_issues_uses_repository_listings() -> None:
+    since = datetime.datetime(2024, 2, 1, tzinfo=datetime.UTC)
+    latest = datetime.datetime(2024, 3, 1, tzinfo=datetime.UTC)
+    reopened_at = datetime.datetime(2024, 2, 15, tzinfo=datetime.UTC)
+    issue = FakeIssue(1, latest, [FakeComment(10, "Same here")])
+    pull_request = FakeIssue(
+        2,
+        datetime.datetime(2024, 2, 2, tzinfo=datetime.UTC),
+        [FakeComment(20, "LGTM", issue_number=2)],
+        pull_request=True,
+    )
+    repo = FakeRepo(
+        [issue, pull_request],
+        [
+            FakeEvent(100, "reopened", FakeEventIssue(1), reopened_at),
+            FakeEvent(101, "labeled", FakeEventIssue(1), reopened_at),
+            FakeEvent(102, "reopened", FakeEventIssue(2), reopened_at),
+            # Events before `since` end the listing.
+            FakeEvent(103, "reopened", FakeEventIssue(1), CREATED_AT),
+        ],
+    )
+    processor = RecordingProcessor()
+
+    high_water_mark = fetch_github_repository_issues(
+        cast(ProjectProcessor, processor),
+        cast(Github, FakeGithub(repo)),
+        PROJECT,
+        since,
+    )
+
+    assert high_water_mark == latest
+    assert repo.comments_since == [since]
+    # Issues are never asked for their own comments.
+    assert issue.comments_since == []
+    assert [issue.id for issue in processor.issues] == [1]
+    assert [
+        (comment.issue_id, comment.id) for comment in processor.issue_comments
+    ] == [(1, 10)]
+    assert [
+        (event.type, event.related_object_id)
+        for event in processor.issue_events
+    ] == [
+        (IssueEventType.CREATED, 0),
+        (IssueEventType.COMMENT_ADDED, 10),
+        (IssueEventType.REOPENED, 100),
+    ]
+
+
+def test_fetch_github_issues_stores_each_close_and_reopen() -> None:
+    first_closed_at = datetime.datetime(2024, 2, 1, tzinfo=datetime.UTC)
+    reopened_at = datetime.datetime(2024, 2, 10, tzinfo=datetime.UTC)
+    second_closed_at = datetime.datetime(2024, 3, 1, tzinfo=datetime.UTC)
+    issue = FakeIssue(1, first_closed_at, [])
+    repo = FakeRepo([issue])
+    processor = RecordingProcessor()
+
+    for updated_at, closed_at in (
+        (first_closed_at, first_closed_at),
+        (reopened_at, None),
+        # The issue is open on both syncs, and is only reopened once.
+        (reopened_at, None),
+        (second_closed_at, second_closed_at),
+    ):
+        issue.updated_at = updated_at
+        issue.closed_at = closed_at
+        fetch_github_issues(
+            cast(ProjectProcessor, processor),
+            cast(Github, FakeGithub(repo)),
+            PROJECT,
+        )
+
+    assert [
+        (event.type, event.related_object_id, event.timestamp)
+        for event in processor.issue_events
+        if event.type != IssueEventType.CREATED
+    ] == [
+        # The first close is keyed as closes were before they had times.
+        (IssueEventType.CLOSED, 0, first_closed_at),
+        (IssueEventType.REOPENED, int(reopened_at.timestamp()), reopened_at),
+        (
+            IssueEventType.CLOSED,
+            int(second_closed_at.timestamp()),
+            second_closed_at,
+        ),
+    ]
+
+
+def test_fetch_github_issues_raises_the_error_which_stopped_loading() -> None:
+    issues = [FakeIssue(1, CREATED_AT, [])]
+    processor = RecordingProcessor()
+
+    def fail(since: Any = NotSet) -> list[FakeComment]:
+        raise RuntimeError("Connection reset")
+
+    def fail_to_save(
+        project: Project,
+        checkpoint: SyncCheckpoint | None,
+    ) -> None:
+        raise OSError("Storage is unavailable")
+
+    issues[0].get_comments = fail
+    processor.set_sync_checkpoint = fail_to_save
+
+    with pytest.raises(RuntimeError, match="Connection reset"):
+        fetch_github_issues(
+            cast(ProjectProcessor, processor),
+            cast(Github, FakeGithub(FakeRepo(issues))),
+            PROJECT,
+        )
+
+
+def test_fetch_github_repository_issues_stores_each_reopen_once() -> None:
+    closed_at = datetime.datetime(2024, 2, 1, tzinfo=datetime.UTC)
+    reopened_at = datetime.datetime(2024, 2, 15, tzinfo=datetime.UTC)
+    issue = FakeIssue(1, closed_at, [])
+    issue.closed_at = closed_at
+    repo = FakeRepo([issue])
+    processor = RecordingProcessor()
+
+    fetch_github_repository_issues(
+        cast(ProjectProcessor, processor),
+        cast(Github, FakeGithub(repo)),
+        PROJECT,
+    )
+
+    issue.updated_at = reopened_at
+    issue.closed_at = None
+    repo.events = [FakeEvent(100, "reopened", FakeEventIssue(1), reopened_at)]
+
+    fetch_github_repository_issues(
+        cast(ProjectProcessor, processor),
+        cast(Github, FakeGithub(repo)),
+        PROJECT,
+    )
+
+    # The reopen is read from the listing, and not guessed from the issue.
+    assert [
+        (event.type, event.related_object_id, event.timestamp)
+        for event in processor.issue_events
+        if event.type != IssueEventType.CREATED
+    ] == [
+        (IssueEventType.CLOSED, 0, closed_at),
+        (IssueEventType.REOPENED, 100, reopened_at),
+    ]
@@ -0,0 +1,126 @@
+from collections.abc import ItemsView
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from pie.github_cache import (
+    CachedResponseEntry,
+    CachingHTTPSConnection,
+    ResponseCache,
+)
+
+
+class FakeResponse:
+    def __init__(
+        self, status: int, headers: dict[str, str], body: str
+    ) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getheaders(self) -> ItemsView[str, str]:
+        return self.headers.items()
+
+    def read(self) -> str:
+        return self.body
+
+
+def make_entry(body: str) -> CachedResponseEntry:
+    return CachedResponseEntry(
+        etag='"abc"',
+        last_modified="",
+        headers={"etag": '"abc"'},
+        body=body,
+    )
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_size_bytes=10)
+
+    cache.put("first", make_entry("12345"))
+    cache.put("second", make_entry("12345"))
+    cache.record_hit("first")
+    cache.put("third", make_entry("12345"))
+
+    assert cache.get("first") == make_entry("12345")
+    assert cache.get("second") is None
+    assert cache.get("third") is not None
+    assert cache.info().size_bytes == 10
+
+
+def test_caching_connection_sends_conditional_requests(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    monkeypatch.setattr(CachingHTTPSConnection, "cache", cache)
+    sent_headers: list[dict[str, str]] = []
+    responses = [
+        FakeResponse(
+            200, {"ETag": '"v1"', "X-RateLimit-Remaining": "10"}, "[]"
+        ),
+        FakeResponse(304, {"X-RateLimit-Remaining": "9"}, ""),
+    ]
+    connection = CachingHTTPSConnection("api.github.com")
+
+    def fetch() -> FakeResponse:
+        sent_headers.append(connection.headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(connection, "_fetch", fetch)
+
+    def get() -> Any:
+        connection.request(
+            "GET",
+            "/repos/dense-analysis/pie/issues",
+            None,
+            {"Authorization": "token abc"},
+        )
+        return connection.getresponse()
+
+    get()
+    response = get()
+
+    assert "If-None-Match" not in sent_headers[0]
+    assert sent_headers[1]["If-None-Match"] == '"v1"'
+    assert response.status == 200
+    assert response.read() == "[]"
+    assert dict(response.getheaders())["x-ratelimit-remaining"] == "9"
+    assert cache.info().hits == 1
+    assert cache.info().misses == 1
+
+
+def test_caching_connection_revalidates_entries_for_other_tokens(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    monkeypatch.setattr(CachingHTTPSConnection, "cache", cache)
+    sent_headers: list[dict[str, str]] = []
+    responses = [
+        FakeResponse(200, {"ETag": '"v1"'}, "[]"),
+        FakeResponse(304, {}, ""),
+    ]
+    connection = CachingHTTPSConnection("api.github.com")
+
+    def fetch() -> FakeResponse:
+        sent_headers.append(connection.headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(connection, "_fetch", fetch)
+
+    for token in ("first", "second"):
+        connection.request(
+            "GET",
+            "/repos/dense-analysis/pie/issues",
+            None,
+            {"Authorization": f"token {token}"},
+        )
+        response = connection.getresponse()
+
+    # GitHub decides if the ETag still matches for the second token.
+    assert sent_headers[1]["Authorization"] == "token second"
+    assert sent_headers[1]["If-None-Match"] == '"v1"'
+    assert response.read() == "[]"
+    assert cache.info().size == 1
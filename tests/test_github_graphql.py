@@ -0,0 +1,267 @@
+import datetime
+import json
+import threading
+from collections.abc import Generator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, ClassVar, cast
+
+import pytest
+from test_github import RecordingProcessor
+from test_project_processor import make_processor
+
+from pie.github_graphql import (
+    GithubGraphQLClient,
+    GithubGraphQLError,
+    fetch_github_graphql_issues,
+)
+from pie.issue import (
+    Issue,
+    IssueEventType,
+    Project,
+    SourceSystemType,
+    SyncCheckpoint,
+)
+from pie.project_processor import ProjectProcessor
+from pie.testing import FakeClickhouseClient
+
+PROJECT = Project(
+    source_system=SourceSystemType.GITHUB,
+    owner="dense-analysis",
+    name="pie",
+)
+
+
+def comment_node(comment_id: int, login: str | None) -> dict[str, Any]:
+    return {
+        "fullDatabaseId": str(comment_id),
+        "body": f"Comment {comment_id}",
+        "createdAt": "2024-01-02T00:00:00Z",
+        "author": {"login": login} if login else None,
+    }
+
+
+def issue_node(number: int, updated_at: str) -> dict[str, Any]:
+    return {
+        "number": number,
+        "title": f"Issue {number}",
+        "body": None,
+        "createdAt": "2024-01-01T00:00:00Z",
+        "updatedAt": updated_at,
+        "closedAt": "2024-01-03T00:00:00Z" if number == 2 else None,
+        "assignees": {"nodes": [{"login": "w0rp"}]},
+        "labels": {"nodes": [{"name": "bug"}]},
+        "comments": {
+            "pageInfo": {"hasNextPage": number == 1, "endCursor": "c1"},
+            "nodes": [comment_node(number * 10, "w0rp")],
+        },
+        "timelineItems": {"nodes": []},
+    }
+
+
+def state_event_node(type_name: str, created_at: str) -> dict[str, Any]:
+    return {"__typename": type_name, "createdAt": created_at}
+
+
+def respond(variables: dict[str, Any]) -> dict[str, Any]:
+    if variables["owner"] == "reopened":
+        # Issue 3 was closed, reopened, then closed again.
+        node = issue_node(3, "2024-03-01T00:00:00Z")
+        node["closedAt"] = "2024-03-01T00:00:00Z"
+        node["comments"]["pageInfo"]["hasNextPage"] = False
+        node["timelineItems"]["nodes"] = [
+            state_event_node("ClosedEvent", "2024-01-03T00:00:00Z"),
+            state_event_node("ReopenedEvent", "2024-02-01T00:00:00Z"),
+            state_event_node("ClosedEvent", "2024-03-01T00:00:00Z"),
+        ]
+
+        return {
+            "repository": {
+                "issues": {
+                    "pageInfo": {"hasNextPage": False, "endCursor": "i3"},
+                    "nodes": [node],
+                },
+            },
+        }
+
+    if "number" in variables:
+        # The second page of comments for issue 1.
+        return {
+            "repository": {
+                "issue": {
+                    "comments": {
+                        "pageInfo": {"hasNextPage": False, "endCursor": None},
+                        "nodes": [comment_node(11, None)],
+                    },
+                },
+            },
+        }
+
+    if variables["cursor"] is None:
+        nodes = [issue_node(1, "2024-02-01T00:00:00Z")]
+        page_info = {"hasNextPage": True, "endCursor": "i1"}
+    else:
+        nodes = [issue_node(2, "2024-03-01T00:00:00Z")]
+        page_info = {"hasNextPage": False, "endCursor": "i2"}
+
+    return {
+        "repository": {
+            "issues": {"pageInfo": page_info, "nodes": nodes},
+        },
+    }
+
+
+class FakeGraphQLHandler(BaseHTTPRequestHandler):
+    requests: ClassVar[list[dict[str, Any]]] = []
+
+    def do_POST(self) -> None:
+        assert self.headers["Authorization"] == "bearer token"
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append(body)
+
+        if body["variables"].get("owner") == "missing":
+            payload: dict[str, Any] = {
+                "errors": [{"message": "Could not resolve to a Repository"}],
+            }
+        else:
+            payload = {"data": respond(body["variables"])}
+
+        response = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+
+@pytest.fixture
+def graphql_url() -> Generator[str]:
+    FakeGraphQLHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGraphQLHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/graphql"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.allow_network
+def test_fetch_github_graphql_issues_pages_issues_and_comments(
+    graphql_url: str,
+) -> None:
+    processor = RecordingProcessor()
+
+    high_water_mark = fetch_github_graphql_issues(
+        cast(ProjectProcessor, processor),
+        GithubGraphQLClient("token", graphql_url),
+        PROJECT,
+    )
+
+    assert high_water_mark is not None
+    assert high_water_mark.isoformat() == "2024-03-01T00:00:00+00:00"
+    assert len(FakeGraphQLHandler.requests) == 3
+    assert [issue.id for issue in processor.issues] == [1, 2]
+    assert processor.issues[0].description == ""
+    assert processor.issues[0].assignee_username == "w0rp"
+    assert [
+        (comment.issue_id, comment.id, comment.username)
+        for comment in processor.issue_comments
+    ] == [(1, 10, "w0rp"), (1, 11, "ghost"), (2, 20, "w0rp")]
+    assert [(event.id, event.type) for event in processor.issue_events] == [
+        (1, IssueEventType.CREATED),
+        (1, IssueEventType.COMMENT_ADDED),
+        (1, IssueEventType.COMMENT_ADDED),
+        (2, IssueEventType.CREATED),
+        (2, IssueEventType.CLOSED),
+        (2, IssueEventType.COMMENT_ADDED),
+    ]
+
+
+@pytest.mark.allow_network
+def test_fetch_github_graphql_issues_stores_each_close_and_reopen(
+    graphql_url: str,
+    clickhouse_client: FakeClickhouseClient,
+) -> None:
+    project = PROJECT._replace(owner="reopened")
+
+    with make_processor() as processor:
+        fetch_github_graphql_issues(
+            processor,
+            GithubGraphQLClient("token", graphql_url),
+            project,
+        )
+
+        assert processor.is_issue_closed(project, 3)
+
+    assert [
+        (row["type"], row["related_object_id"], row["timestamp"].isoformat())
+        for row in clickhouse_client.inserted_rows("issue_events")
+        if row["type"] in {IssueEventType.CLOSED, IssueEventType.REOPENED}
+    ] == [
+        (IssueEventType.CLOSED, 0, "2024-01-03T00:00:00+00:00"),
+        (IssueEventType.REOPENED, 1706745600, "2024-02-01T00:00:00+00:00"),
+        # The issue is closed at the time of the last closed event, which is
+        # only stored once.
+        (IssueEventType.CLOSED, 1709251200, "2024-03-01T00:00:00+00:00"),
+    ]
+
+
+@pytest.mark.allow_network
+def test_fetch_github_graphql_issues_resumes_from_checkpoint(
+    graphql_url: str,
+) -> None:
+    processor = RecordingProcessor()
+    client = GithubGraphQLClient("token", graphql_url)
+    store_issue = processor.store_issue
+
+    def fail(issue: Issue) -> None:
+        raise RuntimeError("Connection reset")
+
+    # Loading stops on the second page.
+    processor.store_issue = lambda issue: (
+        fail(issue) if issue.id == 2 else store_issue(issue)
+    )
+
+    with pytest.raises(RuntimeError):
+        fetch_github_graphql_issues(
+            cast(ProjectProcessor, processor),
+            client,
+            PROJECT,
+        )
+
+    updated_at = datetime.datetime(2024, 2, 1, tzinfo=datetime.UTC)
+
+    assert processor.checkpoints == [
+        SyncCheckpoint(None, 1, (), updated_at, "i1"),
+        SyncCheckpoint(None, 1, (), updated_at, "i1"),
+    ]
+
+    processor.store_issue = store_issue
+    processor.issues.clear()
+    FakeGraphQLHandler.requests.clear()
+
+    fetch_github_graphql_issues(
+        cast(ProjectProcessor, processor),
+        client,
+        PROJECT,
+    )
+
+    assert [
+        request["variables"].get("cursor")
+        for request in FakeGraphQLHandler.requests
+    ] == ["i1"]
+    assert [issue.id for issue in processor.issues] == [2]
+    assert processor.checkpoints[-1] is None
+
+
+@pytest.mark.allow_network
+def test_graphql_client_raises_errors(graphql_url: str) -> None:
+    client = GithubGraphQLClient("token", graphql_url)
+
+    with pytest.raises(GithubGraphQLError, match="Could not resolve"):
+        client.query("query { viewer { login } }", {"owner": "missing"})
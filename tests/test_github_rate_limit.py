@@ -0,0 +1,119 @@
+from typing import Any
+
+import pytest
+from test_github_cache import FakeResponse
+
+from pie.github_cache import CachingHTTPSConnection
+from pie.github_rate_limit import RequestScheduler
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+        self.sleeps: list[float] = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_scheduler(
+    clock: FakeClock,
+    tokens: tuple[str, ...],
+    burst: int = 0,
+) -> RequestScheduler:
+    return RequestScheduler(
+        tokens,
+        burst=burst,
+        clock=clock.time,
+        sleep=clock.sleep,
+    )
+
+
+def limit_headers(remaining: int, reset: float) -> dict[str, str]:
+    return {
+        "x-ratelimit-remaining": str(remaining),
+        "x-ratelimit-reset": str(int(reset)),
+    }
+
+
+def test_scheduler_spreads_remaining_requests_until_reset() -> None:
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, ("a",))
+    scheduler.update("a", "core", limit_headers(10, 1_100), status=200)
+
+    for _ in range(3):
+        scheduler.acquire()
+
+    assert clock.sleeps == [pytest.approx(10.0), pytest.approx(10.0)]
+
+
+def test_scheduler_lets_a_burst_of_requests_run_ahead() -> None:
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, ("a",), burst=5)
+    scheduler.update("a", "core", limit_headers(100, 1_100), status=200)
+
+    for _ in range(5):
+        scheduler.acquire()
+
+    assert clock.sleeps == []
+
+
+def test_scheduler_uses_the_token_which_is_ready_first() -> None:
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, ("a", "b"))
+    scheduler.update("a", "core", limit_headers(0, 1_600), status=200)
+    scheduler.update("b", "core", limit_headers(0, 1_060), status=200)
+
+    assert scheduler.acquire("search") == "a"
+    assert scheduler.acquire() == "b"
+    assert clock.sleeps == [60.0]
+
+
+def test_scheduler_waits_after_secondary_rate_limits() -> None:
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, ("a",))
+
+    assert scheduler.update("a", "core", {"retry-after": "30"}, status=403)
+    assert not scheduler.update("a", "core", {}, status=404)
+    assert scheduler.acquire() == "a"
+    assert clock.sleeps == [30.0]
+
+
+def test_caching_connection_retries_rate_limited_requests(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, ("first", "second"))
+    monkeypatch.setattr("pie.github_cache.REQUEST_SCHEDULER", scheduler)
+    sent_headers: list[dict[str, str]] = []
+    responses = [
+        FakeResponse(403, {"Retry-After": "60"}, ""),
+        FakeResponse(200, limit_headers(99, 4_600), "[]"),
+    ]
+    connection = CachingHTTPSConnection("api.github.com")
+
+    def send() -> FakeResponse:
+        sent_headers.append(connection.headers)
+
+        return responses.pop(0)
+
+    monkeypatch.setattr(connection, "_send", send)
+    connection.request(
+        "GET",
+        "/repos/dense-analysis/pie/issues",
+        None,
+        {"Authorization": "token first"},
+    )
+    response: Any = connection.getresponse()
+
+    assert response.status == 200
+    # The request is sent again at once with the token which isn't blocked.
+    assert [headers["Authorization"] for headers in sent_headers] == [
+        "token first",
+        "token second",
+    ]
+    assert clock.sleeps == []
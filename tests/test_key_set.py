@@ -0,0 +1,47 @@
+from pie.key_set import KeySet
+
+
+def test_key_set_finds_loaded_keys() -> None:
+    key_set = KeySet(2)
+    key_set.extend_sorted([[1, 1, 2], [5, 7, 1]])
+    key_set.extend_sorted([[3], [0]])
+
+    assert (1, 5) in key_set
+    assert (1, 7) in key_set
+    assert (2, 1) in key_set
+    assert (3, 0) in key_set
+    assert (1, 6) not in key_set
+    assert (2, 5) not in key_set
+    assert (4, 0) not in key_set
+    assert len(key_set) == 4
+
+
+def test_key_set_finds_added_keys() -> None:
+    key_set = KeySet(3)
+    key_set.extend_sorted([[1], [0], [0]])
+
+    key_set.add((1, 0, 2))
+    key_set.add((1, 0, 0))
+
+    assert (1, 0, 2) in key_set
+    assert (1, 0, 1) not in key_set
+    assert len(key_set) == 2
+
+
+def test_key_set_removes_keys() -> None:
+    key_set = KeySet(1)
+    key_set.extend_sorted([[1, 2]])
+
+    key_set.discard((1,))
+    key_set.add((3,))
+    key_set.discard((3,))
+    key_set.discard((4,))
+
+    assert (1,) not in key_set
+    assert (3,) not in key_set
+    assert len(key_set) == 1
+
+    key_set.add((1,))
+
+    assert (1,) in key_set
+    assert len(key_set) == 2
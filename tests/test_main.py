@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import pytest
+
+from pie.__main__ import load_github_repos
+from pie.config import load_configuration
+from pie.project_processor import ProjectProcessor
+from pie.testing import FakeClickhouseClient
+
+
+def test_load_github_repos_reports_failed_repos(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    clickhouse_client: FakeClickhouseClient,
+) -> None:
+    config_path = tmp_path / "config.toml"
+    config_path.write_text(
+        """
+concurrency = 2
+
+[[github_repos]]
+owner = "dense-analysis"
+name = "ale"
+
+[[github_repos]]
+owner = "dense-analysis"
+name = "broken"
+
+[[github_repos]]
+owner = "dense-analysis"
+name = "pie"
+""".strip(),
+        encoding="utf-8",
+    )
+    loaded_repos: list[str] = []
+
+    def load_github_project_issues(
+        processor: ProjectProcessor,
+        access_token: str,
+        owner: str,
+        repo: str,
+        *,
+        full: bool = False,
+    ) -> None:
+        if repo == "broken":
+            raise RuntimeError("Bad credentials")
+
+        loaded_repos.append(repo)
+
+    monkeypatch.setattr(
+        "pie.__main__.load_github_project_issues",
+        load_github_project_issues,
+    )
+    config = load_configuration(str(config_path))
+
+    failed_repos = load_github_repos(config, None)
+
+    assert config.concurrency == 2
+    assert [repo.name for repo in failed_repos] == ["broken"]
+    assert sorted(loaded_repos) == ["ale", "pie"]
@@ -0,0 +1,77 @@
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from pie.metrics import MetricsRegistry, StageSummary
+
+
+def test_metrics_registry_renders_prometheus_text() -> None:
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.increment("pie_github_requests_total", api="rest", status="200")
+    registry.increment("pie_github_requests_total", api="rest", status="200")
+    registry.set_gauge("pie_github_rate_limit_remaining", 4999, api="rest")
+    registry.observe("pie_stage_seconds", 0.5, stage="encode_text")
+    registry.observe("pie_stage_seconds", 2.0, stage="encode_text")
+
+    assert registry.render().splitlines() == [
+        "# HELP pie_github_requests_total Requests sent to GitHub, by status.",
+        "# TYPE pie_github_requests_total counter",
+        'pie_github_requests_total{api="rest",status="200"} 2',
+        "# HELP pie_github_rate_limit_remaining Requests left in the rate "
+        "limit.",
+        "# TYPE pie_github_rate_limit_remaining gauge",
+        'pie_github_rate_limit_remaining{api="rest"} 4999',
+        "# HELP pie_stage_seconds Time spent in each stage of loading issues.",
+        "# TYPE pie_stage_seconds histogram",
+        'pie_stage_seconds_bucket{stage="encode_text",le="0.1"} 0',
+        'pie_stage_seconds_bucket{stage="encode_text",le="1.0"} 1',
+        'pie_stage_seconds_bucket{stage="encode_text",le="+Inf"} 2',
+        'pie_stage_seconds_sum{stage="encode_text"} 2.5',
+        'pie_stage_seconds_count{stage="encode_text"} 2',
+    ]
+
+
+def test_measure_stage_sums_time_and_items() -> None:
+    registry = MetricsRegistry()
+
+    with registry.measure_stage("insert_issues", 100):
+        pass
+
+    with (
+        pytest.raises(RuntimeError),
+        registry.measure_stage("insert_issues", 50),
+    ):
+        raise RuntimeError
+
+    [summary] = registry.stage_summaries()
+
+    assert summary._replace(seconds=0.0) == StageSummary(
+        stage="insert_issues",
+        run_count=2,
+        seconds=0.0,
+        item_count=150,
+    )
+    assert summary.items_per_second > 0
+
+
+@pytest.mark.allow_network
+def test_metrics_are_exported_to_files_and_http(tmp_path: Path) -> None:
+    registry = MetricsRegistry()
+    registry.increment("pie_stage_items_total", 3, stage="encode_text")
+    textfile_path = tmp_path / "textfile" / "pie.prom"
+    registry.write_textfile(textfile_path)
+    server = registry.start_http_server(0, "127.0.0.1")
+
+    try:
+        with urllib.request.urlopen(
+            f"http://127.0.0.1:{server.server_address[1]}/metrics",
+        ) as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert body == textfile_path.read_text() == registry.render()
+    assert 'pie_stage_items_total{stage="encode_text"} 3' in body
+    assert list(textfile_path.parent.iterdir()) == [textfile_path]
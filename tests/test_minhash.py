@@ -0,0 +1,41 @@
+from pie.minhash import (
+    LSH_BAND_COUNT,
+    MINHASH_SIZE,
+    issue_lsh_buckets,
+    minhash_signature,
+    shingles,
+)
+
+
+def test_shingles_pair_consecutive_tokens() -> None:
+    assert shingles("Linting fails, again") == {
+        "linting fails",
+        "fails again",
+    }
+    assert shingles("Crash") == {"crash"}
+    assert shingles("") == set()
+
+
+def test_minhash_signature_estimates_jaccard_similarity() -> None:
+    first = {f"token {number}" for number in range(100)}
+    second = {f"token {number}" for number in range(50, 150)}
+    first_signature = minhash_signature(first)
+    second_signature = minhash_signature(second)
+
+    assert first_signature is not None
+    assert second_signature is not None
+    assert first_signature.shape == (MINHASH_SIZE,)
+    # The real Jaccard similarity is 50 / 150.
+    assert 0.2 < (first_signature == second_signature).mean() < 0.5
+    assert minhash_signature(set()) is None
+
+
+def test_issue_lsh_buckets_match_for_duplicates() -> None:
+    buckets = issue_lsh_buckets("Linting fails", "It crashes on save.")
+
+    assert len(buckets) == LSH_BAND_COUNT
+    assert buckets == issue_lsh_buckets("Linting fails", "It crashes on save.")
+    assert not set(buckets) & set(
+        issue_lsh_buckets("Add a fixer", "Support formatting Go files."),
+    )
+    assert issue_lsh_buckets("", "") == []
@@ -0,0 +1,166 @@
+import datetime
+from pathlib import Path
+from typing import cast
+
+import pytest
+from github import Github
+from test_github import FakeGithub, FakeIssue, FakeRepo
+
+from pie.github import fetch_github_issues
+from pie.issue import (
+    Issue,
+    IssueEvent,
+    IssueEventType,
+    Project,
+    SourceSystemType,
+    SyncCheckpoint,
+)
+from pie.project_processor import ProjectProcessor
+
+pytest.importorskip("pyarrow")
+
+from pie.parquet_storage import ParquetStorage
+
+PROJECT = Project(
+    source_system=SourceSystemType.GITHUB,
+    owner="dense-analysis",
+    name="pie",
+)
+CREATED_AT = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+
+
+def make_event(issue_id: int, event_type: IssueEventType) -> IssueEvent:
+    return IssueEvent(
+        project=PROJECT,
+        id=issue_id,
+        related_object_id=0,
+        parent_id=0,
+        type=event_type,
+        assignee_username="",
+        timestamp=CREATED_AT + datetime.timedelta(days=int(event_type)),
+    )
+
+
+def test_parquet_storage_stores_and_finds_open_issues(tmp_path: Path) -> None:
+    titles = ["Linting fails", "Linting fails", "Linting fails", "Docs"]
+
+    with ProjectProcessor(
+        "",
+        0,
+        "",
+        "",
+        "",
+        storage=ParquetStorage(tmp_path, batch_size=3),
+    ) as processor:
+        for issue_id, title in enumerate(titles, 1):
+            processor.store_issue(
+                Issue(
+                    project=PROJECT,
+                    id=issue_id,
+                    parent_id=0,
+                    assignee_username="",
+                    title=title,
+                    description="It breaks every time.",
+                    labels=[],
+                    created_at=CREATED_AT,
+                ),
+            )
+            processor.store_issue_event(
+                make_event(issue_id, IssueEventType.CREATED),
+            )
+
+        processor.store_issue_event(make_event(3, IssueEventType.CLOSED))
+        processor.set_sync_watermark(PROJECT, CREATED_AT)
+
+    storage = ParquetStorage(tmp_path)
+    keys = storage.load_project_keys(PROJECT)
+    matches = list(storage.find_similar_issues(0.1, 0.1))
+
+    assert (4,) in keys.issues
+    assert (3, 0, int(IssueEventType.CLOSED)) in keys.issue_events
+    assert (5,) not in keys.issues
+    assert (3,) in keys.closed_issues
+    assert (2,) not in keys.closed_issues
+    assert storage.get_sync_watermark(PROJECT) == CREATED_AT
+    assert [(match.issue1_id, match.issue2_id) for match in matches] == [
+        (1, 2),
+        (2, 1),
+    ]
+    assert not list(storage.find_similar_issues(0.1, 0.1, project=("a", "b")))
+
+
+def test_parquet_storage_saves_and_removes_sync_checkpoints(
+    tmp_path: Path,
+) -> None:
+    storage = ParquetStorage(tmp_path)
+    checkpoint = SyncCheckpoint(
+        since=None,
+        page=3,
+        loaded_issue_ids=(301, 302),
+        updated_at=CREATED_AT,
+    )
+    storage.set_sync_checkpoint(PROJECT, checkpoint)
+    storage.set_sync_watermark(PROJECT, CREATED_AT)
+
+    assert ParquetStorage(tmp_path).get_sync_checkpoint(PROJECT) == checkpoint
+
+    storage.set_sync_checkpoint(PROJECT, None)
+
+    assert storage.get_sync_checkpoint(PROJECT) is None
+    assert storage.get_sync_watermark(PROJECT) == CREATED_AT
+
+
+def test_processor_saves_checkpoints_once_their_rows_are_written(
+    tmp_path: Path,
+) -> None:
+    storage = ParquetStorage(tmp_path, batch_size=3)
+    first = SyncCheckpoint(None, 1, (), CREATED_AT)
+    second = SyncCheckpoint(None, 2, (), CREATED_AT)
+
+    with ProjectProcessor("", 0, "", "", "", storage=storage) as processor:
+        processor.store_issue_event(make_event(1, IssueEventType.CREATED))
+        processor.store_issue_event(make_event(2, IssueEventType.CREATED))
+        processor.set_sync_checkpoint(PROJECT, first)
+
+        # Rows are not flushed early to save a checkpoint.
+        assert storage.pending_row_count == 2
+        assert storage.get_sync_checkpoint(PROJECT) is None
+
+        processor.store_issue_event(make_event(3, IssueEventType.CREATED))
+        processor.store_issue_event(make_event(4, IssueEventType.CREATED))
+        processor.set_sync_checkpoint(PROJECT, second)
+
+        # The batch with the first page's rows has been written.
+        assert storage.get_sync_checkpoint(PROJECT) == first
+
+    assert storage.get_sync_checkpoint(PROJECT) == second
+
+
+def test_sync_keeps_closes_stored_before_closes_had_times(
+    tmp_path: Path,
+) -> None:
+    closed_at = CREATED_AT + datetime.timedelta(days=2)
+
+    # Closes were stored with the key 0 before they were keyed by time.
+    with ParquetStorage(tmp_path) as storage:
+        storage.add_issue_event(make_event(1, IssueEventType.CREATED))
+        storage.add_issue_event(make_event(1, IssueEventType.CLOSED))
+
+    issue = FakeIssue(1, closed_at, [])
+    issue.closed_at = closed_at
+    repo = FakeRepo([issue])
+
+    with ProjectProcessor(
+        "",
+        0,
+        "",
+        "",
+        "",
+        storage=ParquetStorage(tmp_path),
+    ) as processor:
+        fetch_github_issues(processor, cast(Github, FakeGithub(repo)), PROJECT)
+
+    keys = ParquetStorage(tmp_path).load_project_keys(PROJECT)
+
+    assert len(keys.issue_events) == 2
+    assert (1,) in keys.closed_issues
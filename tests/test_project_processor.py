@@ -1,23 +1,174 @@
-from pie.project_processor import (
-    EMPTY_VECTOR,
-    VECTOR_SIZE,
+import datetime
+
+import numpy as np
+
+from pie.encoder import (
+    ENCODER_VERSION,
+    compact_vectors,
     encode_document,
     encode_text,
 )
+from pie.issue import Issue, IssueComment, Project, SourceSystemType
+from pie.minhash import issue_lsh_buckets
+from pie.project_processor import ProjectProcessor
+from pie.testing import FakeClickhouseClient
+
+PROJECT = Project(
+    source_system=SourceSystemType.GITHUB,
+    owner="dense-analysis",
+    name="pie",
+)
+CREATED_AT = datetime.datetime(2024, 1, 1)
 
 
-def test_encode_text_is_deterministic() -> None:
-    assert encode_text("same text") == encode_text("same text")
+def make_processor(
+    encoding_workers: int = 0,
+    *,
+    compact_vectors: bool = False,
+    minhash: bool = False,
+) -> ProjectProcessor:
+    return ProjectProcessor(
+        clickhouse_host="localhost",
+        clickhouse_port=8123,
+        clickhouse_username="default",
+        clickhouse_password="",
+        clickhouse_database="default",
+        encode_batch_size=2,
+        encoding_workers=encoding_workers,
+        compact_vectors=compact_vectors,
+        minhash=minhash,
+    )
+
 
+def test_processor_encodes_and_writes_issues_on_close(
+    clickhouse_client: FakeClickhouseClient,
+) -> None:
+    issue = Issue(
+        project=PROJECT,
+        id=1,
+        parent_id=0,
+        assignee_username="",
+        title="Linting fails",
+        description="It breaks. Every time.",
+        labels=["bug"],
+        created_at=CREATED_AT,
+    )
 
-def test_encode_document_returns_empty_vector_for_blank_text() -> None:
-    assert encode_document("   ") == EMPTY_VECTOR
+    with make_processor() as processor:
+        processor.store_issue(issue)
+        processor.store_issue(issue)
+        assert clickhouse_client.inserts == []
 
+    rows = clickhouse_client.inserted_rows("issues")
 
-def test_encode_document_returns_expected_vector_size() -> None:
-    assert (
-        len(
-            encode_document("One sentence. Another sentence."),
+    assert len(rows) == 1
+    assert rows[0]["title_vector"] == encode_text(issue.title)
+    assert rows[0]["encoder_version"] == ENCODER_VERSION
+    assert rows[0]["description_vector"] == encode_document(
+        issue.description,
+    )
+    assert clickhouse_client.closed
+
+
+def test_processor_writes_compact_vectors(
+    clickhouse_client: FakeClickhouseClient,
+) -> None:
+    with make_processor(compact_vectors=True) as processor:
+        processor.store_issue_comment(
+            IssueComment(
+                project=PROJECT,
+                issue_id=1,
+                id=1,
+                username="w0rp",
+                body="Same here",
+                created_at=CREATED_AT,
+            ),
         )
-        == VECTOR_SIZE
+
+    row = clickhouse_client.inserted_rows("issue_comments")[0]
+
+    assert (
+        row["body_signature"]
+        == compact_vectors(
+            np.array([row["body_vector"]], dtype=np.float32),
+        )[0].signature
     )
+    assert len(row["body_vector_int8"]) == len(row["body_vector"])
+
+
+def test_processor_writes_lsh_buckets(
+    clickhouse_client: FakeClickhouseClient,
+) -> None:
+    with make_processor(minhash=True) as processor:
+        processor.store_issue(
+            Issue(
+                project=PROJECT,
+                id=1,
+                parent_id=0,
+                assignee_username="",
+                title="Linting fails",
+                description="",
+                labels=[],
+                created_at=CREATED_AT,
+            ),
+        )
+
+    row = clickhouse_client.inserted_rows("issues")[0]
+
+    assert row["lsh_buckets"] == issue_lsh_buckets("Linting fails", "")
+
+
+def test_processor_keeps_comment_order(
+    clickhouse_client: FakeClickhouseClient,
+) -> None:
+    with make_processor() as processor:
+        for comment_id, body in enumerate(["+1", "Same here", "Fixed"]):
+            processor.store_issue_comment(
+                IssueComment(
+                    project=PROJECT,
+                    issue_id=1,
+                    id=comment_id,
+                    username="w0rp",
+                    body=body,
+                    created_at=CREATED_AT,
+                ),
+            )
+
+    rows = clickhouse_client.inserted_rows("issue_comments")
+
+    assert [row["body"] for row in rows] == ["+1", "Same here", "Fixed"]
+    assert [row["body_vector"] for row in rows] == [
+        encode_document(row["body"]) for row in rows
+    ]
+
+
+def test_processor_encodes_in_worker_processes_in_order(
+    clickhouse_client: FakeClickhouseClient,
+) -> None:
+    issues = [
+        Issue(
+            project=PROJECT,
+            id=issue_id,
+            parent_id=0,
+            assignee_username="",
+            title=f"Issue {issue_id}",
+            description=f"Description number {issue_id}. More text.",
+            labels=[],
+            created_at=CREATED_AT,
+        )
+        for issue_id in range(1, 8)
+    ]
+
+    with make_processor(encoding_workers=2) as processor:
+        for issue in issues:
+            processor.store_issue(issue)
+
+    rows = clickhouse_client.inserted_rows("issues")
+
+    assert [row["id"] for row in rows] == list(range(1, 8))
+    assert [row["title_vector"] for row in rows] == [
+        encode_text(issue.title) for issue in issues
+    ]
+    assert [row["description_vector"] for row in rows] == [
+        encode_document(issue.description) for issue in issues
+    ]
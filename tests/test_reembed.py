@@ -0,0 +1,134 @@
+from collections.abc import Sequence
+from typing import Any, NamedTuple, cast
+
+import pytest
+from clickhouse_connect.driver.client import Client
+
+from pie.clickhouse import BatchWriter
+from pie.encoder import ENCODER_VERSION, encode_document
+from pie.reembed import REEMBED_TABLES, reembed_table
+from pie.testing import FakeClickhouseClient, FakeStream
+
+COMMENT_COLUMNS = [
+    "source_system",
+    "project_owner",
+    "project_name",
+    "issue_id",
+    "id",
+    "username",
+    "body",
+    "body_vector",
+    "body_vector_int8",
+    "body_signature",
+    "body_indices",
+    "body_values",
+    "created_at",
+    "encoder_version",
+]
+
+
+class FakeColumnNames(NamedTuple):
+    column_names: list[str]
+
+
+class FakeReembedClient:
+    """
+    A client which streams stale comments once, as if they were copied.
+    """
+
+    def __init__(
+        self,
+        blocks: list[list[tuple[Any, ...]]],
+        missing_count: int = 0,
+    ) -> None:
+        self.blocks = blocks
+        self.missing_count = missing_count
+        self.commands: list[str] = []
+        self.streamed_queries: list[str] = []
+
+    def command(self, command: str, parameters: Sequence[Any] = ()) -> int:
+        self.commands.append(" ".join(command.split()))
+
+        return self.missing_count if "count()" in command else 0
+
+    def query(self, query: str) -> FakeColumnNames:
+        return FakeColumnNames(COMMENT_COLUMNS)
+
+    def query_row_block_stream(
+        self,
+        query: str,
+        settings: dict[str, Any],
+    ) -> FakeStream:
+        assert settings == {"max_block_size": 2}
+        self.streamed_queries.append(query)
+        blocks = self.blocks
+        self.blocks = []
+
+        return FakeStream(blocks)
+
+
+def test_reembed_table_copies_new_vectors_and_swaps_tables() -> None:
+    def row(comment_id: int, body: str) -> tuple[Any, ...]:
+        return (0, "dense-analysis", "pie", 1, comment_id, "w0rp", body, 0)
+
+    client = FakeReembedClient(
+        [[row(1, "+1"), row(2, "Same here")], [row(3, "Fixed")]],
+    )
+    writer_client = FakeClickhouseClient()
+
+    with BatchWriter(cast(Client, writer_client)) as writer:
+        row_count = reembed_table(
+            cast(Client, client),
+            writer,
+            REEMBED_TABLES[1],
+            batch_size=2,
+            sparse=True,
+        )
+
+    rows = writer_client.inserted_rows("issue_comments_reembed")
+
+    assert row_count == 3
+    assert [row["body_vector"] for row in rows] == [
+        encode_document(body) for body in ["+1", "Same here", "Fixed"]
+    ]
+    assert {row["encoder_version"] for row in rows} == {ENCODER_VERSION}
+    assert rows[0]["body_indices"] == [
+        index for index, value in enumerate(rows[0]["body_vector"]) if value
+    ]
+    assert "body_vector," not in client.streamed_queries[0]
+    assert client.commands[0] == "EXISTS TABLE issue_comments_reembed_old"
+    assert client.commands[1] == (
+        "CREATE TABLE IF NOT EXISTS issue_comments_reembed AS issue_comments"
+    )
+    # Inserts fail while the table is renamed, and rows inserted before
+    # that are copied from it.
+    assert client.commands[-5] == (
+        "RENAME TABLE issue_comments TO issue_comments_reembed_old"
+    )
+    assert "FROM issue_comments_reembed_old" in client.streamed_queries[-1]
+    assert client.commands[-3].startswith(
+        "SELECT count() FROM issue_comments_reembed_old",
+    )
+    assert client.commands[-2:] == [
+        "RENAME TABLE issue_comments_reembed TO issue_comments",
+        "DROP TABLE issue_comments_reembed_old",
+    ]
+
+
+def test_reembed_table_keeps_the_old_table_when_rows_are_missing() -> None:
+    client = FakeReembedClient([], missing_count=2)
+
+    with (
+        BatchWriter(cast(Client, FakeClickhouseClient())) as writer,
+        pytest.raises(RuntimeError, match="2 rows in issue_comments"),
+    ):
+        reembed_table(
+            cast(Client, client),
+            writer,
+            REEMBED_TABLES[1],
+            batch_size=2,
+        )
+
+    assert client.commands[-1] == (
+        "RENAME TABLE issue_comments_reembed_old TO issue_comments"
+    )
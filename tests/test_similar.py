@@ -1,8 +1,28 @@
+import io
+import json
 import sys
 
+import pytest
 from pytest import MonkeyPatch
 
-from pie.similar import Arguments, parse_arguments
+from pie.clickhouse import SimilarIssueMatch
+from pie.similar import (
+    Arguments,
+    parquet_argument_error,
+    parse_arguments,
+    write_matches,
+)
+
+MATCH = SimilarIssueMatch(
+    1,
+    2,
+    "Crash",
+    "Crashes",
+    0.1,
+    0.15,
+    "dense-analysis",
+    "pie",
+)
 
 
 def test_parse_arguments_uses_defaults(monkeypatch: MonkeyPatch) -> None:
@@ -12,4 +32,113 @@ def test_parse_arguments_uses_defaults(monkeypatch: MonkeyPatch) -> None:
         config_path="config.toml",
         max_title_distance=0.2,
         max_description_distance=0.2,
+        mode=None,
+        neighbour_count=10,
+        limit=None,
+        top_k_per_issue=None,
+        project=None,
+        output_format="text",
+        max_signature_distance=None,
+        sparse=False,
+    )
+
+
+def test_parse_arguments_reads_output_options(
+    monkeypatch: MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "pie.similar",
+            "--limit",
+            "5",
+            "--top-k-per-issue",
+            "2",
+            "--project",
+            "dense-analysis/pie",
+            "--format",
+            "jsonl",
+        ],
     )
+
+    args = parse_arguments()
+
+    assert args.limit == 5
+    assert args.top_k_per_issue == 2
+    assert args.project == ("dense-analysis", "pie")
+    assert args.output_format == "jsonl"
+
+
+@pytest.mark.parametrize(
+    ("arguments", "error"),
+    [
+        (
+            ["--mode", "matrix", "--signature-distance", "8"],
+            "--signature-distance only applies to --mode exact",
+        ),
+        (
+            ["--signature-distance", "8", "--sparse"],
+            "--signature-distance can't be used with --sparse",
+        ),
+        (
+            ["--mode", "indexed", "--sparse"],
+            "--sparse only applies to --mode exact or matrix",
+        ),
+    ],
+)
+def test_parse_arguments_rejects_ignored_options(
+    monkeypatch: MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+    arguments: list[str],
+    error: str,
+) -> None:
+    monkeypatch.setattr(sys, "argv", ["pie.similar", *arguments])
+
+    with pytest.raises(SystemExit):
+        parse_arguments()
+
+    assert error in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    ("arguments", "error"),
+    [
+        ([], None),
+        (["--mode", "matrix"], None),
+        (["--mode", "exact"], "--mode exact needs ClickHouse storage"),
+        (["--mode", "lsh"], "--mode lsh needs ClickHouse storage"),
+        (
+            ["--signature-distance", "8"],
+            "--signature-distance needs ClickHouse storage",
+        ),
+        (["--sparse"], "--sparse needs ClickHouse storage"),
+    ],
+)
+def test_parquet_argument_error_rejects_clickhouse_options(
+    monkeypatch: MonkeyPatch,
+    arguments: list[str],
+    error: str | None,
+) -> None:
+    monkeypatch.setattr(sys, "argv", ["pie.similar", *arguments])
+
+    assert parquet_argument_error(parse_arguments()) == error
+
+
+def test_write_matches_writes_jsonl() -> None:
+    output = io.StringIO()
+
+    write_matches(iter([MATCH]), "jsonl", output)
+
+    assert json.loads(output.getvalue()) == MATCH._asdict()
+
+
+def test_write_matches_writes_csv() -> None:
+    output = io.StringIO()
+
+    write_matches(iter([MATCH]), "csv", output)
+
+    assert output.getvalue().splitlines() == [
+        ",".join(SimilarIssueMatch._fields),
+        "1,2,Crash,Crashes,0.1,0.15,dense-analysis,pie",
+    ]
@@ -0,0 +1,146 @@
+from collections.abc import Sequence
+from typing import Any, cast
+
+import numpy as np
+from clickhouse_connect.driver.client import Client
+
+from pie.clickhouse import SimilarIssueMatch
+from pie.encoder import VECTOR_SIZE
+from pie.similarity_matrix import (
+    IssueVectors,
+    find_similar_vectors,
+    iter_open_issue_vectors,
+)
+from pie.testing import FakeStream
+
+
+def make_issue_vectors(issue_count: int, seed: int = 0) -> IssueVectors:
+    rng = np.random.default_rng(seed)
+    vectors: list[Any] = []
+
+    for _ in range(2):
+        # Few dimensions, so plenty of pairs are close together.
+        matrix = rng.normal(size=(issue_count, 4)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        vectors.append(matrix)
+
+    # An issue without a description never matches anything.
+    vectors[1][0] = 0
+
+    return IssueVectors(
+        project_key=("GITHUB", "dense-analysis", "pie"),
+        ids=np.arange(1, issue_count + 1, dtype=np.uint64),
+        titles=[f"Issue {number}" for number in range(1, issue_count + 1)],
+        title_vectors=vectors[0],
+        description_vectors=vectors[1],
+    )
+
+
+def test_find_similar_vectors_matches_pairwise_comparison() -> None:
+    issue_vectors = make_issue_vectors(50)
+    title_vectors = issue_vectors.title_vectors
+    description_vectors = issue_vectors.description_vectors
+    expected: list[tuple[int, int]] = []
+
+    for i in range(50):
+        candidates = [
+            (float(1 - title_vectors[i] @ title_vectors[j]), j)
+            for j in range(50)
+            if i != j
+            and i != 0
+            and j != 0
+            and 1 - title_vectors[i] @ title_vectors[j] <= 0.3
+            and 1 - description_vectors[i] @ description_vectors[j] <= 0.5
+        ]
+        expected.extend((i + 1, j + 1) for _, j in sorted(candidates)[:3])
+
+    matches = list(
+        find_similar_vectors(
+            issue_vectors,
+            max_title_distance=0.3,
+            max_description_distance=0.5,
+            top_k=3,
+            # Blocks which do not divide the issue count evenly.
+            block_size=7,
+        ),
+    )
+
+    assert expected
+    assert [(match.issue1_id, match.issue2_id) for match in matches] == (
+        expected
+    )
+
+
+def test_iter_open_issue_vectors_splits_projects() -> None:
+    def row(name: str, issue_id: int, vector: list[float]) -> tuple[Any, ...]:
+        return ("GITHUB", "dense-analysis", name, issue_id, "", vector, vector)
+
+    class FakeClient:
+        def query_row_block_stream(
+            self,
+            query: str,
+            parameters: Sequence[Any],
+        ) -> FakeStream:
+            return FakeStream(
+                [
+                    [row("ale", 1, [1.0, 0.0]), row("ale", 2, [0.0, 1.0])],
+                    [row("pie", 3, [1.0, 0.0])],
+                ],
+            )
+
+    projects = list(iter_open_issue_vectors(cast(Client, FakeClient())))
+
+    assert [project.project_key[2] for project in projects] == ["ale", "pie"]
+    assert projects[0].ids.tolist() == [1, 2]
+    assert projects[0].title_vectors.tolist() == [[1.0, 0.0], [0.0, 1.0]]
+    assert projects[1].description_vectors.dtype == np.float32
+
+
+def test_find_similar_vectors_yields_match_tuples() -> None:
+    vectors = np.array([[1, 0], [1, 0], [0, 1]], dtype=np.float32)
+    issue_vectors = IssueVectors(
+        project_key=("GITHUB", "dense-analysis", "pie"),
+        ids=np.array([1, 2, 3], dtype=np.uint64),
+        titles=["A", "B", "C"],
+        title_vectors=vectors,
+        description_vectors=vectors,
+    )
+
+    assert list(find_similar_vectors(issue_vectors, 0.1, 0.1)) == [
+        SimilarIssueMatch(1, 2, "A", "B", 0.0, 0.0, "dense-analysis", "pie"),
+        SimilarIssueMatch(2, 1, "B", "A", 0.0, 0.0, "dense-analysis", "pie"),
+    ]
+
+
+def test_iter_open_issue_vectors_expands_sparse_vectors() -> None:
+    class FakeClient:
+        def query_row_block_stream(
+            self,
+            query: str,
+            parameters: Sequence[Any],
+        ) -> FakeStream:
+            assert "title_indices" in query
+            return FakeStream(
+                [
+                    [
+                        (
+                            "GITHUB",
+                            "dense-analysis",
+                            "pie",
+                            1,
+                            "",
+                            ([3], [1.0]),
+                            ([], []),
+                        ),
+                    ],
+                ],
+            )
+
+    (issue_vectors,) = iter_open_issue_vectors(
+        cast(Client, FakeClient()),
+        sparse=True,
+    )
+
+    assert issue_vectors.title_vectors.shape == (1, VECTOR_SIZE)
+    assert issue_vectors.title_vectors[0].nonzero()[0].tolist() == [3]
+    assert not issue_vectors.description_vectors.any()